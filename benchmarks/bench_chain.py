@@ -0,0 +1,62 @@
+"""Benchmark Chain runs over a stream of tokens
+
+Runs a chain of links incrementing the tokens with
+    - FuncActor links (composed into a single call)
+    - other links (run by a LinearizedScheduler built once)
+    - the same in the batch mode
+under LinearizedScheduler.
+
+Run as
+    python benchmarks/bench_chain.py [number of tokens] [links] [batch size]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import time
+
+from wowp.actors import FuncActor
+from wowp.actors.special import Chain
+from wowp.components import Actor
+from wowp.schedulers import LinearizedScheduler
+from wowp.util import ConstructorWrapper
+
+
+def increment(x):
+    return x + 1
+
+
+class Increment(Actor):
+    def __init__(self):
+        super(Increment, self).__init__()
+        self.inports.append('x')
+        self.outports.append('y')
+
+    @staticmethod
+    def run(x):
+        return {'y': x + 1}
+
+
+def measure(label, tokens, chain):
+    scheduler = LinearizedScheduler()
+    t = time.time()
+    for i in range(tokens):
+        scheduler.put_value(chain.inports['inp'], i)
+    scheduler.execute()
+    t = time.time() - t
+    assert list(chain.outports['out'].pop_all())[-1] == tokens - 1 + len(chain.actor_generators)
+    print('{:40s} {:8.3f} s {:10.0f} tokens/s'.format(label, t, tokens / t))
+
+
+def main(tokens=10000, links=10, batch_size=100):
+    print('{} tokens, {} links'.format(tokens, links))
+    func_links = [ConstructorWrapper(FuncActor, increment)] * links
+    actor_links = [Increment] * links
+    measure('FuncActor links', tokens, Chain('chain', func_links))
+    measure('FuncActor links, batch_size={}'.format(batch_size), tokens,
+            Chain('chain', func_links, batch_size=batch_size, batch_latency=None))
+    measure('Actor links', tokens, Chain('chain', actor_links))
+    measure('Actor links, batch_size={}'.format(batch_size), tokens,
+            Chain('chain', actor_links, batch_size=batch_size, batch_latency=None))
+
+
+if __name__ == '__main__':
+    import sys
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,47 @@
+"""Benchmark client selection policies on two local dask clusters of different sizes
+
+Run as
+    python benchmarks/bench_clients.py [number of jobs]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import concurrent.futures
+import logging
+import sys
+import time
+
+from distributed import LocalCluster
+from wowp.schedulers import DistributedExecutor
+
+
+def work(x):
+    time.sleep(0.05)
+    return x
+
+
+def bench(policy, addresses, jobs):
+    executor = DistributedExecutor(uris=addresses, policy=policy)
+    t0 = time.time()
+    futures = [executor.submit(work, i) for i in range(jobs)]
+    concurrent.futures.wait(futures)
+    elapsed = time.time() - t0
+    print('{}: {:.3f} s'.format(policy, elapsed))
+    for cli in executor._clients:
+        cli.close()
+
+
+def main(jobs=80):
+    logging.getLogger('distributed').setLevel(logging.ERROR)
+    # small cluster with 1 engine, large cluster with 4 engines
+    clusters = [LocalCluster(n_workers=n, threads_per_worker=1, processes=False,
+                             dashboard_address=None, silence_logs=logging.ERROR) for n in (1, 4)]
+    addresses = [cluster.scheduler_address for cluster in clusters]
+    try:
+        for policy in ('round_robin', 'least_loaded', 'affinity'):
+            bench(policy, addresses, jobs)
+    finally:
+        for cluster in clusters:
+            cluster.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,42 @@
+"""Benchmark workflow graph construction on long actor chains
+
+Run as
+    python benchmarks/bench_graph.py [number of actors]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import sys
+import time
+
+from wowp import Actor
+
+
+def make_chain(length):
+    actors = [Actor(name='actor_{}'.format(i)) for i in range(length)]
+    for actor in actors:
+        actor.inports.append('inp')
+        actor.outports.append('out')
+    for prev, actor in zip(actors[:-1], actors[1:]):
+        actor.inports['inp'] += prev.outports['out']
+    return actors
+
+
+def main(length=100000):
+    t0 = time.time()
+    actors = make_chain(length)
+    print('construct {} actors: {:.3f} s'.format(length, time.time() - t0))
+
+    t0 = time.time()
+    actors[0].get_workflow()
+    print('get_workflow: {:.3f} s'.format(time.time() - t0))
+
+    t0 = time.time()
+    actors[0].graph
+    print('graph (build): {:.3f} s'.format(time.time() - t0))
+
+    t0 = time.time()
+    actors[0].graph
+    print('graph (cached): {:.6f} s'.format(time.time() - t0))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,44 @@
+"""Benchmark the import time of wowp
+
+Run as
+    python benchmarks/bench_import.py [module] [number of runs]
+
+Uses python -X importtime, optional backends (distributed, ipyparallel, mpi4py)
+and networkx should not be imported.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import subprocess
+import sys
+
+BACKENDS = ('distributed', 'ipyparallel', 'mpi4py', 'networkx')
+
+
+def import_time(module):
+    """Cumulative import time in seconds and imported backends
+    """
+    code = 'import sys, {0}; print(" ".join(m for m in {1} if m in sys.modules))'.format(
+        module, BACKENDS)
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               env=dict(os.environ, PYTHONWARNINGS='ignore'))
+    out, err = process.communicate()
+    for line in err.decode().splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) * 1e-6, out.decode().split()
+    raise RuntimeError('import time of {} not found\n{}'.format(module, err.decode()))
+
+
+def main(module='wowp', runs=5):
+    times = []
+    for _ in range(int(runs)):
+        seconds, backends = import_time(module)
+        times.append(seconds)
+    times.sort()
+    print('import {}: {:.3f} s (median of {})'.format(module, times[len(times) // 2], runs))
+    print('imported backends: {}'.format(', '.join(backends) or 'none'))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,98 @@
+"""Benchmark reading a text file through actors
+
+Reads a file of short lines and sums the line lengths downstream with
+    - plain Python iteration (for line in file), no actors
+    - LineReader (one token per line)
+    - ChunkedLineReader (one token per batch of lines), mmap and buffered reads
+    - FileSharder + ChunkedLineReader actors per shard
+under LinearizedScheduler.
+
+Run as
+    python benchmarks/bench_line_reader.py [number of lines] [batch size] [shards]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import tempfile
+import time
+
+from wowp.actors import FuncActor
+from wowp.actors.special import LineReader, ChunkedLineReader, FileSharder, Splitter
+from wowp.schedulers import LinearizedScheduler
+
+
+def line_length(line):
+    return len(line)
+
+
+def batch_length(lines):
+    return sum(len(line) for line in lines)
+
+
+def plain(path):
+    with open(path, 'rt') as f:
+        return sum(len(line.strip()) for line in f)
+
+
+def run_actors(path, source, consumer):
+    sink = FuncActor(consumer, inports='x')
+    list(source.outports)[0].connect(sink.inports['x'])
+    scheduler = LinearizedScheduler()
+    scheduler.put_value(source.inports['path'], path)
+    scheduler.execute()
+    return sum(sink.outports['out'].pop_all())
+
+
+def sharded(path, batch_size, shards):
+    sharder = FileSharder(shards=shards)
+    splitter = Splitter(multiplicity=shards, inport_name='shard')
+    sharder.outports['shard'].connect(splitter.inports['shard'])
+    sinks = []
+    for port in splitter.outports:
+        reader = ChunkedLineReader(batch_size=batch_size)
+        sink = FuncActor(batch_length, inports='x')
+        port.connect(reader.inports['path'])
+        reader.outports['lines'].connect(sink.inports['x'])
+        sinks.append(sink)
+    scheduler = LinearizedScheduler()
+    scheduler.put_value(sharder.inports['path'], path)
+    scheduler.execute()
+    return sum(sum(sink.outports['out'].pop_all()) for sink in sinks)
+
+
+def measure(label, lines, func):
+    t = time.time()
+    total = func()
+    t = time.time() - t
+    print('{:40s} {:8.3f} s {:10.0f} lines/s'.format(label, t, lines / t))
+    return total
+
+
+def main(lines=10 ** 6, batch_size=10000, shards=4):
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    try:
+        with os.fdopen(fd, 'wt') as f:
+            for i in range(lines):
+                f.write('line {}\n'.format(i))
+        print('{} lines, {} bytes'.format(lines, os.path.getsize(path)))
+        totals = [
+            measure('for line in file', lines, lambda: plain(path)),
+            measure('LineReader', lines,
+                    lambda: run_actors(path, LineReader(), line_length)),
+            measure('ChunkedLineReader, mmap', lines,
+                    lambda: run_actors(path, ChunkedLineReader(batch_size=batch_size),
+                                       batch_length)),
+            measure('ChunkedLineReader, buffered', lines,
+                    lambda: run_actors(path, ChunkedLineReader(batch_size=batch_size,
+                                                               use_mmap=False),
+                                       batch_length)),
+            measure('FileSharder, {} shards'.format(shards), lines,
+                    lambda: sharded(path, batch_size, shards)),
+        ]
+        assert len(set(totals)) == 1, totals
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    import sys
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,54 @@
+"""Benchmark LoopWhile with a FuncActor body
+
+Runs a loop incrementing the value until it reaches the number of iterations
+    - iteration by iteration (inline=False)
+    - at once (inline=None, the default)
+under LinearizedScheduler, ThreadedScheduler and FuturesScheduler.
+
+Run as
+    python benchmarks/bench_loop.py [number of iterations]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import time
+
+from wowp.actors import FuncActor, LoopWhile
+from wowp.schedulers import LinearizedScheduler, ThreadedScheduler, FuturesScheduler
+
+
+class Condition(object):
+    def __init__(self, iterations):
+        self.iterations = iterations
+
+    def __call__(self, x):
+        return x < self.iterations
+
+
+def increment(x):
+    return x + 1
+
+
+def measure(label, iterations, scheduler, inline):
+    lw = LoopWhile('loop', Condition(iterations), inline=inline)
+    fa = FuncActor(increment, outports=('x', ))
+    fa.inports['x'] += lw.outports['loop']
+    lw.inports['loop'] += fa.outports['x']
+    t = time.time()
+    scheduler.put_value(lw.inports['init'], 0)
+    scheduler.execute()
+    t = time.time() - t
+    assert lw.outports['exit'].pop() == iterations
+    print('{:40s} {:8.3f} s {:10.1f} us/iteration'.format(label, t, t / iterations * 1e6))
+
+
+def main(iterations=10000):
+    print('{} iterations'.format(iterations))
+    for name, scheduler in (('LinearizedScheduler', LinearizedScheduler),
+                            ('ThreadedScheduler', lambda: ThreadedScheduler(max_threads=4)),
+                            ('FuturesScheduler', lambda: FuturesScheduler('threading'))):
+        measure('{}, inline=False'.format(name), iterations, scheduler(), False)
+        measure(name, iterations, scheduler(), None)
+
+
+if __name__ == '__main__':
+    import sys
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,105 @@
+"""Benchmark the latency and memory of stream mergers
+
+A paced source emits tokens, which are split among branches with random delays
+(FuturesScheduler with threads) and merged by
+    - Merger (unordered, forwarded on arrival)
+    - OrderedMerger (sequence order restored, unbounded reorder buffer)
+    - OrderedMerger with max_pending (bounded reorder buffer)
+Reports the mean and maximum latency from the source to the merged output,
+the peak number of tokens waiting in the merger, the traced peak memory and
+how many tokens are out of order.
+
+Run as
+    python benchmarks/bench_merger.py [number of tokens] [branches] [max_pending]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import random
+import time
+import tracemalloc
+
+from wowp.actors import FuncActor
+from wowp.actors.special import Splitter, Merger, OrderedMerger
+from wowp.schedulers import FuturesScheduler
+
+
+def stamp(number):
+    # one token per 2 ms
+    time.sleep(0.002)
+    return number, time.time()
+
+
+def jitter(token):
+    # exponential service time, mean 2 ms
+    time.sleep(random.expovariate(500))
+    return token
+
+
+def latency(token):
+    number, created = token
+    return number, time.time() - created
+
+
+class PeakPending(object):
+    """Records the peak number of tokens waiting in the merger
+    """
+
+    def __init__(self, merger):
+        self.peak = 0
+        get_run_args = merger.get_run_args
+
+        def recording_get_run_args():
+            self.peak = max(self.peak, sum(len(port.buffer) for port in merger.inports))
+            return get_run_args()
+
+        merger.get_run_args = recording_get_run_args
+
+
+def run(merger, tokens, branches):
+    source = FuncActor(stamp, inports=('number', ))
+    splitter = Splitter(multiplicity=branches, inport_name='x', policy='least_loaded')
+    source.outports['out'].connect(splitter.inports['x'])
+    for i in range(1, branches + 1):
+        branch = FuncActor(jitter, inports=('token', ))
+        splitter.outports['x_%d' % i].connect(branch.inports['token'])
+        branch.outports['out'].connect(merger.inports['x_%d' % i])
+    sink = FuncActor(latency, inports=('token', ))
+    merger.outports['x'].connect(sink.inports['token'])
+    peak = PeakPending(merger)
+
+    scheduler = FuturesScheduler('threading', min_engines=branches + 2)
+    tracemalloc.start()
+    for i in range(tokens):
+        scheduler.put_value(source.inports['number'], i)
+    scheduler.execute()
+    memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results = list(sink.outports['out'].pop_all())
+    return results, peak.peak, memory
+
+
+def measure(label, merger, tokens, branches):
+    t = time.time()
+    results, peak, memory = run(merger, tokens, branches)
+    t = time.time() - t
+    numbers = [number for number, delay in results]
+    delays = [delay for number, delay in results]
+    assert sorted(numbers) == list(range(tokens))
+    out_of_order = sum(1 for a, b in zip(numbers, numbers[1:]) if b < a)
+    print('{:32s} {:7.2f} s {:8.1f} ms mean {:8.1f} ms max {:6d} pending {:8.0f} kB '
+          '{:6d} out of order'.format(label, t, sum(delays) / len(delays) * 1e3,
+                                      max(delays) * 1e3, peak, memory / 1024, out_of_order))
+
+
+def main(tokens=1000, branches=4, max_pending=16):
+    print('{} tokens, {} branches'.format(tokens, branches))
+    measure('Merger', Merger(outport_name='x', multiplicity=branches), tokens, branches)
+    measure('OrderedMerger', OrderedMerger(outport_name='x', multiplicity=branches),
+            tokens, branches)
+    measure('OrderedMerger, max_pending={}'.format(max_pending),
+            OrderedMerger(outport_name='x', multiplicity=branches, max_pending=max_pending),
+            tokens, branches)
+
+
+if __name__ == '__main__':
+    import sys
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,45 @@
+"""Benchmark back-to-back runs of a small workflow
+
+Run as
+    python benchmarks/bench_pools.py [number of runs]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import sys
+import time
+
+from wowp.actors import FuncActor
+from wowp.actors.mapreduce import Map
+from wowp.schedulers import FuturesScheduler, ThreadedScheduler, shutdown_executors
+
+
+def double(x):
+    return 2 * x
+
+
+def make_workflow():
+    source = FuncActor(range, inports=('inp', ))
+    mapped = Map(FuncActor, args=(double, ), kwargs={'inports': ('inp', )})
+    mapped.inports['inp'] += source.outports['out']
+    return source.get_workflow()
+
+
+def bench(label, make_scheduler, runs):
+    workflow = make_workflow()
+    t0 = time.time()
+    for _ in range(runs):
+        workflow(scheduler=make_scheduler(), inp=8)
+    print('{}: {:.4f} s per run'.format(label, (time.time() - t0) / runs))
+
+
+def main(runs=20):
+    bench('ThreadedScheduler', lambda: ThreadedScheduler(max_threads=4), runs)
+    bench('FuturesScheduler(multiprocessing, shared)',
+          lambda: FuturesScheduler('multiprocessing', min_engines=2), runs)
+    bench('FuturesScheduler(multiprocessing, not shared)',
+          lambda: FuturesScheduler('multiprocessing', min_engines=2, shared_executor=False),
+          runs)
+    shutdown_executors()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,97 @@
+"""Benchmark the file system overhead of FileCommand runs
+
+Repeats the file system operations of a run (working directory, staging of
+the inputs, stdout/stderr files, an output file, cleanup) without running
+the command, with
+    - new temporary directories (mkdtemp), left in place (cleanup=False)
+    - new temporary directories, cleaned by the run (cleanup=True)
+    - wowp.scratch.ScratchPool in the same root, cleaned asynchronously
+    - ScratchPool on tmpfs (/dev/shm)
+Reports the time per run on the critical path and including the pending
+asynchronous cleanups.
+
+Run as
+    python benchmarks/bench_scratch.py [number of runs] [number of input files]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import shutil
+import tempfile
+import time
+
+from wowp.actors.omfit import _stage_files
+from wowp.scratch import ScratchPool, TMPFS
+
+
+def run_files(tmpdir, sources):
+    _stage_files([(source, os.path.join(tmpdir, os.path.basename(source)))
+                  for source in sources])
+    with tempfile.NamedTemporaryFile(prefix='stdout', dir=tmpdir), \
+            tempfile.NamedTemporaryFile(prefix='stderr', dir=tmpdir):
+        with open(os.path.join(tmpdir, 'output.dat'), 'wb') as f:
+            f.write(b'x' * 4096)
+
+
+def bench_mkdtemp(root, sources, runs, cleanup):
+    for _ in range(runs):
+        tmpdir = tempfile.mkdtemp(dir=root)
+        run_files(tmpdir, sources)
+        if cleanup:
+            for name in os.listdir(tmpdir):
+                if name != 'output.dat':
+                    os.remove(os.path.join(tmpdir, name))
+
+
+def bench_pool(pool, sources, runs):
+    for _ in range(runs):
+        tmpdir = pool.acquire()
+        run_files(tmpdir, sources)
+        pool.release(tmpdir)
+
+
+def measure(label, runs, func, finish=None):
+    t0 = time.time()
+    func()
+    t1 = time.time()
+    if finish is not None:
+        finish()
+    t2 = time.time()
+    print('{:40s} {:8.3f} ms/run {:8.3f} ms/run with cleanups'.format(
+        label, (t1 - t0) / runs * 1e3, (t2 - t0) / runs * 1e3))
+
+
+def main(runs=2000, files=10):
+    root = tempfile.mkdtemp()
+    try:
+        source_dir = tempfile.mkdtemp(dir=root)
+        sources = []
+        for i in range(files):
+            path = os.path.join(source_dir, 'input_{}.dat'.format(i))
+            with open(path, 'wb') as f:
+                f.write(os.urandom(4096))
+            sources.append(path)
+        print('{} runs, {} input files'.format(runs, files))
+
+        workdir = tempfile.mkdtemp(dir=root)
+        measure('mkdtemp, cleanup=False', runs,
+                lambda: bench_mkdtemp(workdir, sources, runs, cleanup=False))
+        workdir = tempfile.mkdtemp(dir=root)
+        measure('mkdtemp, cleanup=True', runs,
+                lambda: bench_mkdtemp(workdir, sources, runs, cleanup=True))
+
+        roots = [('ScratchPool', tempfile.mkdtemp(dir=root))]
+        if os.path.isdir(TMPFS):
+            roots.append(('ScratchPool, tmpfs', 'tmpfs'))
+        for label, pool_root in roots:
+            pool = ScratchPool(roots=[pool_root])
+            try:
+                measure(label, runs, lambda: bench_pool(pool, sources, runs), pool.wait)
+            finally:
+                pool.shutdown()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    import sys
+    main(*(int(arg) for arg in sys.argv[1:]))
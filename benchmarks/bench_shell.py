@@ -0,0 +1,37 @@
+"""Benchmark many short shell commands run by ShellRunner
+
+Commands waiting for I/O (sleep) and commands that finish immediately (true)
+are run by a FuturesScheduler with 4 threads.
+
+Run as
+    python benchmarks/bench_shell.py [number of commands]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import sys
+import time
+
+from wowp.actors import ShellRunner
+from wowp.schedulers import FuturesScheduler, shutdown_executors
+
+
+def bench(label, command, runner_kwargs, commands):
+    runners = [ShellRunner(command, format_inp='trigger', **runner_kwargs)
+               for _ in range(commands)]
+    scheduler = FuturesScheduler('threading', min_engines=4)
+    t0 = time.time()
+    for runner in runners:
+        scheduler.put_value(runner.inports['inp'], None)
+    scheduler.execute()
+    print('{}, {}: {:.2f} ms per command'.format(' '.join(command), label,
+                                                  (time.time() - t0) / commands * 1e3))
+
+
+def main(commands=500):
+    for command in (('sleep', '0.05'), ('true', )):
+        bench('subprocess.call and temporary files', command, {}, commands)
+        bench('subprocess pool (64 concurrent)', command, {'pool': 64}, commands)
+    shutdown_executors()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
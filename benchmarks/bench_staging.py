@@ -0,0 +1,71 @@
+"""Benchmark staging of input files into FileCommand working directories
+
+Compares the former one-by-one linking (printing every file) with
+wowp.actors.omfit._stage_files, within a file system (links) and across
+file systems (/dev/shm to the temporary directory, copies).
+
+Run as
+    python benchmarks/bench_staging.py [number of files]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import shutil
+import tempfile
+import time
+
+from wowp.actors.omfit import _stage_files
+
+
+def make_files(directory, count):
+    sources = []
+    for i in range(count):
+        path = os.path.join(directory, 'input_{}.dat'.format(i))
+        with open(path, 'wb') as f:
+            f.write(os.urandom(4096))
+        sources.append(path)
+    return sources
+
+
+def stage_one_by_one(pairs, log):
+    for source, target in pairs:
+        print('link({}, {})'.format(source, target), file=log)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+
+def bench(label, sources, target_root, stage):
+    target_dir = tempfile.mkdtemp(dir=target_root)
+    pairs = [(source, os.path.join(target_dir, os.path.basename(source)))
+             for source in sources]
+    t0 = time.time()
+    stage(pairs)
+    print('{}: {:.3f} s'.format(label, time.time() - t0))
+    shutil.rmtree(target_dir)
+
+
+def main(count=5000):
+    roots = [('same file system', tempfile.gettempdir())]
+    if os.path.isdir('/dev/shm') and os.stat('/dev/shm').st_dev != os.stat(
+            tempfile.gettempdir()).st_dev:
+        roots.append(('across file systems', '/dev/shm'))
+    with open(os.devnull, 'w') as log:
+        for name, source_root in roots:
+            source_dir = tempfile.mkdtemp(dir=source_root)
+            try:
+                sources = make_files(source_dir, count)
+                print('{} files, {}'.format(count, name))
+                bench('  one by one', sources, tempfile.gettempdir(),
+                      lambda pairs: stage_one_by_one(pairs, log))
+                bench('  _stage_files, 1 thread', sources, tempfile.gettempdir(),
+                      lambda pairs: _stage_files(pairs, threads=1))
+                bench('  _stage_files, parallel', sources, tempfile.gettempdir(),
+                      _stage_files)
+            finally:
+                shutil.rmtree(source_dir)
+
+
+if __name__ == '__main__':
+    import sys
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,68 @@
+"""Benchmark vectorized FuncActor runs
+
+Puts scalar tokens to a FuncActor with an elementwise function and pops the
+results, with
+    - one call per token (vectorized=False)
+    - one NumPy call for all queued tokens (vectorized=True)
+    - vectorized calls of at most batch_size tokens
+under LinearizedScheduler. The tokens are put one by one (put_value) or at
+once (put_values).
+
+Run as
+    python benchmarks/bench_vectorized.py [number of tokens] [batch size]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import math
+import time
+
+import numpy as np
+
+from wowp.actors import FuncActor
+from wowp.schedulers import LinearizedScheduler
+
+
+def scalar_transform(x):
+    return math.sqrt(x) * 2.0 + 1.0
+
+
+def array_transform(x):
+    return np.sqrt(x) * 2.0 + 1.0
+
+
+def run(actor, tokens, bulk):
+    scheduler = LinearizedScheduler()
+    if bulk:
+        scheduler.put_values(actor.inports['x'], range(tokens))
+    else:
+        for value in range(tokens):
+            scheduler.put_value(actor.inports['x'], value)
+    scheduler.execute()
+    return list(actor.outports['out'].pop_all())
+
+
+def measure(label, tokens, actor, bulk=False):
+    t = time.time()
+    results = run(actor, tokens, bulk)
+    t = time.time() - t
+    print('{:40s} {:8.3f} s {:10.0f} tokens/s'.format(label, t, tokens / t))
+    return results
+
+
+def main(tokens=10 ** 6, batch_size=10000):
+    print('{} tokens'.format(tokens))
+    results = [
+        measure('per token', tokens, FuncActor(scalar_transform)),
+        measure('per token, put_values', tokens, FuncActor(scalar_transform), True),
+        measure('vectorized', tokens, FuncActor(array_transform, vectorized=True)),
+        measure('vectorized, put_values', tokens,
+                FuncActor(array_transform, vectorized=True), True),
+        measure('vectorized, batch_size={}, put_values'.format(batch_size), tokens,
+                FuncActor(array_transform, vectorized=True, batch_size=batch_size), True),
+    ]
+    for other in results[1:]:
+        assert np.allclose(results[0], other)
+
+
+if __name__ == '__main__':
+    import sys
+    main(*(int(arg) for arg in sys.argv[1:]))
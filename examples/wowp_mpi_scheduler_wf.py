@@ -0,0 +1,111 @@
+# run this using
+# mpiexec [MPI EXEC PARAMETERS] python wowp_mpi_scheduler_wf.py
+# running on localhost with 4 processes
+# mpiexec -n 4 python wowp_mpi_scheduler_wf.py
+
+import time
+
+from mpi4py import MPI
+
+from wowp.actors import AnnotateInp, FuncActor, DictionaryMerge, LoopWhile
+from wowp.components import Actor, BatchMixin, TokenBatch
+from wowp.schedulers import MPIScheduler, mpi_worker
+from wowp_mpi_run_wf import test_LinearizedScheduler_loop1000, run_tree_512_test
+
+
+def run_annotate_test(scheduler):
+    actor1 = AnnotateInp(max_sleep=0.5, name='actor1')
+    actor2a = AnnotateInp(max_sleep=0.5, name='actor2a')
+    actor2b = AnnotateInp(max_sleep=0.5, name='actor2b')
+    merge = DictionaryMerge(inport_names=['a', 'b'])
+    actor2a.inports['inp'] += actor1.outports['out']
+    actor2b.inports['inp'] += actor1.outports['out']
+    merge.inports['a'] += actor2a.outports['out']
+    merge.inports['b'] += actor2b.outports['out']
+
+    wf = actor1.get_workflow()
+    wf_res = wf(inp='input', scheduler=scheduler)
+    assert set(wf_res['out'][0]) == {'a', 'b'}
+
+
+def run_large_token_test(scheduler):
+    def produce(n):
+        return b'x' * n
+
+    def length(data):
+        return len(data)
+
+    producer = FuncActor(produce, outports=('data', ))
+    consumer = FuncActor(length, outports=('n', ))
+    consumer.inports['data'] += producer.outports['data']
+
+    fetched = scheduler.fetched_tokens
+    scheduler.put_value(producer.inports['n'], 10 ** 7)
+    scheduler.execute()
+
+    assert consumer.outports['n'].pop() == 10 ** 7
+    # the large token went directly between the workers
+    assert scheduler.fetched_tokens == fetched
+
+
+def run_tagged_loop_test(scheduler):
+    def condition(x):
+        return x < 100
+
+    def func(x):
+        return x + 1
+
+    fa = FuncActor(func, outports=('x', ))
+    lw = LoopWhile('loop', condition)
+    fa.inports['x'] += lw.outports['loop']
+    lw.inports['loop'] += fa.outports['x']
+
+    # concurrent invocations of one workflow instance
+    results = scheduler.run_tagged(lw.get_workflow(), [{'init': i} for i in (0, 50, 200)])
+    assert [list(result['exit']) for result in results] == [[100], [100], [200]]
+
+
+class BatchSize(BatchMixin, Actor):
+    batch_size = 4
+    batch_latency = 0.1
+
+    def __init__(self):
+        super(BatchSize, self).__init__()
+        self.inports.append('x')
+        self.outports.append('size')
+
+    @staticmethod
+    def run(x):
+        return {'size': TokenBatch([(len(x), time.time())] * len(x))}
+
+
+def run_batch_test(scheduler):
+    actor = BatchSize()
+    slow = FuncActor(time.sleep, inports='t')
+    t = time.time()
+    scheduler.put_value(slow.inports['t'], 2)
+    for i in range(10):
+        scheduler.put_value(actor.inports['x'], i)
+    scheduler.execute()
+    sizes, times = zip(*actor.outports['size'].pop_all())
+    assert sizes == (4, ) * 8 + (2, ) * 2
+    # the incomplete batch did not wait for the slow actor
+    assert times[-1] - t < 1.5
+
+
+if __name__ == '__main__':
+
+    if MPI.COMM_WORLD.rank > 0:
+        mpi_worker()
+    else:
+        mpischeduler = MPIScheduler()
+        try:
+            run_annotate_test(mpischeduler)
+            test_LinearizedScheduler_loop1000(mpischeduler)
+            run_tree_512_test(mpischeduler)
+            run_large_token_test(mpischeduler)
+            run_tagged_loop_test(mpischeduler)
+            run_batch_test(mpischeduler)
+        finally:
+            mpischeduler.shutdown()
+        print('MPIScheduler OK')
@@ -26,7 +26,7 @@ options = dict(
         'parallel': ['ipyparallel', 'mpi4py'],
         'distributed': ['distributed'],
         'julia': ['julia'],
-        'matlab': ['matlab', 'stopit']
+        'matlab': ['matlab']
     },
     entry_points={
         # 'console_scripts' : [
@@ -0,0 +1,212 @@
+"""Implementation of wowp.shellpool
+
+Uses async def, hence importable only by Python 3.5+.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import asyncio
+import atexit
+import locale
+import threading
+
+import six
+
+from .logger import logger
+from .resources import host_capacity
+
+__all__ = ["ShellPool", "get_shell_pool", "shutdown_shell_pools"]
+
+# size of the pipe reads
+_CHUNK_SIZE = 2 ** 16
+# asyncio.all_tasks and asyncio.current_task are Python 3.7+
+_all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+_current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+
+def _decode(data, truncated):
+    """Decode the output like subprocess in the text mode
+    """
+    # truncated output can end within a multibyte character
+    text = data.decode(locale.getpreferredencoding(False),
+                       'replace' if truncated else 'strict')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+async def _cancel_tasks():
+    """Cancel the other tasks of the event loop and wait for them
+    """
+    tasks = [task for task in _all_tasks() if task is not _current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class ShellPool(object):
+    """Runs shell commands concurrently as asyncio subprocesses
+
+    Args:
+        max_concurrency (Optional[int]): maximum number of running commands
+            [number of cores]
+        max_output (Optional[int]): default maximum number of bytes kept from stdout
+            and stderr of each command, the rest is read and dropped [None = unlimited]
+    """
+
+    def __init__(self, max_concurrency=None, max_output=None):
+        if max_concurrency is None:
+            max_concurrency = host_capacity()['cores']
+        self.max_concurrency = max_concurrency
+        self.max_output = max_output
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<{} max_concurrency={}>".format(self.__class__.__name__, self.max_concurrency)
+
+    def _start(self):
+        """Start the event loop thread on the first use
+        """
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    # must be created within the loop
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                    started.set()
+                    loop.run_forever()
+                    # commands still running, their futures are cancelled
+                    loop.run_until_complete(_cancel_tasks())
+                    loop.close()
+
+                self._thread = threading.Thread(target=run, name='ShellPool')
+                self._thread.daemon = True
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, args, shell=False, binary=False, on_output=None, max_output=None):
+        """Start the command
+
+        Args:
+            args (tuple): command and its arguments, joined by spaces if shell is used
+            shell (Optional[bool or str]): run by the shell, a string selects
+                the shell executable [False]
+            binary (Optional[bool]): return bytes instead of str [False]
+            on_output (Optional[callable]): on_output(stream_name, data) called
+                with chunks (bytes) of 'stdout' and 'stderr' as they are read,
+                from the pool's thread
+            max_output (Optional[int]): overrides the pool's max_output
+
+        Returns:
+            concurrent.futures.Future: result is a dict with 'ret' (return code),
+                'stdout' and 'stderr'
+        """
+        if max_output is None:
+            max_output = self.max_output
+        return asyncio.run_coroutine_threadsafe(
+            self._run(args, shell, binary, on_output, max_output), self._start())
+
+    def run(self, *args, **kwargs):
+        """Run the command and wait for the result, see submit
+        """
+        return self.submit(*args, **kwargs).result()
+
+    async def run_async(self, *args, **kwargs):
+        """Run the command from a coroutine of any event loop, see submit
+        """
+        return await asyncio.wrap_future(self.submit(*args, **kwargs))
+
+    async def _run(self, args, shell, binary, on_output, max_output):
+        async with self._semaphore:
+            pipes = dict(stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            if shell:
+                executable = shell if isinstance(shell, six.string_types) else None
+                process = await asyncio.create_subprocess_shell(
+                    ' '.join(args), executable=executable, **pipes)
+            else:
+                process = await asyncio.create_subprocess_exec(*args, **pipes)
+            try:
+                # both pipes must be read concurrently to avoid deadlocks
+                (stdout, stdout_cut), (stderr, stderr_cut) = await asyncio.gather(
+                    self._read(process.stdout, 'stdout', on_output, max_output),
+                    self._read(process.stderr, 'stderr', on_output, max_output))
+                ret = await process.wait()
+            except asyncio.CancelledError:
+                # the pool is shut down, do not leave the command running
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
+        if stdout_cut or stderr_cut:
+            logger.warning('output of {} truncated to {} bytes'.format(args, max_output))
+        if not binary:
+            stdout = _decode(stdout, stdout_cut)
+            stderr = _decode(stderr, stderr_cut)
+        return {'ret': ret, 'stdout': stdout, 'stderr': stderr}
+
+    @staticmethod
+    async def _read(stream, name, on_output, max_output):
+        """Read the stream to the end, keep up to max_output bytes
+
+        Returns:
+            tuple: (data, truncated)
+        """
+        chunks = []
+        size = 0
+        truncated = False
+        while True:
+            chunk = await stream.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            if on_output is not None:
+                on_output(name, chunk)
+            if max_output is not None and size + len(chunk) > max_output:
+                chunk = chunk[:max_output - size]
+                truncated = True
+            if chunk:
+                chunks.append(chunk)
+                size += len(chunk)
+        return b''.join(chunks), truncated
+
+    def shutdown(self):
+        """Stop the event loop thread, running commands are killed
+
+        Futures of the commands that did not finish are cancelled.
+        """
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+            self._thread = None
+
+
+# max_concurrency: ShellPool
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_shell_pool(max_concurrency=None):
+    """Get the process-wide pool with the given concurrency, create it on the first request
+
+    Actors running in the same process (e.g. ShellRunner(pool=...)) share the pool.
+    """
+    with _pools_lock:
+        if max_concurrency not in _pools:
+            _pools[max_concurrency] = ShellPool(max_concurrency)
+        return _pools[max_concurrency]
+
+
+def shutdown_shell_pools():
+    """Shut down the process-wide pools
+    """
+    with _pools_lock:
+        while _pools:
+            _pools.popitem()[1].shutdown()
+
+
+atexit.register(shutdown_shell_pools)
@@ -1,5 +1,8 @@
 from __future__ import absolute_import, division, print_function
-from ..components import Actor
+from ..components import Actor, BatchMixin, Port, TokenBatch
+from ..schedulers import FuturesScheduler, MPIScheduler
+from ..tags import TaggedAttribute
+from ..util import dumps, loads
 import inspect
 import itertools
 import six
@@ -11,9 +14,15 @@ __all__ = ['FuncActor', 'Switch', 'ShellRunner', 'Sink',
            'AnnotateInp']
 
 
-class FuncActor(Actor):
+class FuncActor(BatchMixin, Actor):
     """Actor defined simply by a function
 
+    A vectorized actor calls func once for all queued tokens: the values of
+    each input port are stacked into a NumPy array and func must return an
+    array (per output port) with one value per token, e.g. numpy.sqrt.
+    The results are split back into tokens in the order of the inputs
+    (1-D arrays into Python scalars, others into rows).
+
     Args:
         func (callable): The function to be called on actor execution
         args (list): Fixed function positional arguments
@@ -22,9 +31,17 @@ class FuncActor(Actor):
         outports: output port name(s)
         inports: input port name(s)
         name (str): actor name
+        vectorized (bool): call func with arrays of the queued tokens [False]
+        batch_size (int): maximum number of tokens per vectorized call [None = unlimited]
+        batch_latency (float): maximum time to wait for more tokens [None = until no
+            other tokens can arrive], see BatchMixin
+            batch_size and batch_latency require vectorized
     """
 
-    def __init__(self, func, args=(), kwargs={}, outports=None, inports=None, name=None):
+    def __init__(self, func, args=(), kwargs={}, outports=None, inports=None, name=None,
+                 vectorized=False, batch_size=None, batch_latency=None):
+        if not vectorized and (batch_size is not None or batch_latency is not None):
+            raise ValueError('batch_size and batch_latency require vectorized=True')
         if not name:
             name = func.__name__
         super(FuncActor, self).__init__(name=name)
@@ -82,20 +99,31 @@ class FuncActor(Actor):
             outports = (outports, )
         for name in outports:
             self.outports.append(name)
+        self.vectorized = vectorized
+        if vectorized:
+            self.batch_size = batch_size
+            self.batch_latency = batch_latency
 
     def get_run_args(self):
-        args = tuple(port.pop() for port in self.inports)
+        if self.vectorized:
+            args = (self.pop_columns(), )
+        else:
+            args = tuple(port.pop() for port in self.inports)
         kwargs = {'runfunc': self.func,
                   'func_args': self._func_args,
                   'func_kwargs': self._func_kwargs,
                   'outports': tuple(port.name for port in self.outports)}
         # kwargs['connected_ports'] = list((name for name, port in self.outports.items()
         #                                   if port.isconnected()))
+        if self.vectorized:
+            kwargs['vectorized'] = True
 
         return args, kwargs
 
     @staticmethod
     def run(*args, **kwargs):
+        if kwargs.get('vectorized'):
+            return FuncActor._run_vectorized(args[0], kwargs)
         args = kwargs['func_args'] + args
         func_res = kwargs['runfunc'](*args, **kwargs['func_kwargs'])
         outports = kwargs['outports']
@@ -106,6 +134,26 @@ class FuncActor(Actor):
         res = {name: value for name, value in zip(outports, func_res)}
         return res
 
+    @staticmethod
+    def _run_vectorized(columns, kwargs):
+        import numpy as np
+
+        arrays = tuple(np.asarray(values) for values in columns)
+        count = len(columns[0]) if columns else 0
+        func_res = kwargs['runfunc'](*(kwargs['func_args'] + arrays), **kwargs['func_kwargs'])
+        outports = kwargs['outports']
+
+        if len(outports) == 1:
+            func_res = (func_res, )
+        res = {}
+        for name, values in zip(outports, func_res):
+            values = np.asarray(values)
+            if not values.ndim or len(values) != count:
+                raise ValueError('batch of {} values returned {} results'.format(
+                    count, len(values) if values.ndim else 'scalar'))
+            res[name] = TokenBatch(values.tolist() if values.ndim == 1 else list(values))
+        return res
+
     def __call__(self, *args, **kwargs):
         args = self._func_args + args
         kwargs.update(self._func_kwargs)
@@ -117,6 +165,9 @@ class Switch(Actor):
     """
 
     _system_actor = True
+    # state of the individual invocations (see wowp.tags)
+    _in_condition = TaggedAttribute('_in_condition', False)
+    _last_value = TaggedAttribute('_last_value')
 
     def __init__(self, name=None, condition_func=None):
         super(Switch, self).__init__(name=name)
@@ -206,6 +257,11 @@ class ShellRunner(Actor):
         single_out: join outputs into a single dict
         debug_print: print debug info
         print_output: print standard output and standard error
+        pool: run the command in an asynchronous subprocess pool (see wowp.shellpool)
+              shared by the process, True or the maximum number of concurrent commands;
+              FuturesScheduler runs such commands in its own process without
+              occupying executor slots; requires Python 3.5+
+        max_output: maximum number of bytes kept from stdout and stderr (pool only)
     """
 
     def __init__(self,
@@ -216,7 +272,9 @@ class ShellRunner(Actor):
                  format_inp=False,
                  single_out=False,
                  print_output=False,
-                 debug_print=False):
+                 debug_print=False,
+                 pool=None,
+                 max_output=None):
         super(ShellRunner, self).__init__(name=name)
 
         if isinstance(base_command, six.string_types):
@@ -231,6 +289,10 @@ class ShellRunner(Actor):
         self.single_out = single_out
         self.debug_print = debug_print
         self.print_output = print_output
+        self.pool = pool
+        self.max_output = max_output
+        # the pool runs the jobs asynchronously, see submit_async
+        self._async_actor = pool not in (None, False)
         if single_out:
             self.outports.append('out')
         else:
@@ -256,18 +318,53 @@ class ShellRunner(Actor):
             'single_out': self.single_out,
             'debug_print': self.debug_print,
             'print_output': self.print_output,
+            'pool': self.pool,
+            'max_output': self.max_output,
         }
         return args, kwargs
 
+    @staticmethod
+    def _shell_pool(kwargs):
+        from ..shellpool import get_shell_pool
+        pool = kwargs['pool']
+        return get_shell_pool(None if pool is True else pool)
+
+    def submit_async(self, *args, **kwargs):
+        """Start the command in the subprocess pool
+
+        Returns:
+            concurrent.futures.Future: the result of run
+        """
+        import concurrent.futures
+
+        if kwargs['debug_print']:
+            print('run command:\n{}'.format(' '.join(args)))
+        future = concurrent.futures.Future()
+
+        def done(pool_future):
+            try:
+                future.set_result(ShellRunner._outputs(pool_future.result(), kwargs))
+            except Exception as error:
+                future.set_exception(error)
+
+        self._shell_pool(kwargs).submit(args, shell=kwargs['shell'], binary=kwargs['binary'],
+                                        max_output=kwargs['max_output']).add_done_callback(done)
+        return future
+
     @staticmethod
     def run(*args, **kwargs):
         import subprocess
         import tempfile
-        import sys
 
         if kwargs['debug_print']:
             print('run command:\n{}'.format(' '.join(args)))
 
+        if kwargs.get('pool') not in (None, False):
+            res = ShellRunner._shell_pool(kwargs).run(args, shell=kwargs['shell'],
+                                                      binary=kwargs['binary'],
+                                                      max_output=kwargs['max_output'])
+            return ShellRunner._outputs(res, kwargs)
+
         if kwargs['binary']:
             mode = "w+b"
         else:
@@ -296,11 +393,19 @@ class ShellRunner(Actor):
             cout = fout.read()
             cerr = ferr.read()
         res = {'ret': result, 'stdout': cout, 'stderr': cerr}
+        return ShellRunner._outputs(res, kwargs)
+
+    @staticmethod
+    def _outputs(res, kwargs):
+        """Process the command result according to the actor's options
+        """
+        import sys
+
         if kwargs['debug_print']:
             print('result:\n{}'.format(res))
         if kwargs['print_output']:
-            sys.stdout.write(cout)
-            sys.stderr.write(cerr)
+            sys.stdout.write(res['stdout'])
+            sys.stderr.write(res['stderr'])
         if kwargs['single_out']:
             res = {'out': res}
         return res
@@ -397,13 +502,51 @@ class DictionaryExtract(Actor):
         return res
 
 
+def _call_links(links, value):
+    """Pass the value through (func, args, kwargs) links
+    """
+    for func, args, kwargs in links:
+        value = func(*(args + (value, )), **kwargs)
+    return value
+
+
+def _run_loop(condition, body, value):
+    """Run a while loop of (func, args, kwargs) links, see LoopWhile
+    """
+    while _call_links(condition, value):
+        value = _call_links(body, value)
+    return {'exit': value}
+
+
 class LoopWhile(Actor):
-    """A while loop actor"""
+    """A while loop actor
+
+    If the loop body (and the condition actor branch) is a chain of FuncActor
+    links, whose outputs go to the next link only, the whole loop runs at once
+    as function calls instead of a scheduler round trip per iteration: inline
+    with NaiveScheduler, LinearizedScheduler and ThreadedScheduler, as a single
+    executor job with FuturesScheduler (if the functions can be pickled), which
+    requires the actor's resources like any other job.
+
+    Args:
+        name (str): actor name
+        condition_func (callable): the loop condition, otherwise a condition actor
+            must be connected to condition_in and condition_out
+        inline (Optional[bool]): run chains of FuncActor links at once, None = if possible,
+            True = also inline with other schedulers, raise ValueError if not possible [None]
+    """
 
     _system_actor = True
+    # state of the individual invocations (see wowp.tags)
+    _in_loop = TaggedAttribute('_in_loop', False)
+    _in_condition = TaggedAttribute('_in_condition', False)
+    _last_value = TaggedAttribute('_last_value')
 
-    def __init__(self, name='LoopWhile', condition_func=None):
+    def __init__(self, name='LoopWhile', condition_func=None, inline=None):
         super(LoopWhile, self).__init__(name=name)
+        self.inline = inline
+        # (connections version, remote, inline), loop links, see _loop_links
+        self._loop_cache = None
         # flag for being inside a loop
         self._in_loop = False
         # flag for evaluating the condition
@@ -423,8 +566,12 @@ class LoopWhile(Actor):
             raise Exception('condition_func must be a callable object')
 
     def get_run_args(self):
+        loop = self._remote_loop()
+        if loop is not None:
+            # the whole loop runs as an executor job
+            return (loop, self.inports['init'].pop()), {}
         # everything is done inside run
-        return (), {}
+        return (), {'loop_actor': self}
 
     def is_condition_actor(self):
         """Returns True if condition actor is connected
@@ -439,10 +586,99 @@ class LoopWhile(Actor):
             raise Exception('Both condition_in and out must be connected')
         return False
 
-    def run(self, *args, **kwargs):
+    @staticmethod
+    def _links(outport, inport):
+        """(func, args, kwargs) of FuncActor links from outport to inport,
+        None if they cannot run at once
+        """
+        actors = []
+        port = outport
+        while len(port.connections) == 1:
+            target = port.connections[0]
+            if target is inport:
+                return [(actor.func, actor._func_args, actor._func_kwargs)
+                        for actor in actors]
+            actor = target.owner
+            if (not isinstance(actor, FuncActor) or actor.vectorized or actor in actors or
+                    len(actor.inports) != 1 or len(actor.outports) != 1 or
+                    len(target.connections) != 1):
+                # e.g. the actor gets tokens from outside of the loop too
+                return None
+            actors.append(actor)
+            port = actor.outports.at(0)
+        return None
+
+    def _inline_loop(self):
+        """(condition, body) links if the loop can run at once, None otherwise
+        """
+        if self.inline is False:
+            return None
+        body = self._links(self.outports['loop'], self.inports['loop'])
+        if self._condition_func is not None:
+            condition = [(self._condition_func, (), {})]
+        elif self.is_condition_actor():
+            condition = self._links(self.outports['condition_in'],
+                                    self.inports['condition_out'])
+        else:
+            condition = None
+        if body is None or condition is None:
+            if self.inline:
+                raise ValueError('{}: the loop cannot run inline'.format(self.name))
+            return None
+        return condition, body
+
+    def _loop_links(self, remote):
+        """_inline_loop result, cached until any port is (dis)connected
+
+        Links of remote loops are shipped pickled by wowp.util.dumps,
+        None if they cannot be pickled.
+        """
+        key = (Port.connections_version(), remote, self.inline)
+        if self._loop_cache is not None and self._loop_cache[0] == key:
+            return self._loop_cache[1]
+        loop = self._inline_loop()
+        if remote and loop is not None:
+            try:
+                loop = dumps(loop)
+            except Exception:
+                # e.g. local functions, the loop runs iteration by iteration (or inline)
+                loop = None
+        self._loop_cache = (key, loop)
+        return loop
+
+    def _remote_loop(self):
+        """Pickled (condition, body) links if the loop runs as an executor job,
+        None otherwise
+        """
+        if (self._in_loop or self.inline is False or
+                not isinstance(getattr(self, 'scheduler', None), FuturesScheduler)):
+            return None
+        return self._loop_links(True)
+
+    @property
+    def system_actor(self):
+        return self._remote_loop() is None
+
+    @staticmethod
+    def run(*args, **kwargs):
+        if args:
+            # pickled links and the initial value of a loop running at once
+            links, value = args
+            condition, body = loads(links)
+            return _run_loop(condition, body, value)
+        return kwargs['loop_actor']._step()
+
+    def _step(self):
+        """Process the next input, the loop runs iteration by iteration (or inline)
+        """
         res = {}
         condition_out = None
         if not self._in_loop:
+            scheduler = getattr(self, 'scheduler', None)
+            if self.inline or not isinstance(scheduler, (FuturesScheduler, MPIScheduler)):
+                loop = self._loop_links(False)
+                if loop is not None:
+                    return _run_loop(loop[0], loop[1], self.inports['init'].pop())
             # input on init port
             value = self.inports['init'].pop()
             self._in_loop = True
@@ -1,11 +1,135 @@
+'''
+Julia actors
+
+Requires PyJulia (https://github.com/JuliaPy/pyjulia).
+
+The Julia runtime is started once per process and the resolved methods are
+cached (see get_julia_method), hence only the first call of a method pays
+for the runtime startup and compilation. Worker processes can do that in
+advance, e.g.
+
+    FuturesScheduler('multiprocessing',
+                     executor_kwargs={'initializer': warm_up_julia,
+                                      'initargs': ([('MyPackage', 'my_method')], )})
+'''
+
 from . import Actor
-from julia import Julia, JuliaError
+from ..components import BatchMixin, TokenBatch
+from ..logger import logger
+import os
+import threading
 import six
 
-class JuliaMethod(Actor):
-    def __init__(self, method_name, package_name=None, inports=(), outports='result'):
+
+def start_julia():
+    """Start the Julia runtime, the default runtime factory
+    """
+    from julia import Julia
+    return Julia()
+
+
+# runtime factory: runtime of this process
+_runtimes = {}
+# (runtime factory, package name, method name): method
+_methods = {}
+_runtimes_pid = [None]
+# Julia must not be called from several threads at once
+_julia_lock = threading.RLock()
+
+
+def _check_pid():
+    if _runtimes_pid[0] != os.getpid():
+        # runtimes of the parent process cannot be used
+        _runtimes.clear()
+        _methods.clear()
+        _runtimes_pid[0] = os.getpid()
+
+
+def get_julia(factory=None):
+    """Get the Julia runtime of this process, start it on the first request
+
+    Args:
+        factory (Optional[callable]): starts the runtime [start_julia]
+    """
+    if factory is None:
+        factory = start_julia
+    with _julia_lock:
+        _check_pid()
+        if factory not in _runtimes:
+            logger.debug('starting Julia runtime')
+            _runtimes[factory] = factory()
+        return _runtimes[factory]
+
+
+def full_method_name(method_name, package_name=None):
+    if package_name:
+        return "%s.%s" % (package_name, method_name)
+    else:
+        return method_name
+
+
+def get_julia_method(method_name, package_name=None, factory=None):
+    """Get the (cached) Julia method, import the package on the first request
+    """
+    key = (factory, package_name, method_name)
+    with _julia_lock:
+        _check_pid()
+        try:
+            return _methods[key]
+        except KeyError:
+            pass
+        julia = get_julia(factory)
+        if package_name:
+            julia.eval("using %s" % package_name)
+        method = _methods[key] = julia.eval(full_method_name(method_name, package_name))
+        return method
+
+
+def warm_up_julia(methods=(), statements=(), factory=None):
+    """Start the runtime and resolve the methods in advance, e.g. as an executor initializer
+
+    Args:
+        methods (list): method names or (package name, method name)
+        statements (list): Julia code to evaluate, e.g. precompile(f, (Float64,))
+        factory (Optional[callable]): starts the runtime [start_julia]
+    """
+    julia = get_julia(factory)
+    for method in methods:
+        if isinstance(method, six.string_types):
+            get_julia_method(method, factory=factory)
+        else:
+            package_name, method_name = method
+            get_julia_method(method_name, package_name, factory=factory)
+    with _julia_lock:
+        for statement in statements:
+            julia.eval(statement)
+
+
+class JuliaMethod(BatchMixin, Actor):
+    """Calls a Julia method
+
+    In the batch mode (batch_size None or > 1), queued tokens are passed as one array
+    per input port to a single call of batch_method, by default broadcast
+    (i.e. method.(arrays...)), which must return one value per token.
+    Methods with several outputs return tuples.
+
+    Args:
+        method_name (str): the method name
+        package_name (Optional[str]): the package of the method
+        inports: input port name(s), the method arguments
+        outports: output port name(s), the method results
+        julia_factory (Optional[callable]): starts the Julia runtime [start_julia]
+        batch_size (Optional[int]): maximum number of tokens per call, None = any [1]
+        batch_latency (Optional[float]): maximum time to wait for a full batch [0],
+            see BatchMixin
+        batch_method (Optional[str]): vectorized method of the package [None = broadcast]
+    """
+
+    def __init__(self, method_name, package_name=None, inports=(), outports='result',
+                 julia_factory=None, batch_size=1, batch_latency=0, batch_method=None):
         self.method_name = method_name
         self.package_name = package_name
+        self.julia_factory = julia_factory
         super(JuliaMethod, self).__init__(name=self._full_method_name)
 
         if isinstance(inports, six.string_types):
@@ -18,31 +142,71 @@ class JuliaMethod(Actor):
         for p in outports:
             self.outports.append(p)
 
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.batch_method = batch_method
+
     @property
     def _julia_method(self):
-        if self.package_name:
-            self._julia.eval("using %s" % self.package_name)
-        return self._julia.eval(self._full_method_name)
+        return get_julia_method(self.method_name, self.package_name, self.julia_factory)
 
     @property
     def _full_method_name(self):
-        if self.package_name:
-            return "%s.%s" % (self.package_name, self.method_name)
+        return full_method_name(self.method_name, self.package_name)
+
+    def get_run_args(self):
+        kwargs = {'method_name': self.method_name,
+                  'package_name': self.package_name,
+                  'julia_factory': self.julia_factory,
+                  'outports': tuple(self.outports.keys())}
+        if self.batched:
+            args = (self.pop_batch(), )
+            kwargs.update(batch=True, batch_method=self.batch_method)
         else:
-            return self.method_name
+            args = tuple(port.pop() for port in self.inports)
+        return args, kwargs
 
-    def run(self):
-        args = (port.pop() for port in self.inports)
-        func_res = self.__call__(*args)
+    @staticmethod
+    def run(*args, **kwargs):
+        if kwargs.get('batch'):
+            return JuliaMethod._run_batch(args[0], kwargs)
+        method = get_julia_method(kwargs['method_name'], kwargs['package_name'],
+                                  kwargs['julia_factory'])
+        with _julia_lock:
+            func_res = method(*args)
+        outports = kwargs['outports']
 
-        if len(self.outports) == 1:
+        if len(outports) == 1:
             func_res = (func_res,)
 
         res = {}
-        for name, value in zip(self.outports.keys(), func_res):
+        for name, value in zip(outports, func_res):
             res[name] = value
         return res
 
+    @staticmethod
+    def _run_batch(batch, kwargs):
+        factory = kwargs['julia_factory']
+        arrays = [list(values) for values in zip(*batch)]
+        if kwargs['batch_method'] is None:
+            broadcast = get_julia_method('broadcast', factory=factory)
+            method = get_julia_method(kwargs['method_name'], kwargs['package_name'], factory)
+            with _julia_lock:
+                func_res = broadcast(method, *arrays)
+        else:
+            method = get_julia_method(kwargs['batch_method'], kwargs['package_name'], factory)
+            with _julia_lock:
+                func_res = method(*arrays)
+        func_res = list(func_res)
+        if len(func_res) != len(batch):
+            raise ValueError('batch of {} values returned {} results'.format(
+                len(batch), len(func_res)))
+        outports = kwargs['outports']
+        if len(outports) == 1:
+            return {outports[0]: TokenBatch(func_res)}
+        return {name: TokenBatch(values) for name, values in zip(outports, zip(*func_res))}
+
     def __call__(self, *args, **kwargs):
-        self._julia = Julia()
-        return self._julia_method(*args)
+        method = self._julia_method
+        with _julia_lock:
+            return method(*args)
@@ -2,8 +2,9 @@ from __future__ import absolute_import, division, print_function
 
 import itertools
 
-from ..components import Actor
+from ..components import Actor, TokenBatch, iter_tokens
 from ..schedulers import _ActorRunner, ThreadedScheduler
+from ..tags import TaggedAttribute
 from future.builtins import super
 
 
@@ -48,6 +49,8 @@ class MultiConcat(Actor):
         super().__init__(name=name)
         self._port_names = []
         self._last_connected = -1
+        # (Map, sequence number) of an expanded Map, see Map.expand
+        self.map_sequence = None
 
     def get_run_args(self):
         return (), {}
@@ -57,6 +60,9 @@ class MultiConcat(Actor):
         for inport, outport in zip(self.inports, itertools.cycle(self.outports)):
             res.setdefault(outport.name, [])
             res[outport.name].append(inport.pop())
+        if self.map_sequence is not None:
+            map_actor, number = self.map_sequence
+            return map_actor._in_order(number, res)
         return res
 
     def add_and_connect(self, actor):
@@ -91,6 +97,10 @@ class Map(Actor):
     """
 
     _system_actor = True
+    # expanded invocations of the individual workflow invocations (see wowp.tags)
+    _expanded = TaggedAttribute('_expanded', 0)
+    _emitted = TaggedAttribute('_emitted', 0)
+    _finished = TaggedAttribute('_finished')
 
     def __init__(self, actor_class, args=(), kwargs={}, scheduler=None, name='map'):
         super().__init__(name=name)
@@ -120,31 +130,75 @@ class Map(Actor):
         else:
             # in this case, we assume self.map_scheduler is a class
             map_scheduler = self.map_scheduler()
-        # destinations = [port for port in self.outports['out'].connections]
-        # disconnect the output port
-        # for port in destinations:
-        #     self.outports['out'].disconnect(port)
-        # create the map actors, connect and put inputs
-        map_actors = []
+        concat_actor = self._create_map_actors(map_scheduler.put_value)
+        # run the mapping sub-workflows
+        map_scheduler.execute()
+
+        result = {port.name: port.pop() for port in concat_actor.outports}
+        return result
+
+    def expand(self, scheduler):
+        """Expand the mapping sub-workflow into scheduler's own queues.
+
+        Used by schedulers that can interleave the mapped actors with other jobs
+        (see FuturesScheduler). Results are put into this actor's outports
+        once all mapped actors finish, in the order of the inputs.
+        """
+        if self.map_scheduler is not None:
+            # explicitly requested scheduler must be used
+            return False
+        concat_actor = self._create_map_actors(scheduler.put_value)
+        number = self._expanded
+        self._expanded += 1
+        if not concat_actor.inports:
+            # empty input, no MultiConcat will fire for this invocation
+            result = self._in_order(number, {name: [] for name in self.outports.keys()})
+            for name, value in result.items():
+                outport = self.outports[name]
+                for token in iter_tokens(value):
+                    outport.put(token)
+                    scheduler.on_outport_put_value(outport)
+            return True
+        concat_actor.map_sequence = (self, number)
+        # concatenated values go out directly through this actor's outports
+        for name in concat_actor.outports.keys():
+            concat_actor.outports[name] = self.outports[name]
+        return True
+
+    def _in_order(self, number, result):
+        """Results of the expanded invocations that can be emitted after number finished
+
+        Later invocations may finish first, their results wait for the previous ones.
+        """
+        if self._finished is None:
+            self._finished = {}
+        finished = self._finished
+        finished[number] = result
+        res = {}
+        while self._emitted in finished:
+            for name, value in finished.pop(self._emitted).items():
+                res.setdefault(name, TokenBatch()).append(value)
+            self._emitted += 1
+        return res
+
+    def _create_map_actors(self, put_value):
+        """Create the mapped actors, put their inputs and concatenate their outputs
+
+        :param put_value: put_value method of the scheduler used to run the actors
+        :return: MultiConcat actor collecting the results
+        """
         concat_actor = MultiConcat()
         # items will iterate over all ports inputs, i.e. will contain n-th actor input
         # TODO ensure equal input lengths
         for items in zip(*(port.pop() for port in self.inports)):
             # get actor instance
             actor = self.actor_class(*self.actor_args, **self.actor_kwargs)
-            map_actors.append(actor)
             concat_actor.add_and_connect(actor)
             # put the input data item
             for port, value in zip(actor.inports, items):
                 # value is a single input item of the port
-                map_scheduler.put_value(port, value)
-        # run the mapping sub-workflows
-        # map_workflow = concat_actor.get_workflow()
-        # result = map_scheduler.run_workflow(map_workflow)
-        map_scheduler.execute()
-
-        result = {port.name: port.pop() for port in concat_actor.outports}
-        return result
+                put_value(port, value)
+        return concat_actor
 
 
 class PassWID(Actor):
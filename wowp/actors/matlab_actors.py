@@ -4,19 +4,289 @@ Matlab actors
 
 Requires MATLAB Engine for Python
 (http://www.mathworks.com/help/matlab/matlab-engine-for-python.htm).
+
+Engines are kept in bounded per-process pools (see EnginePool and
+get_engine_pool), matlab.engine is imported when the first engine starts.
+Worker processes can start their engines in advance, e.g.
+
+    FuturesScheduler('multiprocessing',
+                     executor_kwargs={'initializer': warm_up_engine_pool,
+                                      'initargs': ({'min_size': 1}, )})
 '''
 
 from . import Actor
-import stopit
-import matlab.engine
+from ..components import BatchMixin, TokenBatch
+from ..logger import logger
+from contextlib import contextmanager
 from warnings import warn
+import atexit
+import os
+import threading
+import time
 import six
 
 
-class EngineManager(object):
-    """Matlab engine with a shared pool"""
+def start_matlab(*args, **kwargs):
+    """Start a MATLAB engine, the default engine factory
+    """
+    import matlab.engine
+    return matlab.engine.start_matlab(*args, **kwargs)
+
+
+def ping(engine):
+    """Check that the engine responds, the default liveness check
+    """
+    try:
+        engine.eval('0;', nargout=0)
+        return True
+    except Exception:
+        return False
+
+
+def _quit(engine, timeout=10):
+    """Quit the engine, give up after timeout seconds
+    """
+
+    def quit_engine():
+        try:
+            engine.quit()
+        except Exception:
+            # already closed or not working
+            pass
+
+    thread = threading.Thread(target=quit_engine, name='MatlabQuit')
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        warn('engine {} not responding for {} seconds'.format(str(engine), timeout))
+
+
+class EnginePool(object):
+    """Bounded thread-safe pool of MATLAB engines
+
+    Each thread gets preferably the engine it used last.
+
+    Args:
+        factory (Optional[callable]): starts an engine,
+            factory(*engine_args, **engine_kwargs) [start_matlab]
+        engine_args (Optional[tuple]): engine factory arguments
+        engine_kwargs (Optional[dict]): engine factory keyword arguments
+        min_size (Optional[int]): number of engines started by warm_up [0]
+        max_size (Optional[int]): maximum number of engines, acquire waits
+            for a free engine [None = unlimited]
+        max_calls (Optional[int]): engines are restarted after this number of uses,
+            e.g. to contain memory leaks [None = never]
+        check (Optional[callable]): check(engine) returns False for dead engines,
+            idle engines are checked before use, None disables the checks [ping]
+        quit_timeout (Optional[float]): time to wait for engines to quit [10]
+    """
+
+    def __init__(self, factory=None, engine_args=(), engine_kwargs=None, min_size=0,
+                 max_size=None, max_calls=None, check=ping, quit_timeout=10):
+        if max_size is not None and max_size < max(min_size, 1):
+            raise ValueError('max_size must be at least max(min_size, 1)')
+        self.factory = start_matlab if factory is None else factory
+        self.engine_args = tuple(engine_args)
+        self.engine_kwargs = engine_kwargs or {}
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_calls = max_calls
+        self.check = check
+        self.quit_timeout = quit_timeout
+        self._idle = []
+        # id(engine): number of uses
+        self._calls = {}
+        # started and starting engines
+        self._size = 0
+        self._cond = threading.Condition()
+        self._last = threading.local()
+
+    def __repr__(self):
+        return "<{} size={} idle={}>".format(self.__class__.__name__, self._size,
+                                             len(self._idle))
+
+    @property
+    def size(self):
+        """Number of started (or starting) engines
+        """
+        return self._size
+
+    def _start(self):
+        """Start an engine for a reserved slot
+        """
+        try:
+            engine = self.factory(*self.engine_args, **self.engine_kwargs)
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        logger.debug('started MATLAB engine {}'.format(engine))
+        with self._cond:
+            self._calls[id(engine)] = 0
+        return engine
+
+    def _discard(self, engine):
+        with self._cond:
+            self._size -= 1
+            self._calls.pop(id(engine), None)
+            self._cond.notify()
+        _quit(engine, self.quit_timeout)
+
+    def acquire(self, timeout=None):
+        """Get an engine, start a new one if none is idle and the pool is not full
+
+        Raises:
+            RuntimeError: no engine available within timeout seconds
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._cond:
+                while not self._idle and self.max_size is not None and \
+                        self._size >= self.max_size:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise RuntimeError('no MATLAB engine available within {} s'.format(
+                            timeout))
+                    self._cond.wait(remaining)
+                if self._idle:
+                    # affinity: the engine this thread used last, if idle
+                    last = getattr(self._last, 'engine_id', None)
+                    for i, engine in enumerate(self._idle):
+                        if id(engine) == last:
+                            del self._idle[i]
+                            break
+                    else:
+                        engine = self._idle.pop()
+                else:
+                    # reserve the slot, start the engine outside of the lock
+                    self._size += 1
+                    engine = None
+            if engine is None:
+                engine = self._start()
+            elif self.check is not None and not self.check(engine):
+                logger.warning('MATLAB engine {} not responding, replaced'.format(engine))
+                self._discard(engine)
+                continue
+            self._last.engine_id = id(engine)
+            return engine
+
+    def release(self, engine, broken=False):
+        """Return the engine to the pool
+
+        Broken engines and engines used max_calls times are quit.
+        """
+        with self._cond:
+            self._calls[id(engine)] = self._calls.get(id(engine), 0) + 1
+            recycle = broken or (self.max_calls is not None and
+                                 self._calls[id(engine)] >= self.max_calls)
+            if not recycle:
+                self._idle.append(engine)
+                self._cond.notify()
+        if recycle:
+            logger.debug('recycling MATLAB engine {}'.format(engine))
+            self._discard(engine)
+
+    @contextmanager
+    def engine(self, timeout=None):
+        """Context manager acquiring and releasing an engine
+
+        Engines not responding after an error are quit.
+        """
+        engine = self.acquire(timeout)
+        try:
+            yield engine
+        except BaseException:
+            self.release(engine, broken=self.check is not None and not self.check(engine))
+            raise
+        self.release(engine)
+
+    def warm_up(self, size=None):
+        """Start engines (in parallel) until the pool has size engines [min_size]
+        """
+        if size is None:
+            size = self.min_size
+        with self._cond:
+            if self.max_size is not None:
+                size = min(size, self.max_size)
+            count = max(size - self._size, 0)
+            self._size += count
+        errors = []
+
+        def start():
+            try:
+                engine = self._start()
+            except Exception as error:
+                errors.append(error)
+            else:
+                self._put_idle(engine)
+
+        threads = [threading.Thread(target=start, name='MatlabStart') for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
 
-    _engine_pool = []
+    def _put_idle(self, engine):
+        with self._cond:
+            self._idle.append(engine)
+            self._cond.notify()
+
+    def close(self):
+        """Quit the idle engines
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for engine in idle:
+            self._discard(engine)
+
+
+# configuration: EnginePool of this process
+_pools = {}
+_pools_pid = [None]
+_pools_lock = threading.Lock()
+
+
+def get_engine_pool(**config):
+    """Get the process-wide pool with the given configuration (see EnginePool),
+    create it on the first request
+
+    Forked processes (e.g. executor workers) get pools of their own.
+    """
+    key = repr(sorted(config.items()))
+    with _pools_lock:
+        if _pools_pid[0] != os.getpid():
+            # engines of the parent process cannot be used
+            _pools.clear()
+            _pools_pid[0] = os.getpid()
+        if key not in _pools:
+            _pools[key] = EnginePool(**config)
+        return _pools[key]
+
+
+def warm_up_engine_pool(config=None):
+    """Start the engines of the process-wide pool, e.g. as an executor initializer
+    """
+    get_engine_pool(**(config or {})).warm_up()
+
+
+def close_engine_pools():
+    """Quit the idle engines of the process-wide pools
+    """
+    with _pools_lock:
+        pools = list(_pools.values()) if _pools_pid[0] == os.getpid() else []
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_engine_pools)
+
+
+class EngineManager(object):
+    """Matlab engine from the shared pool"""
 
     def __init__(self, engine_args=None, engine_kwargs=None):
         if engine_args is None:
@@ -25,33 +295,22 @@ class EngineManager(object):
             engine_kwargs = {}
         self.engine_args = engine_args
         self.engine_kwargs = engine_kwargs
-
-    def _new_engine(self):
-        return matlab.engine.start_matlab(*self.engine_args, **self.engine_kwargs)
+        config = {}
+        if engine_args:
+            config['engine_args'] = tuple(engine_args)
+        if engine_kwargs:
+            config['engine_kwargs'] = engine_kwargs
+        self.pool = get_engine_pool(**config)
 
     def pop(self):
-        try:
-            eng = self.__class__._engine_pool.pop()
-        except IndexError:
-            eng = self._new_engine()
-        return eng
+        return self.pool.acquire()
 
     def push(self, eng):
-        self.__class__._engine_pool.append(eng)
+        self.pool.release(eng)
 
     @classmethod
     def close_all(cls, timeout=10):
-        while cls._engine_pool:
-            eng = cls._engine_pool.pop()
-            with stopit.ThreadingTimeout(timeout) as to_ctx_mgr:
-                assert to_ctx_mgr.state == to_ctx_mgr.EXECUTING
-                try:
-                    eng.quit()
-                except Exception:
-                    # already closed or not working
-                    pass
-            if not to_ctx_mgr:
-                warn('engine {} not responding for {} seconds'.format(str(eng), timeout))
+        close_engine_pools()
 
     def __enter__(self):
         self.engine = self.pop()
@@ -63,8 +322,58 @@ class EngineManager(object):
         return exc_type is None
 
 
-class MatlabMethod(Actor):
-    def __init__(self, method_name, inports=(), outports='result'):
+def _pack_array(values):
+    """Pack the values of a batch into a MATLAB array (one value per column)
+    """
+    import matlab
+    return matlab.double(list(values))
+
+
+def _unpack(result, count):
+    """Split the result of a batch call into count values
+    """
+    if count == 1 and isinstance(result, (bool, complex, float, six.integer_types,
+                                          six.string_types)):
+        # MATLAB returns scalars for 1x1 arrays
+        return [result]
+    size = getattr(result, 'size', None)
+    if size is not None and len(size) == 2:
+        rows, columns = size
+        if rows == 1 and columns == count:
+            # row vector
+            return list(result[0])
+        if rows == count:
+            return [row[0] if columns == 1 else row for row in result]
+    values = list(result)
+    if len(values) != count:
+        raise ValueError('batch of {} values returned {} results'.format(count, len(values)))
+    return values
+
+
+class MatlabMethod(BatchMixin, Actor):
+    """Calls a MATLAB function
+
+    In the batch mode (batch_size None or > 1), queued tokens are packed into one
+    argument per input port (an array or a cell array) and passed to a single
+    call of the vectorized batch_method, which must return one value per token
+    (an array or a cell array for each output).
+
+    Args:
+        method_name (str): the function name
+        inports: input port name(s), the function arguments
+        outports: output port name(s), the function results
+        engine_pool (Optional[dict]): engine pool configuration, see EnginePool,
+            actors with the same configuration share the engines of each process
+        batch_size (Optional[int]): maximum number of tokens per call, None = any [1]
+        batch_latency (Optional[float]): maximum time to wait for a full batch [0],
+            see BatchMixin
+        batch_method (Optional[str]): the vectorized function [method_name]
+        pack (Optional[str or callable]): 'array' (matlab.double), 'cell' or pack(values)
+            returning the packed argument ['array']
+    """
+
+    def __init__(self, method_name, inports=(), outports='result', engine_pool=None,
+                 batch_size=1, batch_latency=0, batch_method=None, pack='array'):
         self.method_name = method_name
 
         super(MatlabMethod, self).__init__(name=self.method_name)
@@ -79,22 +388,64 @@ class MatlabMethod(Actor):
         for p in outports:
             self.outports.append(p)
 
-        self._engine = None
+        self.engine_pool = engine_pool or {}
+        if pack not in ('array', 'cell') and not callable(pack):
+            raise ValueError('pack must be array, cell or callable')
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.batch_method = batch_method or method_name
+        self.pack = pack
 
-    def run(self):
-        args = (port.pop() for port in self.inports)
-        func_res = self.__call__(*args)
+    def get_run_args(self):
+        kwargs = {'method_name': self.method_name,
+                  'engine_pool': self.engine_pool,
+                  'outports': tuple(self.outports.keys())}
+        if self.batched:
+            args = (self.pop_batch(), )
+            kwargs.update(batch=True, batch_method=self.batch_method, pack=self.pack)
+        else:
+            args = tuple(port.pop() for port in self.inports)
+        return args, kwargs
 
-        if len(self.outports) == 1:
+    @staticmethod
+    def run(*args, **kwargs):
+        outports = kwargs['outports']
+        nargout = {'nargout': len(outports)} if len(outports) > 1 else {}
+        if kwargs.get('batch'):
+            return MatlabMethod._run_batch(args[0], nargout, kwargs)
+        func_res = MatlabMethod._call(kwargs['method_name'], kwargs['engine_pool'], args,
+                                      nargout)
+
+        if len(outports) == 1:
             func_res = (func_res,)
 
         res = {}
-        for name, value in zip(self.outports.keys(), func_res):
+        for name, value in zip(outports, func_res):
             res[name] = value
         return res
 
+    @staticmethod
+    def _run_batch(batch, nargout, kwargs):
+        pack = kwargs['pack']
+        if pack == 'array':
+            pack = _pack_array
+        elif pack == 'cell':
+            # lists are passed as cell arrays
+            pack = list
+        packed = tuple(pack(values) for values in zip(*batch))
+        func_res = MatlabMethod._call(kwargs['batch_method'], kwargs['engine_pool'], packed,
+                                      nargout)
+        outports = kwargs['outports']
+        if len(outports) == 1:
+            func_res = (func_res,)
+        return {name: TokenBatch(_unpack(value, len(batch)))
+                for name, value in zip(outports, func_res)}
+
+    @staticmethod
+    def _call(method_name, engine_pool, args, kwargs):
+        with get_engine_pool(**engine_pool).engine() as engine:
+            mfunc = getattr(engine, method_name)
+            return mfunc(*args, **kwargs)
+
     def __call__(self, *args, **kwargs):
-        with EngineManager() as engine:
-            mfunc = getattr(engine, self.method_name)
-            res = mfunc(*args, **kwargs)
-        return res
+        return self._call(self.method_name, self.engine_pool, args, kwargs)
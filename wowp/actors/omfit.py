@@ -1,12 +1,176 @@
 """OMFIT actors
 """
 
+from wowp.artifacts import publish
 from wowp.components import Actor
+from wowp.refs import RemoteRef, resolve
+from wowp.scratch import get_scratch_pool
+from collections import Counter
+from functools import partial
+import errno
 import six
 import os
+import shutil
+import signal
+import subprocess
+import time
 from wowp.logger import logger
 
 
+# Linux ioctl creating a copy-on-write clone of a file
+_FICLONE = 0x40049409
+# minimum number of files staged by a thread pool
+_PARALLEL_STAGING = 16
+# file staging methods in the order of preference, see _stage_file
+_STAGING_METHODS = ('link', 'reflink', 'copy')
+
+
+def _reflink(source, target):
+    """Copy-on-write clone of the file (Linux), raise OSError if not supported
+    """
+    import fcntl
+
+    with open(source, 'rb') as fsrc:
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            fcntl.ioctl(fd, _FICLONE, fsrc.fileno())
+        except (IOError, OSError):
+            os.close(fd)
+            os.remove(target)
+            raise
+        os.close(fd)
+    shutil.copystat(source, target)
+
+
+def _stage_file(source, target, first='link'):
+    """Put the file into the working directory
+
+    Hard links are used if possible, reflinks or copies otherwise (e.g. across
+    file systems).
+
+    Args:
+        source (str): file name
+        target (str): file name in the working directory
+        first (Optional[str]): the first method to try, see _STAGING_METHODS
+
+    Returns:
+        str: the method used
+    """
+    methods = _STAGING_METHODS[_STAGING_METHODS.index(first):]
+    if 'link' in methods:
+        try:
+            os.link(source, target)
+            return 'link'
+        except OSError as error:
+            if error.errno in (errno.EEXIST, errno.ENOENT):
+                raise
+    if 'reflink' in methods:
+        try:
+            _reflink(source, target)
+            return 'reflink'
+        except (ImportError, IOError, OSError):
+            pass
+    shutil.copy2(source, target)
+    return 'copy'
+
+
+def _stage_files(pairs, threads=None):
+    """Stage (source, target) file pairs in parallel, see _stage_file
+
+    Methods that fail for a file are not tried again for the other files
+    from the same directory.
+
+    Args:
+        pairs (iterable): (source, target) file names
+        threads (Optional[int]): number of threads [min(32, number of files)]
+
+    Returns:
+        list: staging methods
+    """
+    pairs = list(pairs)
+    if threads is None:
+        threads = min(32, len(pairs))
+    # source directory: the first method to try
+    first = {}
+    methods = [None] * len(pairs)
+    pending = []
+    for i, (source, target) in enumerate(pairs):
+        directory = os.path.dirname(source)
+        if directory in first and threads > 1 and len(pairs) >= _PARALLEL_STAGING:
+            pending.append(i)
+        else:
+            methods[i] = first[directory] = _stage_file(source, target,
+                                                        first.get(directory, 'link'))
+
+    def stage(i):
+        source, target = pairs[i]
+        methods[i] = _stage_file(source, target, first[os.path.dirname(source)])
+
+    if pending:
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+            # raise the first error
+            list(pool.map(stage, pending))
+    logger.debug('staged {} files: {}'.format(len(pairs), dict(Counter(methods))))
+    return methods
+
+
+if six.PY2:
+    class _TimeoutExpired(Exception):
+        """subprocess.TimeoutExpired of Python 3
+        """
+
+    def _wait(proc, timeout):
+        """proc.wait(timeout) of Python 3
+        """
+        if timeout is None:
+            return proc.wait()
+        deadline = time.time() + timeout
+        while proc.poll() is None:
+            if time.time() >= deadline:
+                raise _TimeoutExpired()
+            time.sleep(0.01)
+        return proc.returncode
+
+    # the process leads its own process group (session)
+    _NEW_SESSION = {'preexec_fn': os.setsid} if os.name == 'posix' else {}
+else:
+    _TimeoutExpired = subprocess.TimeoutExpired
+
+    def _wait(proc, timeout):
+        return proc.wait(timeout=timeout)
+
+    _NEW_SESSION = {'start_new_session': os.name == 'posix'}
+
+
+def _signal_process(proc, hard):
+    """Terminate (or kill if hard) the process and the processes it started
+    """
+    if os.name == 'posix':
+        # the process leads its own process group, see _shell_run
+        try:
+            os.killpg(proc.pid, signal.SIGKILL if hard else signal.SIGTERM)
+        except OSError:
+            # all processes exited already
+            pass
+    elif hard:
+        proc.kill()
+    else:
+        proc.terminate()
+
+
+def _stop_process(proc, kill_timeout):
+    """Terminate the process, kill it if it does not exit within kill_timeout
+    """
+    _signal_process(proc, hard=False)
+    try:
+        _wait(proc, kill_timeout)
+    except _TimeoutExpired:
+        logger.warning('process {} killed'.format(proc.pid))
+        _signal_process(proc, hard=True)
+        proc.wait()
+
+
 def _shell_run(command,
                workdir,
                files_in=(),
@@ -15,48 +179,42 @@ def _shell_run(command,
                cleanup=False,
                shell='/bin/bash',
                print_output=True,
-               binary_mode=False):
-    import subprocess
+               binary_mode=False,
+               kill_timeout=5,
+               tmpdir=None):
     import tempfile
     import sys
     from tempfile import mkdtemp
     from glob import glob
-    import time
-
-    if workdir is None:
-        # TODO handle creating new workdirs
-        raise NotImplementedError()
 
-    tmpdir = mkdtemp(dir=workdir)
-    print('tmpdir: {}'.format(tmpdir))
+    if tmpdir is None:
+        if workdir is None:
+            # TODO handle creating new workdirs
+            raise NotImplementedError()
+        tmpdir = mkdtemp(dir=workdir)
+    logger.debug('tmpdir: {}'.format(tmpdir))
 
     try:
         # put everything into try - finally to clean up tmpdir
         try:
             # link all files in workdir --> should be a cheap and safe operation
-            # TODO os.link available only on Unix in 2.7 (the scipt below as well anyway)
             # link input files
             if isinstance(files_in, six.string_types):
                 files_in = (files_in, )
+            staged = []
             for glob_in in files_in:
-                print('glob_in: {}'.format(glob_in))
                 if isinstance(glob_in, six.string_types):
                     # use glob in this case, do not rename files
-                    # for in_file_name in glob(os.path.join(workdir, glob_in)):
                     for in_file_name in glob(glob_in):
-                        print('in_file_name: {}'.format(in_file_name))
-                        # source = os.path.join(workdir, os.path.basename(in_file_name))
                         source = os.path.abspath(in_file_name)
                         target = os.path.join(tmpdir, os.path.basename(in_file_name))
-                        print('link({}, {})'.format(source, target))
-                        os.link(source, target)
+                        staged.append((source, target))
                 else:
                     # do not use glob if (source, target) filenames are provided
-                    # source = os.path.join(workdir, os.path.basename(glob_in[0]))
                     source = os.path.abspath(glob_in[0])
                     target = os.path.join(tmpdir, os.path.basename(glob_in[1]))
-                    print('link("{}", "{}")'.format(source, target))
-                    os.link(source, target)
+                    staged.append((source, target))
+            _stage_files(staged)
 
         except Exception:
             logger.error('Error linking input files')
@@ -85,33 +243,27 @@ def _shell_run(command,
             else:
                 executable = shell
 
-            if timeout is None:
-                result = subprocess.call(full_command,
-                                         stdout=fout,
-                                         stderr=ferr,
-                                         executable=executable,
-                                         shell=True)
-            else:
-                maxtime = time.time() + timeout
-                proc = subprocess.Popen(full_command,
-                                        executable=executable,
-                                        stdout=fout,
-                                        stderr=ferr,
-                                        shell=True)
-                while proc.poll() is None:
-                    time.sleep(timeout * 0.01)
-                    if time.time() > maxtime:
-                        proc.terminate()
-                        if print_output:
-                            fout.seek(0)
-                            ferr.seek(0)
-                            cout = fout.read()
-                            cerr = ferr.read()
-                            sys.stdout.write(cout)
-                            sys.stderr.write(cerr)
-                        raise Exception('time out expired in {}'.format(full_command))
-
-                result = proc.returncode
+            # a new session allows to stop all the processes started by the command
+            proc = subprocess.Popen(full_command,
+                                    executable=executable,
+                                    stdout=fout,
+                                    stderr=ferr,
+                                    shell=True,
+                                    **_NEW_SESSION)
+            try:
+                result = _wait(proc, timeout)
+            except _TimeoutExpired:
+                _stop_process(proc, kill_timeout)
+                if print_output:
+                    fout.seek(0)
+                    ferr.seek(0)
+                    sys.stdout.write(fout.read())
+                    sys.stderr.write(ferr.read())
+                raise Exception('time out expired in {}'.format(full_command))
+            except BaseException:
+                # e.g. KeyboardInterrupt, do not leave the command running
+                _stop_process(proc, kill_timeout)
+                raise
 
             fout.seek(0)
             ferr.seek(0)
@@ -148,8 +300,24 @@ class FileCommand(Actor):
         shell(str): the shell path [/bin/bash]
         print_output (bool): print the std out/err [True]
         timeout (float): maximum run time for the executable
+        kill_timeout (float): time for the command to exit after being terminated
+            because of the timeout, the command is killed afterwards [5]
         cleanup (bool): cleanup temporary directories
         raise_error (bool): raise and exception in case of an error in the shell process [True]
+        artifacts (bool): output file artifacts (see wowp.artifacts) instead of paths,
+            the files are transferred only if consumed on another node [False]
+        pack_outputs (bool): transfer all the outputs at once, as a single artifact
+            of the temporary directory [False]
+        compress (bool): compress the transferred artifacts [False]
+        scratch (dict or bool): use a pool of reusable scratch directories
+            (see wowp.scratch.ScratchPool) instead of new temporary directories,
+            the dict gives the pool parameters, True means roots=[workdir] [None]
+
+    Inputs can be paths or file artifacts.
+
+    With scratch and artifacts, directories with outputs are recycled
+    once the output tokens are consumed (released by FuturesScheduler).
+    Directories with path outputs are left to the user, as without scratch.
     """
 
     def __init__(self,
@@ -164,7 +332,12 @@ class FileCommand(Actor):
                  print_output=True,
                  timeout=None,
                  cleanup=False,
-                 raise_error=True):
+                 raise_error=True,
+                 kill_timeout=5,
+                 artifacts=False,
+                 pack_outputs=False,
+                 compress=False,
+                 scratch=None):
         super(FileCommand, self).__init__(name=name)
 
         # use input and output file names as ports
@@ -201,6 +374,13 @@ class FileCommand(Actor):
         self.single_out = single_out
         self.shell = shell
         self.timeout = timeout
+        self.kill_timeout = kill_timeout
+        self.artifacts = bool(artifacts)
+        self.pack_outputs = bool(pack_outputs)
+        self.compress = bool(compress)
+        if scratch is True:
+            scratch = {'roots': [workdir]}
+        self.scratch = scratch
         self.cleanup = bool(cleanup)
         self.shell_res = bool(shell_res)
         self.raise_error = bool(raise_error)
@@ -214,7 +394,11 @@ class FileCommand(Actor):
         # for outport in self.outports:
         #     files_out.append(self.outports_map[outport.name])
         for port_name, file_name in self.inports_map.items():
-            files_in.append((os.path.abspath(self.inports[port_name].pop()), file_name))
+            source = self.inports[port_name].pop()
+            if not isinstance(source, RemoteRef):
+                source = os.path.abspath(source)
+            # artifacts are resolved by run, on the worker
+            files_in.append((source, file_name))
         for port_name, file_name in self.outports_map.items():
             files_out.append(file_name)
         args = ()
@@ -225,6 +409,11 @@ class FileCommand(Actor):
                   'shell': self.shell,
                   'single_out': self.single_out,
                   'timeout': self.timeout,
+                  'kill_timeout': self.kill_timeout,
+                  'artifacts': self.artifacts,
+                  'pack_outputs': self.pack_outputs,
+                  'compress': self.compress,
+                  'scratch': self.scratch,
                   'raise_error': self.raise_error,
                   'shell_res': self.shell_res,
                   'cleanup': self.cleanup}
@@ -234,15 +423,31 @@ class FileCommand(Actor):
     @staticmethod
     def run(*args, **kwargs):
 
+        # transfer input artifacts if necessary
+        files_in = [(resolve(source), file_name) for source, file_name in kwargs['files_in']]
+        scratch = kwargs.get('scratch')
+        pool = get_scratch_pool(**scratch) if scratch else None
+        tmpdir = pool.acquire() if pool is not None else None
+        try:
+            return FileCommand._run(files_in, tmpdir, pool, kwargs)
+        finally:
+            if pool is not None:
+                # outputs hold their own references
+                pool.release(tmpdir)
+
+    @staticmethod
+    def _run(files_in, tmpdir, pool, kwargs):
         shell_res = _shell_run(kwargs['command'],
                                kwargs['workdir'],
-                               files_in=kwargs['files_in'],
+                               files_in=files_in,
                                files_out=kwargs['outports_map'].values(),
                                timeout=kwargs['timeout'],
+                               kill_timeout=kwargs.get('kill_timeout', 5),
                                shell=kwargs['shell'],
                                print_output=True,
                                cleanup=kwargs['cleanup'],
-                               binary_mode=False)
+                               binary_mode=False,
+                               tmpdir=tmpdir)
 
         # possibly look at shell_res here (for error etc)
 
@@ -254,8 +459,28 @@ class FileCommand(Actor):
         # puth output file names into output ports
         res = {}
 
-        for port_name, file_name in kwargs['outports_map'].items():
+        outports_map = kwargs['outports_map']
+        artifacts = kwargs.get('artifacts')
+        on_release = None
+        if pool is not None and outports_map:
+            if artifacts and not kwargs['single_out']:
+                # recycle the directory once all the output tokens are released
+                pool.hold(tmpdir, 1 if kwargs['pack_outputs'] else len(outports_map))
+                on_release = partial(pool.release, tmpdir)
+            else:
+                # nested tokens are not claimed, hence never released
+                pool.detach(tmpdir)
+        if artifacts and kwargs.get('pack_outputs'):
+            directory = publish(shell_res['tmpdir'], compress=kwargs['compress'],
+                                tokens=len(outports_map), on_release=on_release)
+        for port_name, file_name in outports_map.items():
             res[port_name] = os.path.join(shell_res['tmpdir'], file_name)
+            if artifacts:
+                if kwargs['pack_outputs']:
+                    res[port_name] = directory.member_artifact(file_name)
+                else:
+                    res[port_name] = publish(res[port_name], compress=kwargs['compress'],
+                                             on_release=on_release)
         if kwargs['shell_res']:
             res['shell_res'] = shell_res
         if kwargs['single_out']:
@@ -1,5 +1,22 @@
-from . import Actor
-from ..schedulers import LinearizedScheduler
+from . import Actor, FuncActor
+from ..components import BatchMixin, TokenBatch
+from ..logger import logger
+from ..schedulers import LinearizedScheduler, _port_loads
+from ..tags import TaggedAttribute
+import locale
+import mmap
+import collections
+import operator
+import os
+import threading
+import uuid
+
+# bytes read at once by ChunkedLineReader
+_BLOCK_SIZE = 2 ** 20
+# links of the chains built by this thread, see Chain
+_chain_links = threading.local()
+# maximum number of chains whose links are kept by a thread
+_CHAIN_LINKS_SIZE = 16
 
 
 class GeneratorActor(Actor):
@@ -10,6 +27,10 @@ class GeneratorActor(Actor):
         def items(self):
             return self.iterator
 
+    def get_run_args(self):
+        # iterate pops the inputs
+        return (), {}
+
     def run(self):
         return GeneratorActor.PseudoDict(self.iterate())
 
@@ -35,6 +56,242 @@ class LineReader(GeneratorActor):
                 yield self.outport_name, line.strip()
 
 
+def _line_blocks(path, start=0, end=None, block_size=_BLOCK_SIZE, use_mmap=True):
+    """Blocks of whole lines of the file that start within the byte range [start, end)
+
+    Yields:
+        bytes: about block_size bytes ending by a newline (except the end of the file)
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if end is None or end > size:
+            end = size
+        if start >= end:
+            return
+        if use_mmap:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            def read(position, count):
+                return data[position:position + count]
+        else:
+            data = None
+
+            def read(position, count):
+                f.seek(position)
+                return f.read(count)
+
+        try:
+            position = start
+            if start > 0 and read(start - 1, 1) != b'\n':
+                # the line belongs to the previous range
+                while True:
+                    chunk = read(position, 2 ** 16)
+                    if not chunk:
+                        return
+                    newline = chunk.find(b'\n')
+                    if newline >= 0:
+                        position += newline + 1
+                        break
+                    position += len(chunk)
+                if position >= end:
+                    return
+            buf = b''
+            # file position of buf
+            buf_start = position
+            while True:
+                chunk = read(position, block_size)
+                position += len(chunk)
+                buf += chunk
+                if not chunk:
+                    # end of the file
+                    if buf:
+                        yield buf
+                    return
+                last = end - 1 - buf_start
+                if last < len(buf):
+                    # finish the line containing the last byte of the range
+                    newline = buf.find(b'\n', last)
+                    if newline >= 0:
+                        yield buf[:newline + 1]
+                        return
+                else:
+                    newline = buf.rfind(b'\n')
+                    if newline >= 0:
+                        yield buf[:newline + 1]
+                        buf = buf[newline + 1:]
+                        buf_start += newline + 1
+        finally:
+            if data is not None:
+                data.close()
+
+
+def iter_line_batches(path, batch_size=10000, start=0, end=None, strip=True, encoding=None,
+                      block_size=_BLOCK_SIZE, use_mmap=True):
+    """Read the lines of a file in batches
+
+    Only lines starting within the byte range [start, end) are read, hence
+    the ranges of shard_file can be read independently.
+    The encoding must be ASCII compatible (e.g. UTF-8, Latin-1).
+
+    Args:
+        path (str): file name
+        batch_size (int): lines per batch
+        start (Optional[int]): first byte of the range [0]
+        end (Optional[int]): end of the range [None = end of the file]
+        strip (Optional[bool]): strip the lines (like LineReader),
+            otherwise only the line ends are removed [True]
+        encoding (Optional[str]): [locale.getpreferredencoding()]
+        block_size (Optional[int]): bytes read at once [1 MiB]
+        use_mmap (Optional[bool]): read via mmap rather than buffered reads [True]
+
+    Yields:
+        list: lines (str)
+    """
+    if encoding is None:
+        encoding = locale.getpreferredencoding(False)
+    batch = []
+    for block in _line_blocks(path, start, end, block_size, use_mmap):
+        lines = block.decode(encoding).split('\n')
+        if not lines[-1]:
+            # the block ends by a newline
+            lines.pop()
+        if strip:
+            lines = [line.strip() for line in lines]
+        else:
+            lines = [line[:-1] if line.endswith('\r') else line for line in lines]
+        while lines:
+            missing = batch_size - len(batch)
+            batch.extend(lines[:missing])
+            lines = lines[missing:]
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def shard_file(path, shards, max_size=None):
+    """Split the file into byte ranges of whole lines, for parallel readers
+
+    Args:
+        path (str): file name
+        shards (int): number of ranges
+        max_size (Optional[int]): more ranges are made if needed to keep them
+            about max_size bytes at most (ranges end by whole lines) [None = unlimited]
+
+    Returns:
+        list: (path, start, end) of at most shards non-empty ranges
+    """
+    size = os.path.getsize(path)
+    if max_size is not None:
+        shards = max(shards, -(-size // max_size))
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, shards):
+            position = max(size * i // shards, bounds[-1])
+            if position >= size:
+                break
+            # move the bound after the end of the line
+            f.seek(position - 1 if position else 0)
+            f.readline()
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(path, start, end) for start, end in zip(bounds[:-1], bounds[1:]) if start < end]
+
+
+class ChunkedLineReader(Actor):
+    """Read lines of a file in batches (see iter_line_batches)
+
+    The input is a path or a (path, start, end) byte range, see FileSharder.
+    Each output token is a list of up to batch_size lines, or a block of bytes
+    of whole lines (output='bytes').
+
+    All the tokens of a file or range are the result of a single job, i.e. they
+    are held in memory at once: large files should be split by FileSharder
+    (with max_size) into ranges that fit into the memory of a worker.
+
+    Args:
+        name (str): actor name
+        inport_name (str): input port name
+        outport_name (str): output port name
+        batch_size (int): lines per token [10000]
+        output (str): 'lines' or 'bytes' ['lines']
+        strip (bool): strip the lines [True]
+        encoding (str): [locale.getpreferredencoding()]
+        block_size (int): bytes read at once (and per token for output='bytes') [1 MiB]
+        use_mmap (bool): read via mmap rather than buffered reads [True]
+    """
+
+    def __init__(self, name="chunked_line_reader", inport_name="path", outport_name="lines",
+                 batch_size=10000, output='lines', strip=True, encoding=None,
+                 block_size=_BLOCK_SIZE, use_mmap=True):
+        if output not in ('lines', 'bytes'):
+            raise ValueError('output must be lines or bytes')
+        Actor.__init__(self, name=name)
+        self.inports.append(inport_name)
+        self.outports.append(outport_name)
+        self.inport_name = inport_name
+        self.outport_name = outport_name
+        self.batch_size = batch_size
+        self.output = output
+        self.strip = strip
+        self.encoding = encoding
+        self.block_size = block_size
+        self.use_mmap = use_mmap
+
+    def get_run_args(self):
+        kwargs = {'outport_name': self.outport_name,
+                  'batch_size': self.batch_size,
+                  'output': self.output,
+                  'strip': self.strip,
+                  'encoding': self.encoding,
+                  'block_size': self.block_size,
+                  'use_mmap': self.use_mmap}
+        return (self.inports[self.inport_name].pop(), ), kwargs
+
+    @staticmethod
+    def run(source, **kwargs):
+        if isinstance(source, (tuple, list)):
+            path, start, end = source
+        else:
+            path, start, end = source, 0, None
+        if kwargs['output'] == 'bytes':
+            tokens = _line_blocks(path, start, end, kwargs['block_size'], kwargs['use_mmap'])
+        else:
+            tokens = iter_line_batches(path, kwargs['batch_size'], start, end, kwargs['strip'],
+                                       kwargs['encoding'], kwargs['block_size'],
+                                       kwargs['use_mmap'])
+        return {kwargs['outport_name']: TokenBatch(tokens)}
+
+
+class FileSharder(Actor):
+    """Split a file into (path, start, end) byte ranges of whole lines (see shard_file)
+
+    Each range is an output token, e.g. for ChunkedLineReader actors behind a Splitter.
+    max_size bounds the memory that a ChunkedLineReader needs for a range.
+    """
+
+    def __init__(self, name="file_sharder", inport_name="path", outport_name="shard",
+                 shards=2, max_size=None):
+        Actor.__init__(self, name=name)
+        self.inports.append(inport_name)
+        self.outports.append(outport_name)
+        self.inport_name = inport_name
+        self.outport_name = outport_name
+        self.shards = shards
+        self.max_size = max_size
+
+    def get_run_args(self):
+        return (self.inports[self.inport_name].pop(), ), {'outport_name': self.outport_name,
+                                                         'shards': self.shards,
+                                                         'max_size': self.max_size}
+
+    @staticmethod
+    def run(path, **kwargs):
+        return {kwargs['outport_name']: TokenBatch(shard_file(path, kwargs['shards'],
+                                                              kwargs['max_size']))}
+
+
 class IteratorActor(GeneratorActor):
     def __init__(self, name="iterator", inport_name="collection", outport_name="item"):
         Actor.__init__(self, name=name)
@@ -50,42 +307,221 @@ class IteratorActor(GeneratorActor):
 
 
 class Splitter(Actor):
+    """Distributes the input tokens among multiplicity output ports
+
+    Policies:
+        round_robin: the ports in turns
+        shortest_queue: the branch with the fewest queued tokens
+        least_loaded: the branch with the fewest queued tokens and running jobs
+        hash: hash(key(value)) % multiplicity, i.e. equal keys take the same branch
+
+    The load of a branch is that of the actors connected to the output port, as
+    reported by the scheduler (see port_loads); sequential schedulers report
+    the port buffers only. Ties are broken in turns.
+
+    Args:
+        name (str): actor name
+        inport_name (str): input port name, outputs are inport_name_1, inport_name_2, ...
+        multiplicity (int): number of output ports
+        policy (str): round_robin, shortest_queue, least_loaded or hash ['round_robin']
+        key (callable): key of the values for the hash policy [None = the value]
+    """
 
     _system_actor = True
+    _policies = ('round_robin', 'shortest_queue', 'least_loaded', 'hash')
 
-    def __init__(self, name="splitter", inport_name="in", multiplicity=2):
-        import itertools
+    def __init__(self, name="splitter", inport_name="in", multiplicity=2, policy='round_robin',
+                 key=None):
+        if policy not in self._policies:
+            raise ValueError('Unknown policy {}, use one of {}'.format(
+                policy, ', '.join(self._policies)))
         Actor.__init__(self, name=name)
         self.inport_name = inport_name
         self.multiplicity = multiplicity
+        self.policy = policy
+        self.key = key
 
         self.inports.append(inport_name)
         for i in range(1, multiplicity + 1):
             self.outports.append("%s_%d" % (inport_name, i))
 
-        self._outports_cycle = itertools.cycle(range(1, multiplicity + 1))
+        # index of the next output port in turn
+        self._next = 0
+
+    def _branch_loads(self):
+        """(queued tokens, running jobs) of each branch
+        """
+        scheduler = getattr(self, 'scheduler', None)
+        port_loads = scheduler.port_loads if scheduler is not None else _port_loads
+        loads = []
+        for outport in self.outports:
+            if outport.connections:
+                inport_loads = port_loads(outport.connections)
+                loads.append(tuple(sum(values) for values in zip(*inport_loads)))
+            else:
+                # workflow output
+                loads.append((sum(len(buffer) for buffer in outport.buffers()), 0))
+        return loads
+
+    def _select(self, value):
+        if self.policy == 'hash':
+            return hash(value if self.key is None else self.key(value)) % self.multiplicity
+        order = [(self._next + i) % self.multiplicity for i in range(self.multiplicity)]
+        if self.policy == 'round_robin':
+            selected = order[0]
+        else:
+            loads = self._branch_loads()
+            if self.policy == 'shortest_queue':
+                selected = min(order, key=lambda i: loads[i][0])
+            else:
+                selected = min(order, key=lambda i: sum(loads[i]))
+        self._next = selected + 1
+        return selected
 
     def run(self, *args, **kwargs):
         value = kwargs[self.inport_name]
-        i = next(self._outports_cycle)
-        outport = "%s_%d" % (self.inport_name, i)
+        outport = "%s_%d" % (self.inport_name, self._select(value) + 1)
         return {outport: value}
 
-        # TODO: Add SequentialMerger
-        # TODO: Add RandomMerger
 
+class Merger(Actor):
+    """Forwards the tokens of all input ports as soon as they arrive (unordered fan-in)
+
+    Unlike DictionaryMerge or Concat, it does not wait for a token on every port.
+    The input ports are outport_name_1, outport_name_2, ... (cf. Splitter).
+
+    Args:
+        name (str): actor name
+        outport_name (str): output port name
+        multiplicity (int): number of input ports
+    """
+
+    _system_actor = True
+
+    def __init__(self, name="merger", outport_name="out", multiplicity=2):
+        Actor.__init__(self, name=name)
+        self.outport_name = outport_name
+        self.multiplicity = multiplicity
+
+        for i in range(1, multiplicity + 1):
+            self.inports.append("%s_%d" % (outport_name, i))
+        self.outports.append(outport_name)
+
+    def can_run(self):
+        return any(port.buffer for port in self.inports)
+
+    def get_run_args(self):
+        tokens = []
+        for port in self.inports:
+            tokens.extend(port.pop_all())
+        return (), {'tokens': tokens, 'outport_name': self.outport_name}
+
+    @staticmethod
+    def run(tokens, outport_name):
+        return {outport_name: TokenBatch(tokens)}
 
-class Chain(Actor):
+
+class OrderedMerger(Merger):
+    """Forwards the tokens of all input ports in the order of their sequence numbers
+
+    Tokens wait in the port buffers until those with all the lower sequence
+    numbers (from start on) have been forwarded. If more than max_pending tokens
+    wait, the lowest ones are forwarded regardless of the gaps. The waiting tokens
+    are forwarded in order when no other tokens can arrive (see flush).
+    Tokens with sequence numbers that were forwarded or skipped already are
+    forwarded immediately.
+
+    Args:
+        name (str): actor name
+        outport_name (str): output port name
+        multiplicity (int): number of input ports
+        key (callable): sequence number of a token [token[0], e.g. for (number, value) tokens]
+        start (int): first sequence number [0]
+        max_pending (int): maximum number of waiting tokens [None = unbounded]
+    """
+
+    # sequence number of the next token to forward
+    _next_key = TaggedAttribute('_next_key')
+    _flushing = TaggedAttribute('_flushing', False)
+
+    def __init__(self, name="ordered_merger", outport_name="out", multiplicity=2, key=None,
+                 start=0, max_pending=None):
+        super(OrderedMerger, self).__init__(name=name, outport_name=outport_name,
+                                            multiplicity=multiplicity)
+        self.key = key if key is not None else operator.itemgetter(0)
+        self.start = start
+        self.max_pending = max_pending
+
+    def pending(self):
+        """Number of waiting tokens
+        """
+        return sum(len(port.buffer) for port in self.inports)
+
+    def can_run(self):
+        pending = self.pending()
+        if not pending:
+            return False
+        if self._flushing or (self.max_pending is not None and pending > self.max_pending):
+            return True
+        next_key = self.start if self._next_key is None else self._next_key
+        return any(self.key(token) <= next_key for port in self.inports for token in port.buffer)
+
+    def flush_deadline(self):
+        """The waiting tokens run when no other tokens can arrive (see BatchMixin)
+        """
+        return float('inf') if self.pending() else None
+
+    def flush(self):
+        """Forward all waiting tokens on the next run
+        """
+        self._flushing = True
+
+    def get_run_args(self):
+        keyed = []
+        for port in self.inports:
+            keyed.extend((self.key(token), token) for token in port.pop_all())
+        keyed.sort(key=operator.itemgetter(0))
+        next_key = self.start if self._next_key is None else self._next_key
+        tokens = []
+        i = 0
+        while i < len(keyed):
+            key = keyed[i][0]
+            if key > next_key:
+                if not (self._flushing or (self.max_pending is not None and
+                                           len(keyed) - i > self.max_pending)):
+                    break
+                logger.debug('{}: sequence numbers {} to {} skipped'.format(
+                    self.name, next_key, key - 1))
+                next_key = key
+            tokens.append(keyed[i][1])
+            next_key = max(next_key, key + 1)
+            i += 1
+        self._next_key = next_key
+        self._flushing = False
+        # the others keep waiting
+        self.inports.at(0).buffer.extend(token for key, token in keyed[i:])
+        return (), {'tokens': tokens, 'outport_name': self.outport_name}
+
+
+class Chain(BatchMixin, Actor):
     """Chain of actors.
 
     Each of the chain link has to have just one input & output port (to be changed)
+
+    The links are built once per thread of each process and reused for all tokens,
+    threads keep the links of the recently used chains only.
+    Chains of FuncActor links are composed into a single call, other links are run
+    by a LinearizedScheduler. In the batch mode (batch_size None or > 1), the chain
+    is traversed once per batch of tokens (see BatchMixin).
     """
 
-    def __init__(self, name, actor_generators, **kwargs):
+    def __init__(self, name, actor_generators, batch_size=1, batch_latency=0, **kwargs):
         """
 
         :param name:
         :param actor_generators: iterable of actor classes or generators
+        :param batch_size: maximum number of tokens per run
+        :param batch_latency: maximum time to wait for a full batch
         :param kwargs:
         :return:
         """
@@ -96,14 +532,22 @@ class Chain(Actor):
         self.inports.append("inp")
         self.outports.append("out")
         self.actor_generators = actor_generators
+        # identifies the links built by workers
+        self.chain_id = uuid.uuid4().hex
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
 
     def get_run_args(self):
-        return (self.inports["inp"].pop(), ), {"generators": self.actor_generators}
+        kwargs = {"generators": self.actor_generators, "chain_id": self.chain_id}
+        if self.batched:
+            kwargs["batch"] = True
+            return (self.pop_columns()[0], ), kwargs
+        return (self.inports["inp"].pop(), ), kwargs
 
     @staticmethod
-    def run(*args, **kwargs):
-        input = args[0]
-        actor_generators = kwargs.pop("generators")
+    def _build(actor_generators):
+        """Links and the scheduler running them, None for composed FuncActor calls
+        """
         actors = []
         for generator in actor_generators:
             actor = generator()
@@ -113,8 +557,47 @@ class Chain(Actor):
                 inport = actor.inports.at(0)
                 inport += actors[-1].outports.at(0)
             actors.append(actor)
+        if all(isinstance(actor, FuncActor) and not actor.vectorized for actor in actors):
+            return actors, None
+        return actors, LinearizedScheduler()
+
+    @staticmethod
+    def _links(chain_id, actor_generators):
+        links = getattr(_chain_links, 'links', None)
+        if links is None:
+            links = _chain_links.links = collections.OrderedDict()
+        if chain_id in links:
+            # the most recently used
+            chain_links = links[chain_id] = links.pop(chain_id)
+            return chain_links
+        while len(links) >= _CHAIN_LINKS_SIZE:
+            # the least recently used, e.g. of finished workflow runs
+            links.popitem(last=False)
+        chain_links = links[chain_id] = Chain._build(actor_generators)
+        return chain_links
 
-        scheduler = LinearizedScheduler()
-        scheduler.put_value(actors[0].inports.at(0), input)
-        scheduler.execute()
-        return {"out": actors[-1].outports.at(0).pop()}
+    @staticmethod
+    def run(*args, **kwargs):
+        batch = kwargs.get("batch", False)
+        inputs = args[0] if batch else (args[0], )
+        chain_id = kwargs["chain_id"]
+        actors, scheduler = Chain._links(chain_id, kwargs["generators"])
+        if scheduler is None:
+            outputs = []
+            for value in inputs:
+                for actor in actors:
+                    value = actor(value)
+                outputs.append(value)
+        else:
+            try:
+                for value in inputs:
+                    scheduler.put_value(actors[0].inports.at(0), value)
+                scheduler.execute()
+                outputs = list(actors[-1].outports.at(0).pop_all())
+            except Exception:
+                # the links may keep tokens of the failed run
+                _chain_links.links.pop(chain_id, None)
+                raise
+        if batch:
+            return {"out": TokenBatch(outputs)}
+        return {"out": outputs[0]}
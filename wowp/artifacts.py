@@ -0,0 +1,342 @@
+"""File artifacts: files and directories kept on the node that produced them
+
+Actors (e.g. FileCommand(artifacts=True)) return FileArtifact tokens instead of
+paths. An artifact records the node and the path of the file (or directory). Its
+content is transferred only when a consumer on another node resolves it (resolve,
+os.fspath or open), directly from the process that published it. Directories are
+transferred as a single tar stream, optionally compressed.
+
+Files on the same node or under shared roots (a file system mounted on all the
+nodes) are used in place.
+
+Once all the tokens claimed by the scheduler (FuturesScheduler) are dropped,
+the publishing process is notified (see publish(on_release=...)), e.g. to
+recycle the scratch directory. Transferred copies are removed once the consumer
+process drops all the artifacts that resolved them (or at its exit), unless
+they were taken (see FileArtifact.take).
+
+Environment variables:
+    WOWP_NODE: node identifier [host name]
+    WOWP_ARTIFACT_HOST: address of this node for the other nodes [host name]
+    WOWP_SHARED_ROOTS: directories shared by all nodes, separated by os.pathsep
+    WOWP_SCRATCH: directory for transferred artifacts [temporary directory]
+
+Artifacts are served to anyone knowing their (random) keys, the server listens
+on all interfaces.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import atexit
+import gzip
+import os
+import shutil
+import socket
+import tarfile
+import tempfile
+import threading
+import uuid
+from contextlib import closing
+
+from six.moves import socketserver
+
+from .logger import logger
+from .refs import RemoteRef
+
+__all__ = ["FileArtifact", "publish", "node_id", "shared_roots"]
+
+# key: [path, compress, tokens, on_release] of artifacts published by this process
+_published = {}
+_published_lock = threading.Lock()
+# (pid, server) of this process
+_server = [None, None]
+_server_lock = threading.Lock()
+# key: [local path, temporary directory, resolved artifacts, taken] of artifacts
+# transferred to this process
+_fetched = {}
+# key: threading.Event set when the transfer in progress finishes
+_fetching = {}
+_fetch_lock = threading.Lock()
+
+
+def node_id():
+    """Identifier of this node
+    """
+    return os.environ.get('WOWP_NODE') or socket.gethostname()
+
+
+def shared_roots():
+    """Directories shared by all nodes
+    """
+    roots = os.environ.get('WOWP_SHARED_ROOTS', '')
+    return [os.path.abspath(root) for root in roots.split(os.pathsep) if root]
+
+
+def _is_shared(path):
+    return any(path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+               for root in shared_roots())
+
+
+class _ArtifactHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        key = self.rfile.readline().strip().decode('ascii')
+        if key.startswith('!'):
+            _release(key[1:])
+            self.wfile.write(b'+')
+            return
+        try:
+            path, compress = _published[key][:2]
+        except KeyError:
+            self.wfile.write(b'-')
+            return
+        self.wfile.write(b'+')
+        if os.path.isdir(path):
+            with tarfile.open(fileobj=self.wfile, mode='w|gz' if compress else 'w|') as tar:
+                tar.add(path, arcname='.')
+        elif compress:
+            with open(path, 'rb') as f, gzip.GzipFile(fileobj=self.wfile, mode='wb') as out:
+                shutil.copyfileobj(f, out)
+        else:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, self.wfile)
+
+
+class _ArtifactServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _address():
+    """(host, port) of this process' artifact server, started on the first call
+    """
+    with _server_lock:
+        # forked processes need their own server
+        if _server[0] != os.getpid():
+            server = _ArtifactServer(('', 0), _ArtifactHandler)
+            thread = threading.Thread(target=server.serve_forever, name='ArtifactServer')
+            thread.daemon = True
+            thread.start()
+            _server[:] = [os.getpid(), server]
+            logger.debug('artifact server listening on port {}'.format(
+                server.server_address[1]))
+        host = os.environ.get('WOWP_ARTIFACT_HOST') or socket.gethostname()
+        return host, _server[1].server_address[1]
+
+
+def publish(path, compress=False, tokens=1, on_release=None):
+    """Make the file or directory available to other nodes
+
+    Args:
+        path (str): file or directory
+        compress (Optional[bool]): compress the transferred data (gzip) [False]
+        tokens (Optional[int]): number of claimed tokens (e.g. member artifacts)
+            that must be released before the artifact is withdrawn [1]
+        on_release (Optional[callable]): called without arguments once the artifact
+            is withdrawn
+
+    Returns:
+        FileArtifact
+    """
+    path = os.path.abspath(path)
+    key = uuid.uuid4().hex
+    with _published_lock:
+        _published[key] = [path, compress, tokens, on_release]
+    return FileArtifact(node_id(), path, _address(), key,
+                        is_dir=os.path.isdir(path), compress=compress)
+
+
+def _drop_fetched(key):
+    """Drop a reference to the transferred copy, remove the copy with the last one
+    """
+    with _fetch_lock:
+        entry = _fetched.get(key)
+        if entry is None:
+            return
+        entry[2] -= 1
+        if entry[2] > 0 or entry[3]:
+            return
+        del _fetched[key]
+    logger.debug('removing transferred copy {}'.format(entry[0]))
+    shutil.rmtree(entry[1], ignore_errors=True)
+
+
+@atexit.register
+def _remove_fetched():
+    """Remove the transferred copies that were not taken
+    """
+    with _fetch_lock:
+        directories = [entry[1] for entry in _fetched.values() if not entry[3]]
+        _fetched.clear()
+    for directory in directories:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _release(key):
+    """Release a token of the artifact published by this process
+    """
+    with _published_lock:
+        entry = _published.get(key)
+        if entry is None:
+            return
+        entry[2] -= 1
+        if entry[2] > 0:
+            return
+        del _published[key]
+    logger.debug('artifact {} released'.format(entry[0]))
+    if entry[3] is not None:
+        entry[3]()
+
+
+class FileArtifact(RemoteRef):
+    """File or directory on the node that produced it, see publish
+
+    Resolving gives a local path, transferring the content if necessary.
+    Artifacts are path-like, i.e. open(artifact) works.
+
+    Args:
+        node (str): node identifier
+        path (str): path on the node
+        address (tuple): (host, port) of the artifact server
+        key (str): key of the artifact on the server
+        is_dir (Optional[bool]): the artifact is a directory
+        compress (Optional[bool]): the server compresses the data
+        member (Optional[str]): the artifact is this file in the directory
+    """
+
+    def __init__(self, node, path, address, key, is_dir=False, compress=False, member=None):
+        self.node = node
+        self.path = path
+        self.address = tuple(address)
+        self.key = key
+        self.is_dir = is_dir
+        self.compress = compress
+        self.member = member
+        self._owner = False
+        # holds a reference to the transferred copy
+        self._fetched = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # copies never release the artifact nor the transferred copy
+        state['_owner'] = False
+        state['_fetched'] = False
+        return state
+
+    def __repr__(self):
+        path = self.path if self.member is None else os.path.join(self.path, self.member)
+        return "<{} {}:{}>".format(self.__class__.__name__, self.node, path)
+
+    def member_artifact(self, name):
+        """Artifact of a file in this directory artifact
+
+        All members are transferred at once, with the directory.
+        """
+        return FileArtifact(self.node, self.path, self.address, self.key, is_dir=self.is_dir,
+                            compress=self.compress, member=name)
+
+    def resolve(self):
+        """Local path of the artifact
+        """
+        if self.node == node_id() or _is_shared(self.path):
+            root = self.path
+        else:
+            root = self._fetched_path()
+        return root if self.member is None else os.path.join(root, self.member)
+
+    def _fetched_path(self):
+        """Local path of the transferred copy, transfer the artifact if necessary
+
+        The lock is not held during the transfer, other threads transferring
+        the same artifact wait for it.
+        """
+        while True:
+            with _fetch_lock:
+                entry = _fetched.get(self.key)
+                if entry is not None:
+                    if not self._fetched:
+                        entry[2] += 1
+                        self._fetched = True
+                    return entry[0]
+                event = _fetching.get(self.key)
+                transfer = event is None
+                if transfer:
+                    event = _fetching[self.key] = threading.Event()
+            if not transfer:
+                # try again if the transfer failed
+                event.wait()
+                continue
+            try:
+                path, directory = self._fetch()
+                with _fetch_lock:
+                    _fetched[self.key] = [path, directory, 0, False]
+            finally:
+                with _fetch_lock:
+                    del _fetching[self.key]
+                event.set()
+
+    __fspath__ = resolve
+
+    def claim(self):
+        self._owner = True
+
+    def take(self):
+        """Local path of the artifact, the files (and transferred copies) are never released
+        """
+        self._owner = False
+        path = self.resolve()
+        with _fetch_lock:
+            if self.key in _fetched:
+                _fetched[self.key][3] = True
+        return path
+
+    def __del__(self):
+        if getattr(self, '_fetched', False):
+            try:
+                _drop_fetched(self.key)
+            except Exception:
+                pass
+        if getattr(self, '_owner', False):
+            try:
+                if self.key in _published:
+                    _release(self.key)
+                else:
+                    with closing(socket.create_connection(self.address)) as sock:
+                        sock.sendall(b'!' + self.key.encode('ascii') + b'\n')
+                        sock.recv(1)
+            except Exception:
+                pass
+
+    def _fetch(self):
+        """Transfer the artifact, returns (local path, temporary directory)
+        """
+        scratch = os.environ.get('WOWP_SCRATCH') or None
+        directory = tempfile.mkdtemp(prefix='wowp-artifact-', dir=scratch)
+        try:
+            return self._transfer(directory), directory
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+    def _transfer(self, directory):
+        """Transfer the artifact into the directory, returns the local path
+        """
+        logger.debug('fetching {} from {}'.format(self, self.address))
+        with closing(socket.create_connection(self.address)) as sock:
+            sock.sendall(self.key.encode('ascii') + b'\n')
+            with closing(sock.makefile('rb')) as stream:
+                if stream.read(1) != b'+':
+                    raise IOError('{} not available from {}'.format(self, self.address))
+                if self.is_dir:
+                    with tarfile.open(fileobj=stream, mode='r|*') as tar:
+                        if hasattr(tarfile, 'data_filter'):
+                            tar.extractall(directory, filter='data')
+                        else:
+                            tar.extractall(directory)
+                    return directory
+                target = os.path.join(directory, os.path.basename(self.path))
+                with open(target, 'wb') as f:
+                    if self.compress:
+                        with gzip.GzipFile(fileobj=stream, mode='rb') as source:
+                            shutil.copyfileobj(source, f)
+                    else:
+                        shutil.copyfileobj(stream, f)
+                return target
@@ -3,14 +3,16 @@ from .util import ListDict, deprecated, abstractmethod
 from collections import deque
 from .logger import logger
 from .schedulers import LinearizedScheduler
-import networkx as nx
+from .tags import current_tag, _context, TaggedAttribute
 import functools
+import time
 import keyword
 from warnings import warn
 import future
 from future.builtins import super
 
-__all__ = "Component", "Actor", "Workflow", "Composite", "draw_graph"
+__all__ = ("Component", "Actor", "Workflow", "Composite", "draw_graph", "iter_components",
+           "TokenBatch", "BatchMixin")
 
 
 class NoValue(object):
@@ -33,6 +35,12 @@ class Component(object):
     """Base WOWP component class
     """
 
+    # (connections version, graph) built by the graph property
+    _graph_cache = None
+    # resource requirements, e.g. {'cores': 2, 'memory': 4e9, 'licence': 1},
+    # None means wowp.resources.DEFAULT_REQUIREMENTS
+    resources = None
+
     def __init__(self, name=None):
         if name is None:
             name = self.__class__.__name__.lower()
@@ -99,49 +107,51 @@ class Component(object):
         """Put outputs to ports, specified by port_name, value pairs
         """
         for port_name, value in kwargs.items():
-            self.outports[port_name].put(value)
+            for token in iter_tokens(value):
+                self.outports[port_name].put(token)
+
+    def discard_tag(self, tag):
+        """Drop the tokens and the actor state (see wowp.tags) of the tag
+        """
+        self.__dict__.get('_tagged_state', {}).pop(tag, None)
+        for ports in (self.inports, self.outports):
+            for port in ports:
+                port.discard_tag(tag)
 
     @property
     def graph(self):
         """Construct NetworX call graph
-        """
-        return build_nx_graph(self)
 
-    # TODO create workflow (composite) from actor's connections
+        The graph is cached until any port is (dis)connected.
+        """
+        version = Port.connections_version()
+        if self._graph_cache is None or self._graph_cache[0] != version:
+            self._graph_cache = (version, build_nx_graph(self))
+        return self._graph_cache[1]
 
     def get_workflow(self, name=None):
         """Creates a workflow form actor's connections
         """
 
-        graph = self.graph
-        if hasattr(graph, "out_degree_iter"):    # Old networkx
-            leaves_out = [n for n, d in graph.out_degree_iter() if d == 0]
-            leaves_in = [n for n, d in graph.in_degree_iter() if d == 0]
-        else:
-            leaves_out = [n for n, d in graph.out_degree if d == 0]
-            leaves_in = [n for n, d in graph.in_degree if d == 0]
-
         workflow = Workflow(name=name)
 
-        for node in (graph.node[n] for n in leaves_in):
-            if isinstance(node['ref'], Component):
+        for component in iter_components(self):
+            inports = component.inports.values()
+            outports = component.outports.values()
+            if not inports:
                 warn('Component without any input: {} ({})'.format(
-                    node['ref'].name, node['ref']))
-            elif isinstance(node['ref'], InPort):
-                workflow.add_inport(node['ref'])
-            else:
-                raise Exception('{} cannot be an input port'.format(node['ref']))
-
-        for node in (graph.node[n] for n in leaves_out):
-            if isinstance(node['ref'], Component):
-                if not node['ref'].system_actor:
+                    component.name, component))
+            for port in inports:
+                if not port.connections:
+                    workflow.add_inport(port)
+            if not outports:
+                if not getattr(component, 'system_actor', False):
                     # system actors can be designed not to have outports, e.g. Sink
                     warn('Component without any output: {} ({})'.format(
-                        node['ref'].name, node['ref']))
-            elif isinstance(node['ref'], OutPort):
-                workflow.add_outport(node['ref'])
-            else:
-                raise Exception('{} cannot be an output port'.format(node['ref']))
+                        component.name, component))
+            for port in outports:
+                if not port.connections:
+                    workflow.add_outport(port)
 
         return workflow
 
@@ -171,6 +181,141 @@ class Actor(Component):
     def system_actor(self):
         return getattr(self, '_system_actor', False)
 
+    @property
+    def async_actor(self):
+        """True if the actor starts its jobs in the scheduler's process by submit_async,
+        which returns a concurrent.futures.Future (e.g. ShellRunner with a pool)
+        """
+        return getattr(self, '_async_actor', False)
+
+
+class TokenBatch(list):
+    """Several tokens of an output port produced by one actor firing
+
+    Schedulers put the tokens into the port one by one, in order.
+    """
+
+
+def iter_tokens(value):
+    """Tokens of an output value (see TokenBatch)
+    """
+    if isinstance(value, TokenBatch):
+        return iter(value)
+    return (value, )
+
+
+class BatchMixin(object):
+    """Actors firing once for up to batch_size queued sets of input tokens
+
+    The actor can run once batch_size token sets are queued (None = any number),
+    or batch_latency seconds after the first of them arrived (0 = run with whatever
+    is queued, None = only when no other tokens can arrive).
+    The schedulers flush incomplete batches after batch_latency and when no other
+    tokens can arrive, using flush_deadline and flush.
+
+    By default, run gets lists of the values of each input port as keyword
+    arguments and should return TokenBatch outputs, one token per input set, e.g.
+
+        class Square(BatchMixin, Actor):
+            batch_size = 100
+            batch_latency = 0.1
+
+            def __init__(self):
+                super(Square, self).__init__()
+                self.inports.append('x')
+                self.outports.append('y')
+
+            @staticmethod
+            def run(x):
+                return {'y': TokenBatch(value ** 2 for value in x)}
+    """
+
+    batch_size = 1
+    batch_latency = 0
+    # time when the first queued set of tokens arrived
+    _batch_since = TaggedAttribute('_batch_since')
+    _batch_flush = TaggedAttribute('_batch_flush', False)
+
+    @property
+    def batched(self):
+        """True if the actor fires for batches (batch_size is None or > 1)
+        """
+        return self.batch_size is None or self.batch_size > 1
+
+    def queued(self):
+        """Number of complete sets of input tokens
+        """
+        if not len(self.inports):
+            return 0
+        return min(len(port.buffer) for port in self.inports)
+
+    def can_run(self):
+        if not self.batched:
+            return super(BatchMixin, self).can_run()
+        queued = self.queued()
+        if not queued:
+            return False
+        if self._batch_flush or (self.batch_size is not None and queued >= self.batch_size):
+            return True
+        if self._batch_since is None:
+            self._batch_since = time.time()
+        if self.batch_latency is None:
+            return False
+        return time.time() - self._batch_since >= self.batch_latency
+
+    def flush_deadline(self):
+        """Time when the queued tokens run even if the batch is incomplete,
+        None if no batch is waiting
+        """
+        if not self.batched or self._batch_since is None or not self.queued():
+            return None
+        if self.batch_latency is None:
+            return float('inf')
+        return self._batch_since + self.batch_latency
+
+    def flush(self):
+        """Let the actor run with an incomplete batch
+        """
+        self._batch_flush = True
+
+    def get_run_args(self, check_connected=False):
+        """Lists of up to batch_size values of the input ports as keyword arguments
+        """
+        if not self.batched:
+            return super(BatchMixin, self).get_run_args(check_connected)
+        columns = self.pop_columns()
+        return (), {port.name: values for port, values in zip(self.inports, columns)}
+
+    def pop_batch(self):
+        """Pop up to batch_size sets of input tokens
+
+        Returns:
+            list: tuples of values in the order of the input ports
+        """
+        return list(zip(*self.pop_columns()))
+
+    def pop_columns(self):
+        """Pop up to batch_size sets of input tokens
+
+        Returns:
+            list: lists of values of the input ports
+        """
+        count = self.queued()
+        if self.batch_size is not None:
+            count = min(count, max(self.batch_size, 1))
+        columns = []
+        for port in self.inports:
+            buffer = port.buffer
+            if count == len(buffer):
+                values = list(buffer)
+                buffer.clear()
+            else:
+                values = [buffer.popleft() for _ in range(count)]
+            columns.append(values)
+        self._batch_flush = False
+        self._batch_since = time.time() if self.queued() else None
+        return columns
+
 
 class Composite(Component):
     """Composite = a group of actors
@@ -266,6 +411,8 @@ class Ports(object):
     def __setitem__(self, key, value):
         # must be implemented for +=, -= operators
         # TODO add security
+        if self._ports.get(key) is not value:
+            Port._connections_changed()
         self._ports[key] = value
 
     def __str__(self):
@@ -278,12 +425,14 @@ class Ports(object):
         self._ports.insert_after(
             existing_port_name,
             (new_port_name, self.__new_port(new_port_name, port_class=port_class)))
+        Port._connections_changed()
 
     def append(self, new_port_name, replace_existing=False, port_class=None, **kwargs):
         if not replace_existing and new_port_name in self._ports:
             raise Exception('Port {} already exists'.format(new_port_name))
         self._ports[new_port_name] = self.__new_port(new_port_name, port_class=port_class,
                                                      **kwargs)
+        Port._connections_changed()
 
     def keys(self):
         return list(self._ports.keys())
@@ -298,13 +447,42 @@ class Port(object):
     """Represents a single input/output actor port
     """
 
+    # incremented on any change of connections, used to invalidate cached graphs
+    _connections_version = 0
+
     def __init__(self, name, owner):
         assert is_valid_port_name(name)
         self.name = name
         self.owner = owner
-        self.buffer = deque()
+        # tag: buffer, see wowp.tags
+        self._buffers = {}
         self._connections = []
 
+    @property
+    def buffer(self):
+        """Buffer of the current tag
+        """
+        try:
+            # inlined current_tag, this is a hot path
+            return self._buffers[_context.tag]
+        except KeyError:
+            buffer = self._buffers[_context.tag] = deque()
+            return buffer
+
+    @buffer.setter
+    def buffer(self, value):
+        self._buffers[current_tag()] = value
+
+    def buffers(self):
+        """Buffers of all tags
+        """
+        return list(self._buffers.values())
+
+    def discard_tag(self, tag):
+        """Drop the buffer of the tag
+        """
+        self._buffers.pop(tag, None)
+
     @property
     def default(self):
         if has_value(self._default):
@@ -324,6 +502,16 @@ class Port(object):
     def connections(self):
         return self._connections
 
+    @staticmethod
+    def connections_version():
+        """Counter of connection changes in all ports
+        """
+        return Port._connections_version
+
+    @staticmethod
+    def _connections_changed():
+        Port._connections_version += 1
+
     def is_connected_to(self, other):
         return self in other.connections
 
@@ -337,6 +525,7 @@ class Port(object):
             self._connections.append(other)
             # TODO this creates a circular reference - is it a good idea?
             other._connections.append(self)
+            self._connections_changed()
         else:
             logger.warn('connecting an already connected actor {}'.format(
                 other))
@@ -350,10 +539,7 @@ class Port(object):
     def isempty(self):
         """True if the port buffer is empty
         """
-        if self.buffer:
-            return False
-        else:
-            return True
+        return not self.buffer
 
     def isconnected(self):
         return bool(self._connections)
@@ -364,22 +550,23 @@ class Port(object):
         else:
             other._connections.remove(self)
             self._connections.remove(other)
+            self._connections_changed()
 
     def pop(self):
         """Get single input
         """
-        if self.buffer:
+        buffer = self.buffer
+        if buffer:
             # input item is in the buffer
-            return self.buffer.popleft()
+            return buffer.popleft()
         else:
             raise IndexError('Port buffer is empty')
 
     def pop_all(self):
         """Get all values
         """
-        values = self.buffer
-        self.buffer = deque()
-        return values
+        values = self._buffers.pop(current_tag(), None)
+        return deque() if values is None else values
 
     @abstractmethod
     def put(self, value):
@@ -397,6 +584,11 @@ class OutPort(Port):
         """
         self.buffer.append(value)
 
+    def put_values(self, values):
+        """Put several output values at once, see put
+        """
+        self.buffer.extend(values)
+
 
 class InPort(Port):
     """A single, named input port
@@ -429,6 +621,15 @@ class InPort(Port):
         self.buffer.append(value)
         return self.owner.can_run()
 
+    def put_values(self, values):
+        """Put several inputs at once, the actor readiness is checked only once
+
+        :rtype: bool
+        :return: Whether the actor is ready to perform
+        """
+        self.buffer.extend(values)
+        return self.owner.can_run()
+
 
 class FrozenInPort(InPort):
     """A single, named input port with frozen first input
@@ -476,6 +677,17 @@ class FrozenInPort(InPort):
         self._last_value = value
         return self.owner.can_run()
 
+    def put_values(self, values):
+        """Put the only input value
+
+        :rtype: bool
+        :return: Whether the actor is ready to perform
+        """
+        should_run = False
+        for value in values:
+            should_run = self.put(value)
+        return should_run
+
 
 def is_valid_port_name(name):
     """Validate port name
@@ -493,6 +705,36 @@ def is_valid_componenet_name(name):
     return True
 
 
+def iter_components(component):
+    """Iterate over all components reachable from component.
+
+    It walks over all connections (in both directions) and port owners.
+    The walk is iterative and each component is yielded exactly once.
+    """
+    seen = {id(component)}
+    queue = deque((component, ))
+    while queue:
+        current = queue.popleft()
+        yield current
+        for ports in (current.inports, current.outports):
+            for port in ports.values():
+                owner = port.owner
+                if owner is not current and id(owner) not in seen:
+                    seen.add(id(owner))
+                    queue.append(owner)
+                for other in port._connections:
+                    owner = other.owner
+                    if id(owner) not in seen:
+                        seen.add(id(owner))
+                        queue.append(owner)
+
+
+def graph_node_name(obj):
+    """Unique graph node name of a component or a port
+    """
+    return str(id(obj))
+
+
 def build_nx_graph(actor):
     """Create graph with all actors + ports as nodes.
 
@@ -501,60 +743,40 @@ def build_nx_graph(actor):
     Prerequisities:
     * networkx package
     """
-    actors = []
-    edges = []
-    ports = []
+    # networkx is slow to import and only needed for graphs
+    import networkx as nx
     graph = nx.DiGraph()
+    port_ids = set()
+
+    def _add_port_node(port, connected_color, terminal_color):
+        if id(port) in port_ids:
+            return
+        port_ids.add(id(port))
+        attrs = {}
+        if not port.connections:
+            # terminal node
+            attrs["style"] = "filled"
+            attrs["color"] = terminal_color
+        else:
+            attrs["color"] = connected_color
+        graph.add_node(graph_node_name(port), type='port', ref=port,
+                       label=port.name, **attrs)
 
-    def _get_name(obj):
-        return str(hash(obj))
-
-    def _add_actor_node(actor):
-        attrs = {"fontsize": "12", "color": "#0093d0"}
+    for component in iter_components(actor):
+        name = graph_node_name(component)
         # TODO use wekreds for ref
-        graph.add_node(_get_name(actor), type='actor', ref=actor, label=actor.name,
-                       shape="box", **attrs)
-        actors.append(actor)
-
-    def _walk_node(actor):
-        name = _get_name(actor)
-        if actor not in actors:
-            _add_actor_node(actor)
-        for port in actor.outports:
-            if port not in ports:
-                attrs = {}
-                if not port.connections:
-                    # terminal node
-                    attrs["style"] = "filled"
-                    attrs["color"] = "#ef4135"
-                else:
-                    attrs["color"] = "#ffe28a"
-                graph.add_node(_get_name(port), type='port', ref=port,
-                               label=port.name, **attrs)
-                graph.add_edge(name, _get_name(port))
-            for other in port.connections:
-                if (port, other) not in edges:
-                    edges.append((port, other))
-                    _walk_node(other.owner)
-                    graph.add_edge(_get_name(port), _get_name(other))
-        for port in actor.inports:
-            if port not in ports:
-                attrs = {}
-                if not port.connections:
-                    # terminal node
-                    attrs["style"] = "filled"
-                    attrs["color"] = "#ADFF2F"
-                else:
-                    attrs["color"] = "#9ed8f5"
-                graph.add_node(_get_name(port), type='port', ref=port,
-                               label=port.name, **attrs)
-                graph.add_edge(_get_name(port), name, )
-                ports.append(port)
+        graph.add_node(name, type='actor', ref=component, label=component.name,
+                       shape="box", fontsize="12", color="#0093d0")
+        for port in component.outports:
+            _add_port_node(port, "#ffe28a", "#ef4135")
+            port_name = graph_node_name(port)
+            graph.add_edge(name, port_name)
             for other in port.connections:
-                if (other, port) not in edges:
-                    _walk_node(other.owner)
+                graph.add_edge(port_name, graph_node_name(other))
+        for port in component.inports:
+            _add_port_node(port, "#9ed8f5", "#ADFF2F")
+            graph.add_edge(graph_node_name(port), name)
 
-    _walk_node(actor)
     return graph
 
 
@@ -562,6 +784,7 @@ def draw_graph(graph, layout='spectral', with_labels=True, node_size=500,
                pos_kwargs=None, draw_kwargs=None):
     """Draw a workflow graph using NetworkX
     """
+    import networkx as nx
 
     kwargs = {}
     if pos_kwargs is not None:
@@ -0,0 +1,176 @@
+"""References to tokens kept by the workers
+
+FuturesScheduler(remote_tokens=True) passes references between the jobs instead of
+the values, hence intermediate tokens do not travel through the scheduler.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import shutil
+import sys
+import uuid
+from tempfile import mkdtemp
+
+from .util import dumps, loads
+
+__all__ = ["RemoteRef", "FileRef", "FutureRef", "FileStore", "resolve", "keep_tokens"]
+
+
+class RemoteRef(object):
+    """Token kept outside of the scheduler's process
+
+    Jobs resolve the references they get on the workers. The scheduler
+    resolves them only for system actors and workflow outputs.
+    """
+
+    def resolve(self):
+        """Get the token value
+        """
+        raise NotImplementedError
+
+    def claim(self):
+        """Make this copy responsible for releasing the token once dropped
+        """
+        pass
+
+    def take(self):
+        """Get the token value that stays valid after the reference is dropped
+
+        Used for workflow outputs, the same as resolve by default.
+        """
+        return self.resolve()
+
+
+class FileRef(RemoteRef):
+    """Token pickled into a file (see FileStore)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._owner = False
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self.path)
+
+    def __getstate__(self):
+        # copies never delete the file
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._owner = False
+
+    def resolve(self):
+        with open(self.path, 'rb') as f:
+            return loads(f.read())
+
+    def claim(self):
+        self._owner = True
+
+    def __del__(self):
+        if getattr(self, '_owner', False):
+            try:
+                os.remove(self.path)
+            except Exception:
+                pass
+
+
+class FutureRef(RemoteRef):
+    """Token kept by a dask.distributed cluster
+
+    dask releases the data once the future is dropped.
+    """
+
+    def __init__(self, future):
+        self.future = future
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self.future.key)
+
+    def resolve(self):
+        return self.future.result()
+
+
+def _is_small(value, inline_size):
+    """True if the pickled value has at most inline_size bytes
+    """
+    if sys.getsizeof(value) > inline_size:
+        return False
+    try:
+        return len(dumps(value)) <= inline_size
+    except Exception:
+        # cannot be sent anyway
+        return False
+
+
+class FileStore(object):
+    """Keeps tokens in files of a directory accessible by all workers
+
+    Args:
+        directory (Optional[str]): the directory, a new temporary directory
+            (in /dev/shm if available) by default
+        inline_size (Optional[int]): tokens with at most this pickled size
+            are passed by value [1024]
+    """
+
+    def __init__(self, directory=None, inline_size=1024):
+        self._own_directory = directory is None
+        if directory is None:
+            shm = '/dev/shm'
+            directory = mkdtemp(prefix='wowp-tokens-',
+                                dir=shm if os.path.isdir(shm) else None)
+        self.directory = directory
+        self.inline_size = inline_size
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self.directory)
+
+    def put(self, value):
+        """Store the value, return a FileRef or the value itself if it is small
+        """
+        data = dumps(value)
+        if len(data) <= self.inline_size:
+            return value
+        path = os.path.join(self.directory, uuid.uuid4().hex)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return FileRef(path)
+
+    def cleanup(self):
+        """Remove the temporary directory
+        """
+        if self._own_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def resolve(value):
+    """Value of a token, which can be a RemoteRef
+    """
+    if isinstance(value, RemoteRef):
+        return value.resolve()
+    return value
+
+
+def keep_tokens(store, func, args, kwargs):
+    """Run func(*args, **kwargs) on a worker, keep the results in the store
+
+    Returns:
+        dict: output port names and the stored tokens
+    """
+    args = tuple(resolve(value) for value in args)
+    kwargs = {name: resolve(value) for name, value in kwargs.items()}
+    result = func(*args, **kwargs)
+    if not result:
+        return {}
+    if not hasattr(result, 'items'):
+        raise ValueError('The execute method must return '
+                         'a dict-like object with items method')
+    from .components import TokenBatch
+
+    tokens = {}
+    for name, value in result.items():
+        if isinstance(value, TokenBatch):
+            # tokens of a batch are stored separately
+            tokens[name] = TokenBatch(store.put(token) for token in value)
+        else:
+            tokens[name] = store.put(value)
+    return tokens
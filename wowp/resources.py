@@ -0,0 +1,106 @@
+"""Resource requirements of actors and resource capacities of executors
+
+Resources are named amounts, e.g. {'cores': 2, 'memory': 4e9, 'licence': 1}.
+Memory is in bytes, custom resources (tokens) can use any name.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import threading
+import multiprocessing
+
+__all__ = ["DEFAULT_REQUIREMENTS", "host_capacity", "ResourcePool"]
+
+# requirements of actors that do not specify any
+DEFAULT_REQUIREMENTS = {'cores': 1}
+
+
+def host_capacity():
+    """Resources of the local host
+
+    Returns:
+        dict: cores available to this process and physical memory in bytes
+    """
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = multiprocessing.cpu_count()
+    capacity = {'cores': cores}
+    try:
+        capacity['memory'] = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        # memory is not tracked if unknown
+        pass
+    return capacity
+
+
+class ResourcePool(object):
+    """Tracks free resources of an executor
+
+    Resources not present in the capacity are not limited.
+
+    Args:
+        capacity (dict): total amounts of resources
+        worker_capacity (Optional[dict]): amounts available to a single job,
+            e.g. the largest worker of a cluster, whose capacity is the sum of its workers
+        parent (Optional[ResourcePool]): pool the resources are taken from as well,
+            e.g. the pool of a shared executor
+    """
+
+    def __init__(self, capacity=None, worker_capacity=None, parent=None):
+        self.capacity = dict(capacity or {})
+        self.worker_capacity = dict(worker_capacity or {})
+        self.free = dict(self.capacity)
+        self.parent = parent
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<{} free={} capacity={}>".format(self.__class__.__name__, self.free,
+                                                 self.capacity)
+
+    def check(self, requirements):
+        """Raise ValueError if the requirements can never be satisfied
+        """
+        for name, amount in requirements.items():
+            if name in self.capacity and amount > self.capacity[name]:
+                raise ValueError('{} {} required but only {} available'.format(
+                    amount, name, self.capacity[name]))
+            if name in self.worker_capacity and amount > self.worker_capacity[name]:
+                raise ValueError('{} {} required but only {} available per worker'.format(
+                    amount, name, self.worker_capacity[name]))
+        if self.parent is not None:
+            self.parent.check(requirements)
+
+    def _fits(self, requirements):
+        return all(amount <= self.free[name]
+                   for name, amount in requirements.items() if name in self.free)
+
+    def fits(self, requirements):
+        """True if the requirements fit into the currently free resources
+        """
+        with self._lock:
+            if not self._fits(requirements):
+                return False
+        return self.parent is None or self.parent.fits(requirements)
+
+    def acquire(self, requirements):
+        """Take the resources if they fit, return True on success
+        """
+        with self._lock:
+            if not self._fits(requirements):
+                return False
+            if self.parent is not None and not self.parent.acquire(requirements):
+                return False
+            for name, amount in requirements.items():
+                if name in self.free:
+                    self.free[name] -= amount
+            return True
+
+    def release(self, requirements):
+        """Return the previously acquired resources
+        """
+        with self._lock:
+            for name, amount in requirements.items():
+                if name in self.free:
+                    self.free[name] += amount
+        if self.parent is not None:
+            self.parent.release(requirements)
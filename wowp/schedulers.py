@@ -1,38 +1,24 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import inspect
-from collections import deque
+import os
+from collections import deque, namedtuple, Counter
 import threading
-import warnings
 import wowp.components
 import time
 import datetime
 import six
+import sys
 import traceback
+import atexit
+import importlib
 from .logger import logger
 import concurrent.futures
 
 from .util import loads, dumps
-try:
-    import ipyparallel
-except ImportError:
-    warnings.warn(
-        'ipyparallel not installed: FuturesScheduler cannot use ipyparallel executor')
-    ipyparallel = None
-try:
-    import distributed
-except ImportError:
-    warnings.warn(
-        'distributed not installed: FuturesScheduler cannot use distributed executor')
-    distributed = None
-try:
-    import mpi4py
-    import mpi4py.futures
-    mpi4py.MPI.pickle.__init__(loads=loads, dumps=dumps)
-except ImportError:
-    warnings.warn(
-        'mpi4py not installed or mpi4py.futures not supported: mpi4py cannot be used')
-    mpi4py = None
+from .resources import DEFAULT_REQUIREMENTS, ResourcePool, host_capacity
+from .refs import RemoteRef, FutureRef, FileStore, keep_tokens, _is_small
+from .tags import current_tag, set_tag, new_tag
 import itertools
 
 
@@ -40,10 +26,105 @@ __all__ = [
     "NaiveScheduler",
     "LinearizedScheduler",
     "ThreadedScheduler",
-    "FuturesScheduler"]
+    "FuturesScheduler",
+    "MPIScheduler",
+    "mpi_worker",
+    "RoundRobinPolicy",
+    "LeastLoadedPolicy",
+    "AffinityPolicy",
+    "get_executor",
+    "executor_resource_pool",
+    "shutdown_executors",
+    "register_executor"]
+
+
+def _import_mpi4py():
+    import mpi4py
+    import mpi4py.futures
+    mpi4py.MPI.pickle.__init__(loads=loads, dumps=dumps)
+    return mpi4py
+
+
+# optional backends are imported on the first request, importing them
+# (and initializing MPI) takes much longer than importing wowp
+_backend_loaders = {
+    'ipyparallel': lambda: importlib.import_module('ipyparallel'),
+    'distributed': lambda: importlib.import_module('distributed'),
+    'mpi4py': _import_mpi4py,
+}
+_backends = {}
+
+
+def _backend(name):
+    """Optional backend module, imported on the first request
 
+    Raises:
+        ImportError: if the backend is not installed
+    """
+    try:
+        return _backends[name]
+    except KeyError:
+        pass
+    try:
+        module = _backend_loaders[name]()
+    except ImportError as error:
+        raise ImportError('{} is required by this executor or scheduler ({})'.format(
+            name, error))
+    _backends[name] = module
+    return module
+
+
+class _BatchFlusher(object):
+    """Keeps the actors waiting for incomplete batches (see wowp.components.BatchMixin)
+    """
+
+    def _defer(self, actor):
+        """Remember the actor if it waits for an incomplete batch (see BatchMixin)
+        """
+        key = (actor, current_tag())
+        deferred = self.__dict__.setdefault('_deferred', {})
+        if key not in deferred and getattr(actor, 'flush_deadline', None) is not None and \
+                actor.flush_deadline() is not None:
+            deferred[key] = actor
+
+    def _due_batches(self, flush_all):
+        """Let deferred actors run with incomplete batches
+
+        Args:
+            flush_all (bool): flush all batches, e.g. when no more tokens can arrive,
+                otherwise only those whose batch_latency expired
 
-class _ActorRunner(object):
+        Returns:
+            tuple: (actor, tag) keys of the flushed actors, the next deadline or None
+        """
+        deferred = getattr(self, '_deferred', None)
+        if not deferred:
+            return [], None
+        now = time.time()
+        due = []
+        next_deadline = None
+        previous = current_tag()
+        try:
+            for key in list(deferred):
+                actor, tag = key
+                set_tag(tag)
+                deadline = actor.flush_deadline()
+                if deadline is None:
+                    # the batch has run meanwhile
+                    del deferred[key]
+                elif flush_all or deadline <= now:
+                    actor.flush()
+                    del deferred[key]
+                    due.append(key)
+                elif deadline != float('inf') and (next_deadline is None or
+                                                   deadline < next_deadline):
+                    next_deadline = deadline
+        finally:
+            set_tag(previous)
+        return due, next_deadline
+
+
+class _ActorRunner(_BatchFlusher):
     """Base class for objects that run actors and process their results.
 
     It is ok, if the runner is a scheduler at the same time. The separation
@@ -64,6 +145,38 @@ class _ActorRunner(object):
             for inport in outport.connections:
                 self.put_value(inport, value)
 
+    def on_outport_put_values(self, outport, count):
+        """Propagates count values put into an output port at once (see TokenBatch)
+
+        Must be called after outport.put_values
+        """
+        if outport.connections:
+            values = [outport.pop() for _ in range(count)]
+            for inport in outport.connections:
+                self.put_values(inport, values)
+
+    def put_values(self, in_port, values):
+        """Put several values into the input port, like put_value for each of them
+
+        Sequential schedulers put them at once and check the actor readiness
+        once per firing rather than once per value.
+        """
+        for value in values:
+            self.put_value(in_port, value)
+
+    def _put_values_and_run(self, in_port, values):
+        """Put the values into the port and run the actor while it can run,
+        at most once per value
+        """
+        actor = in_port.owner
+        should_run = in_port.put_values(values)
+        for _ in range(len(values)):
+            if not should_run:
+                self._defer(actor)
+                return
+            self.run_actor(actor)
+            should_run = actor.can_run()
+
     def run_actor(self, actor):
         # print("Run actor")
         # TODO replace by an attribute / method call
@@ -84,27 +197,60 @@ class _ActorRunner(object):
                 for name, value in result.items():
                     if name in out_names:
                         outport = actor.outports[name]
-                        outport.put(value)
-                        self.on_outport_put_value(outport)
+                        if isinstance(value, wowp.components.TokenBatch):
+                            outport.put_values(value)
+                            self.on_outport_put_values(outport, len(value))
+                        else:
+                            outport.put(value)
+                            self.on_outport_put_value(outport)
                     else:
                         raise ValueError("{} not in output ports".format(name))
 
+    def port_loads(self, ports):
+        """Load of the actors owning the input ports, e.g. for load balancing (see Splitter)
+
+        Sequential schedulers report the tokens in the port buffers only.
+
+        Returns:
+            list: (queued tokens, running jobs) of each port
+        """
+        return _port_loads(ports)
+
+    def _run_due_batches(self):
+        """Run all deferred actors, return False if there were none
+        """
+        due, _ = self._due_batches(True)
+        previous = current_tag()
+        try:
+            for actor, tag in due:
+                set_tag(tag)
+                if actor.can_run():
+                    self.run_actor(actor)
+        finally:
+            set_tag(previous)
+        return bool(due)
+
     def run_workflow(self, workflow, **kwargs):
-        inport_names = tuple(port.name for port in workflow.inports)
-        if workflow.scheduler is not None:
-            # TODO this seems a bit strange
-            scheduler = workflow.scheduler
-        else:
-            scheduler = self
-        for key, value in kwargs.items():
-            if key not in inport_names:
-                raise ValueError('{} is not an inport name'.format(key))
-            inport = workflow.inports[key]
-            # put values to connected ports
-            scheduler.put_value(inport, kwargs[inport.name])
+        scheduler = _put_workflow_inputs(self, workflow, kwargs)
         # TODO can this be run inside self.execute itsef?
         scheduler.execute()
 
+    def run_tagged(self, workflow, input_sets):
+        """Run the workflow for several input sets concurrently
+
+        Tokens of each input set get their own tag (see wowp.tags), hence the
+        invocations share the workflow instance and this scheduler's execution.
+
+        Args:
+            workflow (Composite): workflow to run
+            input_sets (iterable): dicts of input port values
+
+        Returns:
+            list: dicts of output port names and values (like Composite.__call__),
+                in the order of input_sets
+        """
+        return _run_tagged(self, workflow, input_sets)
+
     def reset(self):
         """Reset the scheduler
         """
@@ -119,6 +265,69 @@ class _ActorRunner(object):
     #     super(_ActorRunner, self).__del__()
 
 
+def _port_loads(ports, queue=(), running=()):
+    """(queued tokens, running jobs) of the actors owning the input ports
+
+    Args:
+        ports: input ports
+        queue: (port, value, tag) of the tokens not put into the ports yet
+        running: (actor, tag) of the running jobs
+    """
+    pending = Counter()
+    for task in queue:
+        # several values put at once (see LinearizedScheduler.put_values)
+        pending[id(task[0])] += (len(task[1]) if isinstance(task[1], wowp.components.TokenBatch)
+                                 else 1)
+    jobs = Counter(actor for actor, tag in running)
+    return [(sum(len(buffer) for buffer in port.buffers()) + pending[id(port)], jobs[port.owner])
+            for port in ports]
+
+
+def _put_workflow_inputs(scheduler, workflow, kwargs):
+    """Put the input values into the workflow's scheduler (or scheduler)
+
+    Returns the scheduler to be executed.
+    """
+    inport_names = tuple(port.name for port in workflow.inports)
+    if workflow.scheduler is not None:
+        # TODO this seems a bit strange
+        scheduler = workflow.scheduler
+    for key, value in kwargs.items():
+        if key not in inport_names:
+            raise ValueError('{} is not an inport name'.format(key))
+        inport = workflow.inports[key]
+        # put values to connected ports
+        scheduler.put_value(inport, kwargs[inport.name])
+    return scheduler
+
+
+def _run_tagged(scheduler, workflow, input_sets):
+    """Implements run_tagged for all schedulers
+    """
+    tags = []
+    previous = current_tag()
+    try:
+        executed = None
+        for inputs in input_sets:
+            tags.append(new_tag())
+            set_tag(tags[-1])
+            executed = _put_workflow_inputs(scheduler, workflow, inputs)
+        set_tag(previous)
+        if executed is not None:
+            executed.execute()
+        results = []
+        for tag in tags:
+            set_tag(tag)
+            results.append({port.name: port.pop_all() for port in workflow.outports})
+        return results
+    finally:
+        set_tag(previous)
+        # remaining tokens (e.g. of failed runs) and actor states
+        for component in wowp.components.iter_components(workflow):
+            for tag in tags:
+                component.discard_tag(tag)
+
+
 class NaiveScheduler(_ActorRunner):
     """Scheduler that directly calls connected actors.
 
@@ -132,9 +341,16 @@ class NaiveScheduler(_ActorRunner):
         should_run = in_port.put(value)
         if should_run:
             self.run_actor(in_port.owner)
+        else:
+            self._defer(in_port.owner)
+
+    def put_values(self, in_port, values):
+        self._put_values_and_run(in_port, list(values))
 
     def execute(self):
-        pass
+        # incomplete batches
+        while self._run_due_batches():
+            pass
 
 
 class LinearizedScheduler(_ActorRunner):
@@ -147,14 +363,108 @@ class LinearizedScheduler(_ActorRunner):
         return self.__class__()
 
     def put_value(self, in_port, value):
-        self.execution_queue.appendleft((in_port, value))
+        self.execution_queue.appendleft((in_port, value, current_tag()))
+
+    def put_values(self, in_port, values):
+        # a single queue item
+        self.execution_queue.appendleft((in_port, wowp.components.TokenBatch(values),
+                                         current_tag()))
 
     def execute(self):
-        while self.execution_queue:
-            in_port, value = self.execution_queue.pop()
-            should_run = in_port.put(value)
-            if should_run:
-                self.run_actor(in_port.owner)
+        previous = current_tag()
+        try:
+            while True:
+                while self.execution_queue:
+                    in_port, value, tag = self.execution_queue.pop()
+                    set_tag(tag)
+                    if isinstance(value, wowp.components.TokenBatch):
+                        self._put_values_and_run(in_port, value)
+                        continue
+                    should_run = in_port.put(value)
+                    if should_run:
+                        self.run_actor(in_port.owner)
+                    else:
+                        self._defer(in_port.owner)
+                # no other tokens can arrive, run incomplete batches
+                if not self._run_due_batches():
+                    break
+        finally:
+            set_tag(previous)
+
+
+class RoundRobinPolicy(object):
+    """Selects the clients (clusters) in turns
+    """
+
+    def __init__(self):
+        self._next = 0
+
+    def select(self, loads, locations):
+        """Index of the client for a job
+
+        Args:
+            loads (list): (outstanding tasks, engines) of each client
+            locations (list): client indices of the job inputs
+        """
+        current = self._next % len(loads)
+        self._next = current + 1
+        return current
+
+
+class LeastLoadedPolicy(object):
+    """Selects the client with the least outstanding tasks
+
+    Args:
+        weighted (Optional[bool]): outstanding tasks per engine are compared [True]
+    """
+
+    def __init__(self, weighted=True):
+        self.weighted = weighted
+
+    def select(self, loads, locations):
+        def load(i):
+            outstanding, engines = loads[i]
+            if self.weighted:
+                return outstanding / max(engines, 1)
+            return outstanding
+
+        return min(range(len(loads)), key=load)
+
+
+class AffinityPolicy(object):
+    """Selects the client holding most of the job inputs
+
+    Inputs are located only for remote tokens (see FuturesScheduler). Jobs
+    without such inputs are placed by the fallback policy.
+
+    Args:
+        fallback (Optional): policy for jobs without located inputs [LeastLoadedPolicy()]
+    """
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback if fallback is not None else LeastLoadedPolicy()
+
+    def select(self, loads, locations):
+        if locations:
+            return Counter(locations).most_common(1)[0][0]
+        return self.fallback.select(loads, locations)
+
+
+_client_policies = {'round_robin': RoundRobinPolicy,
+                    'least_loaded': LeastLoadedPolicy,
+                    'affinity': AffinityPolicy}
+
+
+def _client_policy(policy):
+    """Policy instance from a name or the policy itself
+    """
+    if isinstance(policy, six.string_types):
+        try:
+            return _client_policies[policy]()
+        except KeyError:
+            raise ValueError('Unknown client policy {}, use one of {}'.format(
+                policy, ', '.join(sorted(_client_policies))))
+    return policy
 
 
 class DistributedExecutor(object):
@@ -164,40 +474,224 @@ class DistributedExecutor(object):
         uris: one or more dexecuter URI's (str or list)
         min_engines (int): minimum number of engines
         timeout(float): time to wait for engines
+        policy (Optional): client (cluster) selection policy, a name (round_robin,
+            least_loaded, affinity) or an object with the select method ['affinity']
     """
 
-    def __init__(self, uris=None, min_engines=1, timeout=60):
+    def __init__(self, uris=None, min_engines=1, timeout=60, policy='affinity'):
         from dask.distributed import Client
         if isinstance(uris, six.string_types):
             uris = (uris, )
         elif uris is None:
             uris = (None, )
         self._clients = [Client(addr) for addr in uris]
-        self._current_cli = 0
+        self.policy = _client_policy(policy)
+        # number of unfinished jobs submitted to each client
+        self._outstanding = [0] * len(self._clients)
+        self._outstanding_lock = threading.Lock()
         # TODO assure
 
-    def _rotate_client(self):
-        # TODO pick the first (most) empty one
-        current = self._current_cli
-        self._current_cli = (self._current_cli + 1) % len(self._clients)
-        return self._clients[current]
+    @property
+    def capacity(self):
+        """Total threads and memory of all workers
+        """
+        capacity = {'cores': 0, 'memory': 0}
+        for cli in self._clients:
+            for worker in cli.scheduler_info()['workers'].values():
+                capacity['cores'] += worker.get('nthreads', worker.get('ncores', 1))
+                capacity['memory'] += worker.get('memory_limit', 0)
+        if not capacity['memory']:
+            # unknown memory limits
+            del capacity['memory']
+        return capacity
+
+    @property
+    def worker_capacity(self):
+        """Threads and memory of the largest worker, the limits of a single job
+        """
+        capacity = {'cores': 0, 'memory': 0}
+        for cli in self._clients:
+            for worker in cli.scheduler_info()['workers'].values():
+                capacity['cores'] = max(capacity['cores'],
+                                        worker.get('nthreads', worker.get('ncores', 1)))
+                capacity['memory'] = max(capacity['memory'], worker.get('memory_limit', 0))
+        if not capacity['memory']:
+            # unknown memory limits
+            del capacity['memory']
+        return capacity
+
+    def _engines(self, cli):
+        # scheduler_info is kept up to date by the client
+        return sum(worker.get('nthreads', worker.get('ncores', 1))
+                   for worker in cli.scheduler_info()['workers'].values())
+
+    def _select_client(self, args=(), kwargs=None):
+        """Index of the client for a job with the given arguments
+        """
+        if len(self._clients) == 1:
+            return 0
+        with self._outstanding_lock:
+            outstanding = list(self._outstanding)
+        loads = [(jobs, self._engines(cli)) for cli, jobs in zip(self._clients, outstanding)]
+        locations = []
+        for value in itertools.chain(args, (kwargs or {}).values()):
+            future = _dask_future(value)
+            for i, cli in enumerate(self._clients):
+                if getattr(future, 'client', None) is cli:
+                    locations.append(i)
+        return self.policy.select(loads, locations)
 
     def submit(self, func, *args, **kwargs):
         """Submit a function: func(*args, **kwargs) and return a FutureJob.
         """
-        cli = self._rotate_client()
-        executor = cli.get_executor()
+        i = self._select_client(args, kwargs)
+        executor = self._clients[i].get_executor()
         job = executor.submit(func, *args, **kwargs)
+        self._track(i, job)
         return job
 
+    def submit_refs(self, func, *args, **kwargs):
+        """Submit an actor's run function, the job result maps port names to FutureRef's
+
+        dask resolves the input futures on the workers.
+        """
+        i = self._select_client(args, kwargs)
+        cli = self._clients[i]
+        args = tuple(_dask_future(value) for value in args)
+        kwargs = {name: _dask_future(value) for name, value in kwargs.items()}
+        items = cli.submit(_result_items, func, *args, pure=False, **kwargs)
+        # only the port names are sent back
+        names = cli.submit(_item_names, items, pure=False)
+        self._track(i, names)
+        return _DaskRefsJob(cli, items, names)
+
+    def _track(self, i, future):
+        """Count the future among the unfinished jobs of the i-th client until it is done
+        """
+        with self._outstanding_lock:
+            self._outstanding[i] += 1
+
+        def done(_):
+            with self._outstanding_lock:
+                self._outstanding[i] -= 1
+
+        future.add_done_callback(done)
+
+
+def _dask_future(value):
+    if isinstance(value, FutureRef):
+        return value.future
+    return value
+
+
+def _result_items(func, *args, **kwargs):
+    result = func(*args, **kwargs)
+    if not result:
+        return []
+    if not hasattr(result, 'items'):
+        raise ValueError('The execute method must return '
+                         'a dict-like object with items method')
+    return list(result.items())
+
+
+def _item_names(items):
+    return [name for name, value in items]
+
+
+def _item_value(items, i):
+    return items[i][1]
+
+
+class _DaskRefsJob(object):
+    """Job of DistributedExecutor.submit_refs
+    """
+
+    def __init__(self, client, items, names):
+        self._client = client
+        self._items = items
+        self._names = names
+        # done once the names are known, the data stay on the cluster
+        self._future = concurrent.futures.Future()
+        names.add_done_callback(lambda _: self._future.set_result(None))
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        names = self._names.result(timeout=timeout)
+        return {name: FutureRef(self._client.submit(_item_value, self._items, i, pure=False))
+                for i, name in enumerate(names)}
+
+    def display_outputs(self):
+        pass
+
 
 class MultiprocessingExecutor(object):
     """Executes jobs in local subprocesses using concurrent.futures
     """
 
-    def __init__(self, processes):
+    def __init__(self, processes, initializer=None, initargs=()):
         from concurrent.futures import ProcessPoolExecutor
-        self._pool = ProcessPoolExecutor(max_workers=processes)
+        self.processes = processes
+        kwargs = {} if initializer is None else {'initializer': initializer,
+                                                 'initargs': initargs}
+        self._pool = ProcessPoolExecutor(max_workers=processes, **kwargs)
+        # one core per process, processes share the memory of this host
+        self.capacity = dict(host_capacity(), cores=processes)
+        self._object_store = None
+        if initializer is not None:
+            # e.g. engines started by the initializer are ready for the first jobs
+            self.warm_up()
+
+    @property
+    def object_store(self):
+        """FileStore keeping the tokens of submit_refs jobs
+        """
+        if self._object_store is None:
+            self._object_store = FileStore()
+        return self._object_store
+
+    def submit_refs(self, func, *args, **kwargs):
+        """Submit an actor's run function, the job result maps port names to tokens
+        kept in the object store
+        """
+        return self.submit(keep_tokens, self.object_store, func, args, kwargs)
+
+    def submit(self, func, *args, **kwargs):
+        """Submit a function: func(*args, **kwargs) and return a FutureJob.
+        """
+        job = self._pool.submit(func, *args, **kwargs)
+        return FutureJob(job)
+
+    def warm_up(self, timeout=60):
+        """Start all worker processes now rather than on the first submits
+
+        Waits until every worker (and its initializer) has run a job.
+        """
+        pids = set()
+        deadline = time.time() + timeout
+        while len(pids) < self.processes and time.time() < deadline:
+            # busy workers leave the next jobs to the others
+            jobs = [self._pool.submit(_worker_pid, 0.01) for _ in range(self.processes)]
+            pids.update(job.result() for job in jobs)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+        if self._object_store is not None:
+            self._object_store.cleanup()
+
+
+class ThreadingExecutor(object):
+    """Executes jobs in threads of the current process using concurrent.futures
+    """
+
+    def __init__(self, max_workers, initializer=None, initargs=()):
+        from concurrent.futures import ThreadPoolExecutor
+        self.max_workers = max_workers
+        kwargs = {} if initializer is None else {'initializer': initializer,
+                                                 'initargs': initargs}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, **kwargs)
+        self.capacity = dict(host_capacity(), cores=max_workers)
 
     def submit(self, func, *args, **kwargs):
         """Submit a function: func(*args, **kwargs) and return a FutureJob.
@@ -205,12 +699,16 @@ class MultiprocessingExecutor(object):
         job = self._pool.submit(func, *args, **kwargs)
         return FutureJob(job)
 
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
 
 class MPIExecutor(object):
     """Executes jobs in local subprocesses using concurrent.futures
     """
 
     def __init__(self, max_workers=None):
+        mpi4py = _backend('mpi4py')
         self.mpi_comm = mpi4py.MPI.COMM_WORLD
         self.mpi_size = self.mpi_comm.size
         self.mpi_rank = self.mpi_comm.rank
@@ -220,6 +718,8 @@ class MPIExecutor(object):
         assert self.mpi_rank == 0
 
         self.executor = mpi4py.futures.MPIPoolExecutor(max_workers=None)
+        # one core per worker process
+        self.capacity = {'cores': max(self.mpi_size - 1, 1)}
 
     def submit(self, func, *args, **kwargs):
         """Submit a function: func(*args, **kwargs) and return a FutureJob.
@@ -252,6 +752,8 @@ class IpyparallelExecutor(object):
         timeout (Optional): timeout in secs for waiting for ipyparallel cluster [60]
         min_engines (Optional[int]): minimum number of engines [1]
         client_kwargs: passed to ipyparallel.Client( **kwargs)
+        policy (Optional): client (cluster) selection policy, a name (round_robin,
+            least_loaded, affinity) or an object with the select method ['affinity']
     """
 
     def __init__(self,
@@ -260,7 +762,8 @@ class IpyparallelExecutor(object):
                  display_outputs=False,
                  timeout=60,
                  min_engines=1,
-                 client_kwargs=None):
+                 client_kwargs=None,
+                 policy='affinity'):
 
         self.process_pool = []
         # actor: job
@@ -274,7 +777,7 @@ class IpyparallelExecutor(object):
         self.display_outputs = display_outputs
         # get individual clients
         self._ipy_rc = []
-        self._current_cli = 0
+        self.policy = _client_policy(policy)
         self._ipy_lv = []
         self._ipy_dv = []
         # decide whether to use profiles or profile_dirs
@@ -314,6 +817,12 @@ class IpyparallelExecutor(object):
         self.execution_queue = deque()
         self.wait_queue = []
 
+    @property
+    def capacity(self):
+        """One core per engine
+        """
+        return {'cores': sum(len(rc.ids) for rc in self._ipy_rc)}
+
     @staticmethod
     def init_cluster(min_engines, timeout, *args, **kwargs):
         '''Get a connection (view) to an IPython cluster
@@ -327,7 +836,7 @@ class IpyparallelExecutor(object):
 
         while True:
             try:
-                cli = ipyparallel.Client(*args, **kwargs)
+                cli = _backend('ipyparallel').Client(*args, **kwargs)
             except Exception as e:
                 if time.time() > maxtime:
                     # raise the original exception from ipyparallel
@@ -352,19 +861,22 @@ class IpyparallelExecutor(object):
 
         return cli
 
-    def _rotate_client(self):
-        # TODO pick the first (most) empty one
-        current = self._current_cli
-        self._current_cli = (self._current_cli + 1) % len(self._ipy_rc)
-        return current
+    def _select_client(self):
+        """Index of the client for a job
+        """
+        if len(self._ipy_rc) == 1:
+            return 0
+        # tasks submitted but not finished yet
+        loads = [(len(rc.outstanding), len(rc.ids)) for rc in self._ipy_rc]
+        # ipyparallel jobs get the values, there are no located inputs
+        return self.policy.select(loads, [])
 
     def submit(self, func, *args, **kwargs):
         """Submit a function: func(*args, **kwargs) and return a FutureJob.
         """
 
         # This switches ipyparallel clients (ie clusters)
-        # TODO this is likely not good - data will have to travel too much
-        lv = self._ipy_lv[self._rotate_client()]
+        lv = self._ipy_lv[self._select_client()]
         job = lv.apply_async(func, *args, **kwargs)
         return job
 
@@ -408,11 +920,30 @@ class FuturesScheduler(_ActorRunner):
     """Scheduler using PEP 3148 futures
 
     Args:
-        executor (str): executor type: multiprocessing, distributed, ipyparallel, mpi
+        executor (str): executor type: multiprocessing, threading, distributed, ipyparallel, mpi
         display_outputs (Optional[bool]): display stdout/err from actors [False]
         timeout (Optional): timeout in secs for waiting for ipyparallel cluster [60]
         min_engines (Optional[int]): minimum number of engines [1]
-        client_kwargs: passed to ipyparallel.Client( **kwargs)
+        executor_kwargs: passed to the executor, e.g. ipyparallel.Client( **kwargs)
+        shared_executor (Optional[bool]): use a shared executor from the process-wide
+            registry (see get_executor) that outlives the scheduler [True]
+        expand_subworkflows (Optional[bool]): run sub-workflows of system actors
+            with an expand method (e.g. Map) by this scheduler, interleaved with
+            other jobs, rather than blocking inside the actor [True]
+        resources (Optional[dict]): resource capacities of this scheduler (and its copies),
+            e.g. {'licence': 2}, in addition to the executor's capacity shared by all
+            schedulers using the executor (see executor_resource_pool)
+        remote_tokens (Optional[bool]): keep actor outputs on the workers and pass
+            references (see wowp.refs) to the consuming jobs, if the executor
+            supports it (multiprocessing, distributed). Values are transferred
+            to the scheduler only for system actors and workflow outputs. [False]
+
+    Actors are submitted only if their resource requirements (Component.resources)
+    fit into the free executor resources. System actors require no resources.
+    Async actors (see Actor.async_actor) start their jobs in this process and
+    require no resources either.
+    An actor runs once at a time for each tag (see run_tagged), hence tagged
+    invocations of one workflow run concurrently.
     """
 
     def __init__(self,
@@ -421,6 +952,10 @@ class FuturesScheduler(_ActorRunner):
                  min_engines=1,
                  timeout=60,
                  executor_kwargs=None,
+                 shared_executor=True,
+                 expand_subworkflows=True,
+                 resources=None,
+                 remote_tokens=False,
                  copy_from=None):
 
         if executor_kwargs is None:
@@ -438,53 +973,77 @@ class FuturesScheduler(_ActorRunner):
         self._init_kwargs = {'display_outputs': display_outputs,
                              'min_engines': min_engines,
                              'timeout': timeout,
-                             'executor_kwargs': executor_kwargs}
+                             'executor_kwargs': executor_kwargs,
+                             'shared_executor': shared_executor,
+                             'expand_subworkflows': expand_subworkflows,
+                             'resources': resources,
+                             'remote_tokens': remote_tokens}
         self.display_outputs = display_outputs
+        self.expand_subworkflows = expand_subworkflows
+        # shared executors are owned by the registry, see get_executor
+        self.shared_executor = shared_executor
 
         if copy_from is None:
-            if executor == 'multiprocessing':
-                self.executor = MultiprocessingExecutor(processes=min_engines)
-            elif distributed is not None and executor == 'distributed':
-                self.executor = DistributedExecutor(uris=executor_kwargs.get('uris', None),
-                                                    min_engines=min_engines,
-                                                    timeout=timeout)
-            elif ipyparallel is not None and executor == 'ipyparallel':
-                kwargs = dict(min_engines=min_engines,
-                              timeout=timeout,
-                              display_outputs=display_outputs)
-                kwargs.update(executor_kwargs)
-                self.executor = IpyparallelExecutor(**kwargs)
-            elif mpi4py is not None and executor == 'mpi':
-                self.executor = MPIExecutor(**executor_kwargs)
-            # elif executor == 'scoop':
-            #     self.executor = ScoopExecutor()
+            executor_args = dict(min_engines=min_engines,
+                                 timeout=timeout,
+                                 display_outputs=display_outputs)
+            executor_args.update(executor_kwargs)
+            if shared_executor:
+                self.executor = get_executor(executor, **executor_args)
             else:
-                raise ValueError('Executor {} not supported'.format(executor))
+                self.executor = _new_executor(executor, **executor_args)
             self.system_executor = LocalExecutor()
+            # the executor's capacity is shared by all schedulers using it
+            self.resource_pool = ResourcePool(resources,
+                                              parent=executor_resource_pool(self.executor))
         else:
             # executors must be shared across copies to avoid their initialization
             self.executor = copy_from.executor
             self.system_executor = copy_from.system_executor
+            self.resource_pool = copy_from.resource_pool
+        self.remote_tokens = remote_tokens and hasattr(self.executor, 'submit_refs')
 
         self.reset()
 
     def reset(self):
+        for job_description in getattr(self, 'running_actors', {}).values():
+            self.resource_pool.release(job_description.get('resources', {}))
         self.process_pool = []
+        # (actor, tag): job description
         self.running_actors = {}
+        # (in_port, value, tag)
         self.execution_queue = deque()
+        # (actor, tag)
         self.wait_queue = []
+        # ports that received remote tokens, id(port): port
+        self._ref_ports = {}
         # will be used as the initial sleep time between polls
         self.last_sleep = 1e-3
+        # (actor, tag): actors waiting for incomplete batches, see BatchMixin
+        self._deferred = {}
+        self._next_flush = None
 
     def run_actor(self, actor):
         # print("Run actor {}".format(actor))
         actor.scheduler = self
+        if (actor.system_actor or actor.async_actor) and self._ref_ports:
+            # system actors need the values and may read the ports directly
+            self._resolve_ports(actor.inports)
+        if (self.expand_subworkflows and actor.system_actor and
+                hasattr(actor, 'expand') and actor.expand(self)):
+            # the actor's sub-workflow was put into this scheduler's queues,
+            # expand returns False if this is not possible
+            return dict(args=(), kwargs={}, job=self.system_executor.submit(_noop))
         args, kwargs = actor.get_run_args()
         # system actors must be run within this process
         res = dict(args=args, kwargs=kwargs)
         if actor.system_actor:
             res['job'] = self.system_executor.submit(actor.run, *args, **
                                                      kwargs)
+        elif actor.async_actor:
+            res['job'] = FutureJob(actor.submit_async(*args, **kwargs))
+        elif self.remote_tokens:
+            res['job'] = self.executor.submit_refs(actor.run, *args, **kwargs)
         else:
             res['job'] = self.executor.submit(actor.run, *args, **kwargs)
 
@@ -497,34 +1056,67 @@ class FuturesScheduler(_ActorRunner):
         return self.__class__(*self._init_args, copy_from=self, **self._init_kwargs)
 
     def put_value(self, in_port, value):
-        self.execution_queue.appendleft((in_port, value))
+        if isinstance(value, RemoteRef):
+            self._ref_ports[id(in_port)] = in_port
+        self.execution_queue.appendleft((in_port, value, current_tag()))
 
-    def execute(self):
-        while self.execution_queue or self.running_actors or self.wait_queue:
-            self.nothing = True
+    def port_loads(self, ports):
+        return _port_loads(ports, self.execution_queue, self.running_actors)
 
-            self._try_empty_execution_queue()
-            self._try_empty_wait_queue()
-            self._try_empty_ready_jobs()
+    def execute(self):
+        previous = current_tag()
+        try:
+            while (self.execution_queue or self.running_actors or self.wait_queue or
+                   self._deferred):
+                self.nothing = True
+
+                self._try_empty_execution_queue()
+                # incomplete batches, all of them if no other tokens can arrive
+                idle = not (self.running_actors or self.wait_queue)
+                due, self._next_flush = self._due_batches(idle)
+                self.wait_queue.extend(due)
+                self._try_empty_wait_queue()
+                self._try_empty_ready_jobs()
+
+                if self.nothing and not self.running_actors:
+                    # waiting for resources held by jobs of other schedulers (copies)
+                    time.sleep(self.last_sleep)
+        finally:
+            set_tag(previous)
+        # tokens left in the ports are the outputs
+        self._resolve_ports(self._ref_ports.values())
+        self._ref_ports.clear()
+
+    def _resolve_ports(self, ports):
+        """Replace remote tokens in the port buffers (of all tags) by their values
+        """
+        for port in list(ports):
+            for buffer in port.buffers():
+                for i, value in enumerate(list(buffer)):
+                    if isinstance(value, RemoteRef):
+                        buffer[i] = value.take()
 
     def _try_empty_ready_jobs(self):
         if not self.running_actors:
             return
 
         # TODO could we use callbacks?
-        jobs = [job_description['job'] for job_description in self.running_actors.values()]
+        # FutureJob wrappers are not reported by wait, hence map the wrapped futures
+        jobs = {getattr(job_description['job'], '_future', job_description['job']): key
+                for key, job_description in self.running_actors.items()}
         # wait for the first completed job
-        done, not_done = concurrent.futures.wait(jobs, timeout=None,
+        # wake up for incomplete batches
+        timeout = None if self._next_flush is None else max(self._next_flush - time.time(), 0)
+        done, not_done = concurrent.futures.wait(list(jobs), timeout=timeout,
                                                  return_when=concurrent.futures.FIRST_COMPLETED)
         for job in done:
-            # TODO implement a better way to find actor by its job object
-            for actor, job_description in self.running_actors.items():
-                if job == job_description['job']:
-                    break
-            else:
-                raise RuntimeError("job's actor not found")
+            key = jobs[job]
+            actor, tag = key
+            set_tag(tag)
+            job = self.running_actors[key]['job']
             # delete the completed job from running_actors
-            del self.running_actors[actor]
+            job_description = self.running_actors.pop(key)
+            self.resource_pool.release(job_description.get('resources', {}))
             self.nothing = False
             # process result
             # raise RemoteError in case of failure
@@ -547,156 +1139,845 @@ class FuturesScheduler(_ActorRunner):
                 for name, value in result.items():
                     if name in out_names:
                         outport = actor.outports[name]
-                        outport.put(value)
-                        self.on_outport_put_value(outport)
+                        for token in wowp.components.iter_tokens(value):
+                            if isinstance(token, RemoteRef):
+                                # the token is released once the scheduler drops it
+                                token.claim()
+                                self._ref_ports[id(outport)] = outport
+                            outport.put(token)
+                            self.on_outport_put_value(outport)
                     else:
                         raise ValueError("{} not in output ports".format(
                             name))
 
     def _try_empty_wait_queue(self):
         pending = []  # temporary container
-        for actor in self.wait_queue:
-            # run actors only if not already running
-            if actor not in self.running_actors:
+        for key in self.wait_queue:
+            actor, tag = key
+            # run actors only if not already running and if their resources are free
+            if key not in self.running_actors:
+                set_tag(tag)
+                if not actor.can_run():
+                    # the tokens were consumed by a batch
+                    continue
+            # the kind of the job may depend on the scheduler (e.g. LoopWhile)
+            actor.scheduler = self
+            requirements = self._requirements(actor)
+            if key not in self.running_actors and self.resource_pool.acquire(requirements):
                 self.nothing = False
+                set_tag(tag)
                 # TODO can we iterate and remove at the same time?
-                self.running_actors[actor] = self.run_actor(actor)
+                try:
+                    job_description = self.run_actor(actor)
+                except Exception:
+                    self.resource_pool.release(requirements)
+                    raise
+                self._hold_resources(job_description, requirements)
+                self.running_actors[key] = job_description
             else:
-                pending.append(actor)
+                pending.append(key)
         self.wait_queue = pending
 
+    def _requirements(self, actor):
+        """Resource requirements of the actor
+        """
+        if actor.system_actor or actor.async_actor:
+            # system actors run in this process, async actors limit their concurrency
+            return {}
+        requirements = actor.resources
+        if requirements is None:
+            requirements = DEFAULT_REQUIREMENTS
+        # avoid waiting forever
+        self.resource_pool.check(requirements)
+        return requirements
+
+    def _hold_resources(self, job_description, requirements):
+        """Hold the resources until the job is done
+        """
+        if not requirements:
+            return
+        job = job_description['job']
+        future = getattr(job, '_future', job)
+        if hasattr(future, 'add_done_callback'):
+            # release immediately when the job finishes
+            future.add_done_callback(lambda _: self.resource_pool.release(requirements))
+        else:
+            # released when the job result is processed
+            job_description['resources'] = requirements
+
     def _try_empty_execution_queue(self):
         while self.execution_queue:
-            in_port, value = self.execution_queue.pop()
+            in_port, value, tag = self.execution_queue.pop()
+            set_tag(tag)
             should_run = in_port.put(value)
             if should_run:
                 self.nothing = False
                 # waiting to be run
-                self.wait_queue.append(in_port.owner)
+                self.wait_queue.append((in_port.owner, tag))
+            else:
+                self._defer(in_port.owner)
                 # self.running_actors((in_port.owner, self.run_actor(in_port.owner)))
 
     def shutdown(self):
+        """Shut down the executor, unless it is shared
+
+        Shared executors are shut down by shutdown_executors.
+        """
+        executor = getattr(self, 'executor', None)
+        if self.shared_executor or executor is None:
+            return
         logger.info('Scheduler is shutting down')
-        if hasattr(self.executor, 'shutdown'):
-            self.executor.shutdown()
+        if hasattr(executor, 'shutdown'):
+            executor.shutdown()
+        self.executor = None
 
     def __del__(self):
-        self.shutdown()
+        if hasattr(self, 'shared_executor'):
+            self.shutdown()
         if hasattr(super(type(self)), '__del__'):
             super(type(self), self).__del__()
 
 
-class ThreadedSchedulerWorker(threading.Thread, _ActorRunner):
-    """Thread object that executes run after run of the ThreadedScheduler actors.
+# MPI message tags of MPIScheduler and mpi_worker
+_MPI_TASK, _MPI_DONE, _MPI_SEND, _MPI_DATA, _MPI_FREE, _MPI_STOP = range(1, 7)
+
+# identifies a token kept on the MPI rank that produced it
+_MPIKey = namedtuple('_MPIKey', ('rank', 'key'))
+
+
+class _MPIRef(object):
+    """Reference to a token kept on a worker rank
+
+    The token is freed on its rank once the reference is dropped.
+    """
+
+    def __init__(self, key, garbage):
+        self.key = key
+        self.rank = key.rank
+        self.fetched = False
+        self.value = None
+        self._garbage = garbage
+
+    def __reduce__(self):
+        return _MPIKey, tuple(self.key)
+
+    def __del__(self):
+        self._garbage.append(self.key)
+
+
+class MPIScheduler(_ActorRunner):
+    """Scheduler running actors on MPI ranks with direct data transfers
+
+    Rank 0 runs the scheduler, all other ranks must run mpi_worker, e.g. using
+    ``mpiexec -n 4 wowp -s "MPIScheduler()" workflow.py``. The scheduler sends only
+    task metadata to the workers. Output tokens stay on the rank that produced them
+    and are sent point-to-point to the rank running the consuming actor, hence
+    tokens larger than inline_size never pass through rank 0. System actors run on
+    rank 0 and fetch their input tokens from the owners, as well as the workflow
+    outputs remaining in the ports after execute.
+
+    The scheduler must be shut down to stop the workers.
+
+    Args:
+        comm (Optional): MPI communicator [MPI.COMM_WORLD]
+        inline_size (Optional[int]): maximum pickled size in bytes of tokens
+            returned directly to rank 0 [1024]
+    """
+
+    def __init__(self, comm=None, inline_size=1024):
+        self.MPI = _backend('mpi4py').MPI
+        self.comm = comm if comm is not None else self.MPI.COMM_WORLD
+        if self.comm.rank != 0:
+            raise RuntimeError('MPIScheduler must run on rank 0, other ranks run mpi_worker')
+        if self.comm.size < 2:
+            raise RuntimeError('MPIScheduler requires at least 2 MPI processes')
+        self.inline_size = inline_size
+        # number of tokens fetched from workers by rank 0
+        self.fetched_tokens = 0
+        self._idle = deque(range(1, self.comm.size))
+        # keys of dropped tokens to be freed on their ranks
+        self._garbage = []
+        self._task_ids = itertools.count()
+        self._stopped = False
+        self.reset()
+
+    def reset(self):
+        # task_id: (actor, rank, args, kwargs, tag)
+        # ranks of tasks dropped here become idle once the tasks finish
+        self.running_tasks = {}
+        # (actor, tag)
+        self._running_actors = set()
+        # (in_port, value, tag)
+        self.execution_queue = deque()
+        # (actor, tag)
+        self.wait_queue = []
+        # ports that received token references, id(port): port
+        self._ref_ports = {}
+        # messages received while fetching tokens
+        self._backlog = deque()
+        # (actor, tag): actors waiting for incomplete batches, see BatchMixin
+        self._deferred = {}
+
+    def copy(self):
+        """MPI ranks cannot be shared, hence copies are the scheduler itself
+        """
+        return self
+
+    def put_value(self, in_port, value):
+        self.execution_queue.appendleft((in_port, value, current_tag()))
+
+    def port_loads(self, ports):
+        return _port_loads(ports, self.execution_queue, self._running_actors)
+
+    def execute(self):
+        previous = current_tag()
+        try:
+            while True:
+                self._try_empty_execution_queue()
+                # no other tokens can arrive when nothing runs, flush all batches
+                idle = not (self.running_tasks or self.wait_queue or self._backlog)
+                due, next_flush = self._due_batches(idle)
+                self.wait_queue.extend(due)
+                if not (self.running_tasks or self.wait_queue or self._backlog):
+                    break
+                self._try_empty_wait_queue()
+                if self.running_tasks or self._backlog or (self.wait_queue and not self._idle):
+                    # wake up for incomplete batches
+                    timeout = None if next_flush is None else max(next_flush - time.time(), 0)
+                    self._process_message(timeout)
+                self._free_garbage()
+        finally:
+            set_tag(previous)
+        # tokens left in the ports are the outputs
+        self._resolve_ports(self._ref_ports.values())
+        self._ref_ports.clear()
+        self._free_garbage()
+
+    def shutdown(self):
+        """Stop the workers
+        """
+        if self._stopped:
+            return
+        self._free_garbage()
+        for rank in range(1, self.comm.size):
+            self.comm.send(None, dest=rank, tag=_MPI_STOP)
+        self._stopped = True
+
+    def _try_empty_execution_queue(self):
+        while self.execution_queue:
+            in_port, value, tag = self.execution_queue.pop()
+            set_tag(tag)
+            if isinstance(value, _MPIRef):
+                self._ref_ports[id(in_port)] = in_port
+            if in_port.put(value):
+                # waiting to be run
+                self.wait_queue.append((in_port.owner, tag))
+            else:
+                self._defer(in_port.owner)
+
+    def _try_empty_wait_queue(self):
+        # system actors can put new actors into the queue
+        queue, self.wait_queue = self.wait_queue, []
+        pending = []
+        for key in queue:
+            actor, tag = key
+            set_tag(tag)
+            if key in self._running_actors:
+                pending.append(key)
+            elif not actor.can_run():
+                # the tokens were consumed by a batch
+                continue
+            elif actor.system_actor:
+                self._run_local(actor)
+            elif self._idle:
+                self._submit(actor)
+            else:
+                pending.append(key)
+        self.wait_queue[:0] = pending
+
+    def _run_local(self, actor):
+        actor.scheduler = self
+        if hasattr(actor, 'expand') and actor.expand(self):
+            # the sub-workflow was put into this scheduler's queues
+            return
+        # system actors may read the ports directly
+        self._resolve_ports(actor.inports)
+        args, kwargs = actor.get_run_args()
+        result = actor.run(*args, **kwargs)
+        if result:
+            if not hasattr(result, 'items'):
+                raise ValueError('The execute method must return '
+                                 'a dict-like object with items method')
+            self._put_outputs(actor, result.items())
+
+    def _submit(self, actor):
+        args, kwargs = actor.get_run_args()
+        # prefer the idle rank keeping most of the input tokens
+        owners = Counter(value.rank for value in itertools.chain(args, kwargs.values())
+                         if isinstance(value, _MPIRef))
+        rank = max(self._idle, key=lambda rank: owners[rank])
+        self._idle.remove(rank)
+        task_id = next(self._task_ids)
+        wire_args = tuple(self._wire(value, rank) for value in args)
+        wire_kwargs = {name: self._wire(value, rank) for name, value in kwargs.items()}
+        self.comm.send((task_id, actor.run, wire_args, wire_kwargs, self.inline_size),
+                       dest=rank, tag=_MPI_TASK)
+        # keep the references until the task finishes
+        tag = current_tag()
+        self.running_tasks[task_id] = (actor, rank, args, kwargs, tag)
+        self._running_actors.add((actor, tag))
+        logger.debug('submitted actor {} to rank {}'.format(actor.name, rank))
+
+    def _wire(self, value, rank):
+        """Replace a token reference by its key, ask the owner to send the token
+        """
+        if not isinstance(value, _MPIRef):
+            return value
+        if value.rank != rank:
+            self.comm.send((value.key, rank), dest=value.rank, tag=_MPI_SEND)
+        return value.key
+
+    def _recv(self):
+        status = self.MPI.Status()
+        message = self.comm.recv(source=self.MPI.ANY_SOURCE, tag=self.MPI.ANY_TAG,
+                                 status=status)
+        return message, status.Get_tag(), status.Get_source()
+
+    def _process_message(self, timeout=None):
+        """Process a message of the workers, wait at most timeout seconds if given
+        """
+        if self._backlog:
+            message, tag, source = self._backlog.popleft()
+        else:
+            if timeout is not None:
+                deadline = time.time() + timeout
+                while not self.comm.Iprobe(source=self.MPI.ANY_SOURCE, tag=self.MPI.ANY_TAG):
+                    if time.time() >= deadline:
+                        return
+                    time.sleep(0.001)
+            message, tag, source = self._recv()
+        if tag == _MPI_DONE:
+            self._task_done(source, *message)
+
+    def _task_done(self, rank, task_id, outputs, error, error_traceback):
+        self._idle.append(rank)
+        task = self.running_tasks.pop(task_id, None)
+        if task is None:
+            # the task was dropped by reset
+            return
+        actor, tag = task[0], task[4]
+        set_tag(tag)
+        self._running_actors.discard((actor, tag))
+        if error is not None:
+            logger.error('actor {} failed on rank {}\n{}'.format(actor.name, rank,
+                                                                 error_traceback))
+            self.reset()
+            raise error
+        self._put_outputs(actor, ((name, value if key is None else _MPIRef(key, self._garbage))
+                                  for name, key, value in outputs))
+
+    def _put_outputs(self, actor, items):
+        out_names = actor.outports.keys()
+        for name, value in items:
+            if name not in out_names:
+                raise ValueError("{} not in output ports".format(name))
+            outport = actor.outports[name]
+            for token in wowp.components.iter_tokens(value):
+                if isinstance(token, _MPIRef):
+                    self._ref_ports[id(outport)] = outport
+                outport.put(token)
+                self.on_outport_put_value(outport)
+
+    def _fetch(self, refs):
+        """Get the token values from their ranks
+        """
+        missing = {}
+        for ref in refs:
+            if not ref.fetched and ref.key not in missing:
+                self.comm.send((ref.key, 0), dest=ref.rank, tag=_MPI_SEND)
+                missing[ref.key] = ref
+        while missing:
+            message, tag, source = self._recv()
+            if tag == _MPI_DATA:
+                key, value = message
+                ref = missing.pop(key)
+                ref.value = value
+                ref.fetched = True
+                self.fetched_tokens += 1
+            else:
+                self._backlog.append((message, tag, source))
+
+    def _resolve_ports(self, ports):
+        """Replace token references in the port buffers by the values
+        """
+        buffers = [buffer for port in ports for buffer in port.buffers()]
+        self._fetch([value for buffer in buffers for value in buffer
+                     if isinstance(value, _MPIRef)])
+        for buffer in buffers:
+            for i, value in enumerate(list(buffer)):
+                if isinstance(value, _MPIRef):
+                    buffer[i] = value.value
+
+    def _free_garbage(self):
+        if self._stopped or not self._garbage:
+            return
+        keys = {}
+        while self._garbage:
+            key = self._garbage.pop()
+            keys.setdefault(key.rank, []).append(key)
+        for rank, rank_keys in keys.items():
+            self.comm.send(rank_keys, dest=rank, tag=_MPI_FREE)
+
+
+class _MPIWorker(object):
+    """Runs tasks of MPIScheduler and keeps their output tokens
+    """
+
+    def __init__(self, comm):
+        self.MPI = _backend('mpi4py').MPI
+        self.comm = comm
+        self.rank = comm.rank
+        # tokens produced by this rank
+        self.store = {}
+        # key: [value, count] tokens received from other ranks
+        self.copies = {}
+        # pending non-blocking sends
+        self.requests = []
+        self.stopped = False
+        self._keys = itertools.count()
+
+    def serve(self):
+        while not self.stopped:
+            message, tag = self._recv()
+            if tag == _MPI_TASK:
+                self.run_task(*message)
+            else:
+                self.handle(message, tag)
+            self.requests = [request for request in self.requests if not request.Test()]
+        self.MPI.Request.Waitall(self.requests)
+
+    def _recv(self):
+        status = self.MPI.Status()
+        message = self.comm.recv(source=self.MPI.ANY_SOURCE, tag=self.MPI.ANY_TAG,
+                                 status=status)
+        return message, status.Get_tag()
+
+    def handle(self, message, tag):
+        if tag == _MPI_DATA:
+            key, value = message
+            self.copies.setdefault(key, [value, 0])[1] += 1
+        elif tag == _MPI_SEND:
+            key, dest = message
+            # isend pickles the token immediately
+            self.requests.append(self.comm.isend((key, self.store[key]), dest=dest,
+                                                 tag=_MPI_DATA))
+        elif tag == _MPI_FREE:
+            for key in message:
+                self.store.pop(key, None)
+        elif tag == _MPI_STOP:
+            self.stopped = True
+
+    def _get(self, value):
+        if not isinstance(value, _MPIKey):
+            return value
+        if value.rank == self.rank:
+            return self.store[value]
+        copy = self.copies[value]
+        copy[1] -= 1
+        if not copy[1]:
+            del self.copies[value]
+        return copy[0]
+
+    def run_task(self, task_id, func, args, kwargs, inline_size):
+        needed = Counter(value for value in itertools.chain(args, kwargs.values())
+                         if isinstance(value, _MPIKey) and value.rank != self.rank)
+        # serve other ranks while waiting for the input tokens
+        while any(self.copies.get(key, (None, 0))[1] < count for key, count in needed.items()):
+            self.handle(*self._recv())
+            if self.stopped:
+                return
+        args = tuple(self._get(value) for value in args)
+        kwargs = {name: self._get(value) for name, value in kwargs.items()}
+        try:
+            result = func(*args, **kwargs)
+            if result and not hasattr(result, 'items'):
+                raise ValueError('The execute method must return '
+                                 'a dict-like object with items method')
+            outputs = []
+            for name, value in (result.items() if result else ()):
+                # tokens of a batch are kept separately, in order
+                for token in wowp.components.iter_tokens(value):
+                    if _is_small(token, inline_size):
+                        outputs.append((name, None, token))
+                    else:
+                        key = _MPIKey(self.rank, next(self._keys))
+                        self.store[key] = token
+                        outputs.append((name, key, None))
+        except Exception as error:
+            try:
+                dumps(error)
+            except Exception:
+                error = RuntimeError(repr(error))
+            self.comm.send((task_id, None, error, traceback.format_exc()), dest=0, tag=_MPI_DONE)
+        else:
+            self.comm.send((task_id, outputs, None, None), dest=0, tag=_MPI_DONE)
+
+
+def mpi_worker(comm=None):
+    """Run MPIScheduler tasks on this (non-zero) rank until the scheduler shuts down
+
+    Args:
+        comm (Optional): MPI communicator [MPI.COMM_WORLD]
+    """
+    if comm is None:
+        comm = _backend('mpi4py').MPI.COMM_WORLD
+    _MPIWorker(comm).serve()
+
+
+# marks threads running ThreadedSchedulerWorker.run
+_pool_thread = threading.local()
+
+
+# task value letting an actor run with an incomplete batch, see ThreadedScheduler
+_FLUSH = object()
+
+
+class ThreadedSchedulerWorker(_ActorRunner):
+    """Runs actors of the ThreadedScheduler, one task after another.
+
+    Workers run in threads of a shared ThreadingExecutor (or in the thread
+    calling ThreadedScheduler.execute), so that no threads are started
+    for individual executions.
     """
 
     def __init__(self, scheduler, inner_id):
-        threading.Thread.__init__(self)
         self.scheduler = scheduler
-        self.executing = False
-        self.finished = False
         self.inner_id = inner_id
-        self.state_mutex = threading.RLock()
 
     def run(self):
-        from time import sleep
-        while not self.finished:
-            pv = self.scheduler.pop_idle_task()
-            if pv:
-                port, value = pv
-                should_run = port.put(value)  # Change to if
-                if should_run:
-                    # print(self.inner_id, port.owner.name, value)
-                    self.run_actor(port.owner)
-                else:
-                    pass
-                    # print(self.inner_id, "Won't run", )
-                self.scheduler.on_actor_finished(port.owner)
+        """Process tasks until there is no idle task left
+        """
+        _pool_thread.is_worker = True
+        try:
+            while True:
+                pv = self.scheduler.pop_idle_task(release_worker=True)
+                if pv is None:
+                    return
+                try:
+                    self.process(*pv)
+                except Exception:
+                    # will be re-raised in ThreadedScheduler.execute
+                    logger.error('actor {} failed\n{}'.format(
+                        pv[0].owner.name, traceback.format_exc()))
+                    self.scheduler.errors.append(sys.exc_info())
+                # let other workers pick up tasks
+                time.sleep(0)
+        finally:
+            _pool_thread.is_worker = False
+
+    def process(self, port, value, tag=None):
+        previous = current_tag()
+        set_tag(tag)
+        try:
+            if value is _FLUSH:
+                should_run = port.owner.can_run()
             else:
-                pass
-                # print(self.inner_id, "Nothing to do")
-                sleep(0.02)
-                # print(self.inner_id, "End")
+                should_run = port.put(value)
+            if should_run:
+                self.run_actor(port.owner)
+            if getattr(port.owner, 'flush_deadline', None) is not None:
+                with self.scheduler.state_mutex:
+                    self.scheduler._defer(port.owner)
+        finally:
+            set_tag(previous)
+            self.scheduler.on_actor_finished(port.owner, tag)
 
     def put_value(self, in_port, value):
-        # print(self.inner_id, " worker put ", value)
         self.scheduler.put_value(in_port, value)
 
-    def finish(self):
-        """Finish after the current running job is done."""
-        with self.state_mutex:
-            self.finished = True
+    def put_values(self, in_port, values):
+        self.scheduler.put_values(in_port, values)
+
+    def port_loads(self, ports):
+        return self.scheduler.port_loads(ports)
 
+    def copy(self):
+        return self.scheduler.copy()
+
+
+class ThreadedScheduler(_BatchFlusher):
+    """Scheduler running actors in parallel threads.
+
+    The threads come from a shared ThreadingExecutor (see get_executor),
+    hence they are reused by all executions, copies and other ThreadedScheduler
+    instances with the same max_threads.
+
+    Args:
+        max_threads (int): maximum number of concurrently running actors
+
+    An actor runs once at a time for each tag (see run_tagged).
+    """
 
-class ThreadedScheduler(object):
     def __init__(self, max_threads=2):
         self.max_threads = max_threads
-        self.threads = []
+        # (port, value, tag)
         self.execution_queue = deque()
+        # (actor, tag)
         self.running_actors = []
         self.state_mutex = threading.RLock()
+        self._state_changed = threading.Condition(self.state_mutex)
+        # number of workers submitted to the thread pool and not finished yet
+        self._active_workers = 0
+        self._last_worker_id = 0
+        self._executing = False
+        self._caller_works = False
+        # (actor, tag): actors waiting for incomplete batches, see BatchMixin
+        self._deferred = {}
+        # exc_info of failures in pool threads
+        self.errors = []
 
     def copy(self):
         return self.__class__(max_threads=self.max_threads)
 
-    def pop_idle_task(self):
+    @property
+    def executor(self):
+        return get_executor('threading', min_engines=self.max_threads)
+
+    def pop_idle_task(self, release_worker=False):
+        """Get the first (port, value, tag) whose actor is not running (for the tag),
+        None if there is none
+
+        :param release_worker: decrease the number of active pool workers if None is returned
+        """
         with self.state_mutex:
-            for port, value in self.execution_queue:
-                if port.owner not in self.running_actors:
+            for task in self.execution_queue:
+                port, value, tag = task
+                if (port.owner, tag) not in self.running_actors:
                     # Removes first occurrence - it's probably safe
-                    # print("Removing", value)
-                    self.execution_queue.remove((port, value))
-                    self.running_actors.append(port.owner)
-                    return port, value
+                    self.execution_queue.remove(task)
+                    self.running_actors.append((port.owner, tag))
+                    return task
             else:
+                if release_worker:
+                    self._active_workers -= 1
                 return None
 
     def put_value(self, in_port, value):
-        with self.state_mutex:  # Probably not necessary
-            # print("put ", value, ", in queue: ", len(self.queue))
-            self.execution_queue.append((in_port, value))
+        with self.state_mutex:
+            self.execution_queue.append((in_port, value, current_tag()))
+            self._state_changed.notify_all()
+            if self._executing:
+                self._start_workers()
+
+    def put_values(self, in_port, values):
+        """Put several values into the input port, see _ActorRunner.put_values
+        """
+        tag = current_tag()
+        with self.state_mutex:
+            self.execution_queue.extend((in_port, value, tag) for value in values)
+            self._state_changed.notify_all()
+            if self._executing:
+                self._start_workers()
+
+    def port_loads(self, ports):
+        """Load of the actors owning the input ports, see _ActorRunner.port_loads
+        """
+        with self.state_mutex:
+            return _port_loads(ports, self.execution_queue, self.running_actors)
+
+    def _queue_flushes(self, due):
+        """Queue tasks running the actors with incomplete batches
+        """
+        for actor, tag in due:
+            self.execution_queue.append((next(iter(actor.inports)), _FLUSH, tag))
+        self._start_workers()
+
+    def _start_workers(self):
+        with self.state_mutex:
+            max_workers = self.max_threads - 1 if self._caller_works else self.max_threads
+            # workers running actors do not pick up new tasks meanwhile
+            while (self._active_workers < max_workers and
+                   self._active_workers - len(self.running_actors) < len(self.execution_queue)):
+                self._active_workers += 1
+                self._last_worker_id += 1
+                worker = ThreadedSchedulerWorker(self, self._last_worker_id)
+                self.executor.submit(worker.run)
 
     def is_running(self):
         with self.state_mutex:
             return bool(self.running_actors or self.execution_queue)
 
-    def on_actor_finished(self, actor):
+    def on_actor_finished(self, actor, tag=None):
         with self.state_mutex:
-            self.running_actors.remove(actor)
-            if not self.is_running():
-                self.finish_all_threads()
+            self.running_actors.remove((actor, tag))
+            self._state_changed.notify_all()
 
     def execute(self):
-        with self.state_mutex:  # Probably not necessary
-            for i in range(self.max_threads):
-                thread = ThreadedSchedulerWorker(self, i)
-                self.threads.append(thread)
-                thread.start()
-                # print("Thread started", thread.ident)
-        for thread in self.threads:
-            # print("Join thread")
-            thread.join()
+        """Run until all queued values are processed
+
+        Nested executions (e.g. Map) called from a pool thread process tasks
+        in the calling thread as well, which guarantees progress even if
+        all pool threads are busy.
+        """
+        worker = ThreadedSchedulerWorker(self, 0)
+        with self.state_mutex:
+            self._executing = True
+            self._caller_works = getattr(_pool_thread, 'is_worker', False)
+            self._start_workers()
+            while True:
+                # no other tokens can arrive when nothing runs, flush all batches
+                due, next_flush = self._due_batches(not self.is_running())
+                if due:
+                    self._queue_flushes(due)
+                elif not self.is_running():
+                    break
+                pv = self.pop_idle_task() if self._caller_works else None
+                if pv is None:
+                    # wait for other workers or the next batch deadline
+                    timeout = None if next_flush is None else max(next_flush - time.time(), 0)
+                    self._state_changed.wait(timeout)
+                    continue
+                self.state_mutex.release()
+                try:
+                    worker.process(*pv)
+                except Exception:
+                    self.errors.append(sys.exc_info())
+                finally:
+                    self.state_mutex.acquire()
+            self._executing = False
+        if self.errors:
+            errors, self.errors = self.errors, []
+            six.reraise(*errors[0])
 
     def run_workflow(self, workflow, **kwargs):
-        inport_names = tuple(port.name for port in workflow.inports)
-        if workflow.scheduler is not None:
-            # TODO this seems a bit strange
-            scheduler = workflow.scheduler
-        else:
-            scheduler = self
-        for key, value in kwargs.items():
-            if key not in inport_names:
-                raise ValueError('{} is not an inport name'.format(key))
-            inport = workflow.inports[key]
-            # put values to connected ports
-            scheduler.put_value(inport, kwargs[inport.name])
+        scheduler = _put_workflow_inputs(self, workflow, kwargs)
         # TODO can this be run inside self.execute itsef?
         scheduler.execute()
 
-    def finish_all_threads(self):
-        # print("Everything finished. Waiting for threads to end.")
-        for thread in self.threads:
-            thread.finish()
+    def run_tagged(self, workflow, input_sets):
+        """Run the workflow for several input sets concurrently, see _ActorRunner.run_tagged
+        """
+        return _run_tagged(self, workflow, input_sets)
 
     def shutdown(self):
+        # threads belong to the shared executor, see shutdown_executors
         pass
+
+
+def _noop():
+    pass
+
+
+def _worker_pid(delay=0):
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _distributed_executor(min_engines, timeout, display_outputs, **kwargs):
+    _backend('distributed')
+    return DistributedExecutor(uris=kwargs.get('uris', None),
+                               min_engines=min_engines,
+                               timeout=timeout,
+                               policy=kwargs.get('policy', 'affinity'))
+
+
+def _ipyparallel_executor(min_engines, timeout, display_outputs, **kwargs):
+    _backend('ipyparallel')
+    return IpyparallelExecutor(min_engines=min_engines,
+                               timeout=timeout,
+                               display_outputs=display_outputs,
+                               **kwargs)
+
+
+# executor type: factory(min_engines, timeout, display_outputs, **executor_kwargs)
+_executor_factories = {
+    'multiprocessing': lambda min_engines, timeout, display_outputs, **kwargs:
+        MultiprocessingExecutor(processes=min_engines, **kwargs),
+    'threading': lambda min_engines, timeout, display_outputs, **kwargs: ThreadingExecutor(
+        max_workers=min_engines, **kwargs),
+    'distributed': _distributed_executor,
+    'ipyparallel': _ipyparallel_executor,
+    'mpi': lambda min_engines, timeout, display_outputs, **kwargs: MPIExecutor(**kwargs),
+}
+
+
+def register_executor(name, factory):
+    """Register an executor type for FuturesScheduler and get_executor
+
+    Args:
+        name (str): executor type
+        factory (callable): factory(min_engines, timeout, display_outputs, **executor_kwargs)
+            returning the executor; optional backends should be imported by the factory
+    """
+    _executor_factories[name] = factory
+
+
+def _new_executor(executor, min_engines=1, timeout=60, display_outputs=False, **kwargs):
+    """Create a new executor of the given type
+    """
+    try:
+        factory = _executor_factories[executor]
+    except KeyError:
+        raise ValueError('Executor {} not supported'.format(executor))
+    return factory(min_engines, timeout, display_outputs, **kwargs)
+
+
+# process-wide registry of shared executors
+_executors = {}
+_executors_lock = threading.RLock()
+
+
+def get_executor(executor, **kwargs):
+    """Get a shared executor, create it on the first request
+
+    Executors are identified by their type and arguments, hence all schedulers
+    (and their copies) requesting the same executor reuse its (warm) workers.
+    Shared executors live until shutdown_executors is called
+    or the interpreter exits.
+
+    Args:
+        executor (str): executor type: multiprocessing, threading, distributed, ipyparallel, mpi
+        kwargs: min_engines, timeout, display_outputs and executor specific arguments
+    """
+    key = (executor, repr(sorted(kwargs.items())))
+    with _executors_lock:
+        if key not in _executors:
+            logger.debug('creating shared executor {}'.format(key))
+            _executors[key] = _new_executor(executor, **kwargs)
+        return _executors[key]
+
+
+def executor_resource_pool(executor):
+    """Resource pool of the executor's capacity, shared by all schedulers using it
+
+    Args:
+        executor: executor instance, e.g. from get_executor
+    """
+    with _executors_lock:
+        pool = getattr(executor, 'resource_pool', None)
+        if pool is None:
+            pool = executor.resource_pool = ResourcePool(
+                getattr(executor, 'capacity', None),
+                getattr(executor, 'worker_capacity', None))
+        return pool
+
+
+def shutdown_executors(executor=None, wait=True):
+    """Shut down shared executors
+
+    Args:
+        executor (Optional[str]): shut down only executors of this type
+        wait (Optional[bool]): wait for running jobs
+    """
+    with _executors_lock:
+        keys = [key for key in _executors if executor is None or key[0] == executor]
+        for key in keys:
+            shared = _executors.pop(key)
+            if hasattr(shared, 'shutdown'):
+                try:
+                    shared.shutdown(wait=wait)
+                except TypeError:
+                    shared.shutdown()
+
+
+atexit.register(shutdown_executors)
@@ -0,0 +1,284 @@
+"""Pools of scratch directories for FileCommand runs
+
+Creating (and removing) a temporary directory for every run costs several
+metadata operations, which dominate short runs on parallel file systems.
+ScratchPool hands out directories, cleans the released ones in a background
+thread and reuses them. Directories can be placed on node-local RAM disks
+('tmpfs' root = /dev/shm), with quotas per root; when a root is full, the next
+one is used.
+
+Directories with outputs are held until all the tokens referring to them
+are released (see FileCommand(scratch=..., artifacts=True)).
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+
+import six
+from six.moves import queue
+
+from .logger import logger
+
+__all__ = ["ScratchPool", "get_scratch_pool", "shutdown_scratch_pools"]
+
+# node-local RAM disk
+TMPFS = '/dev/shm'
+
+
+def _expand_root(root):
+    if root == 'tmpfs':
+        return TMPFS if os.path.isdir(TMPFS) else None
+    return os.path.abspath(root)
+
+
+def _clear(path):
+    """Remove the content of the directory
+    """
+    for name in os.listdir(path):
+        entry = os.path.join(path, name)
+        if os.path.isdir(entry) and not os.path.islink(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+
+
+def _size(path):
+    """Total size of the files in the directory
+    """
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class _Root(object):
+
+    def __init__(self, path):
+        self.path = path
+        # clean directories ready for reuse
+        self.idle = []
+        # number of directories in use, held or being cleaned
+        self.dirs = 0
+        # bytes held by outputs
+        self.held = 0
+
+
+class ScratchPool(object):
+    """Reusable scratch directories
+
+    Args:
+        roots (Optional[list]): directories where the scratch directories are created,
+            in the order of preference, 'tmpfs' stands for a node-local RAM disk
+            (skipped if not available) [temporary directory]
+        quota (Optional[int]): maximum bytes held by outputs in a root [None = unlimited]
+        max_dirs (Optional[int]): maximum number of directories in a root [None = unlimited]
+        max_idle (Optional[int]): maximum number of clean directories kept
+            for reuse in a root [16]
+    """
+
+    def __init__(self, roots=None, quota=None, max_dirs=None, max_idle=16):
+        if roots is None:
+            roots = [tempfile.gettempdir()]
+        elif isinstance(roots, six.string_types):
+            roots = [roots]
+        roots = [_expand_root(root) for root in roots]
+        self.roots = [_Root(root) for root in roots if root is not None]
+        if not self.roots:
+            raise ValueError('no scratch root available')
+        self.quota = quota
+        self.max_dirs = max_dirs
+        self.max_idle = max_idle
+        # path: [root, references, held bytes]
+        self._dirs = {}
+        self._lock = threading.Lock()
+        self._cleaning = queue.Queue()
+        self._thread = None
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, [root.path for root in self.roots])
+
+    def _full(self, root):
+        if self.max_dirs is not None and root.dirs >= self.max_dirs:
+            return True
+        return self.quota is not None and root.held >= self.quota
+
+    def acquire(self):
+        """Get a clean directory, the caller must release it
+
+        Raises:
+            IOError: all the roots are full even after finishing the pending cleanups
+        """
+        for attempt in range(2):
+            with self._lock:
+                for root in self.roots:
+                    if root.idle:
+                        path = root.idle.pop()
+                    elif not self._full(root):
+                        # reserve the slot, create the directory outside of the lock
+                        root.dirs += 1
+                        path = None
+                    else:
+                        continue
+                    break
+                else:
+                    root = None
+            if root is not None:
+                break
+            # released directories may be still being cleaned
+            self.wait()
+        else:
+            raise IOError('scratch quota exceeded in {}'.format(
+                [root.path for root in self.roots]))
+        if path is None:
+            try:
+                path = tempfile.mkdtemp(prefix='wowp-scratch-', dir=root.path)
+            except Exception:
+                with self._lock:
+                    root.dirs -= 1
+                raise
+        with self._lock:
+            self._dirs[path] = [root, 1, 0]
+        return path
+
+    def hold(self, path, references=1):
+        """Keep the directory (with outputs) until released references times more
+
+        The content counts to the quota.
+        """
+        size = _size(path)
+        with self._lock:
+            entry = self._dirs[path]
+            entry[1] += references
+            if not entry[2]:
+                entry[2] = size
+                entry[0].held += size
+
+    def release(self, path):
+        """Release a reference to the directory
+
+        Directories without references are cleaned asynchronously and reused,
+        detached directories are ignored.
+        """
+        with self._lock:
+            entry = self._dirs.get(path)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._dirs[path]
+            entry[0].held -= entry[2]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._clean_loop, name='ScratchPool')
+                self._thread.daemon = True
+                self._thread.start()
+        self._cleaning.put((entry[0], path))
+
+    def detach(self, path):
+        """Stop managing the directory, it is left in place with its content
+        """
+        with self._lock:
+            root = self._dirs.pop(path)[0]
+            root.dirs -= 1
+
+    def _clean_loop(self):
+        while True:
+            item = self._cleaning.get()
+            try:
+                if item is None:
+                    return
+                root, path = item
+                try:
+                    _clear(path)
+                except OSError:
+                    logger.warning('cannot clean scratch directory {}'.format(path))
+                    reuse = False
+                else:
+                    with self._lock:
+                        reuse = len(root.idle) < self.max_idle
+                        if reuse:
+                            root.idle.append(path)
+                if not reuse:
+                    shutil.rmtree(path, ignore_errors=True)
+                    with self._lock:
+                        root.dirs -= 1
+            finally:
+                self._cleaning.task_done()
+
+    def wait(self):
+        """Wait for the pending cleanups
+        """
+        self._cleaning.join()
+
+    def usage(self):
+        """Number of directories, idle directories and bytes held, by root
+        """
+        with self._lock:
+            return {root.path: {'dirs': root.dirs, 'idle': len(root.idle), 'held': root.held}
+                    for root in self.roots}
+
+    def shutdown(self):
+        """Finish the pending cleanups and remove the idle directories
+
+        Directories still in use or held are left in place.
+        """
+        self.wait()
+        if self._thread is not None:
+            self._cleaning.put(None)
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            for root in self.roots:
+                while root.idle:
+                    shutil.rmtree(root.idle.pop(), ignore_errors=True)
+                    root.dirs -= 1
+
+
+# configuration: ScratchPool of this process
+_pools = {}
+_pools_pid = [None]
+_pools_lock = threading.Lock()
+
+
+def get_scratch_pool(roots=None, quota=None, max_dirs=None, max_idle=16):
+    """Get the process-wide pool with the given configuration, create it on the first request
+
+    FileCommand actors running in the same process share the pool,
+    forked processes (e.g. executor workers) get pools of their own.
+    """
+    if isinstance(roots, list):
+        roots = tuple(roots)
+    key = (roots, quota, max_dirs, max_idle)
+    with _pools_lock:
+        if _pools_pid[0] != os.getpid():
+            # directories and the cleaning thread belong to the parent process
+            _pools.clear()
+            _pools_pid[0] = os.getpid()
+        if key not in _pools:
+            _pools[key] = ScratchPool(None if roots is None else list(roots), quota=quota,
+                                      max_dirs=max_dirs, max_idle=max_idle)
+        return _pools[key]
+
+
+def shutdown_scratch_pools():
+    """Shut down the process-wide pools
+    """
+    with _pools_lock:
+        if _pools_pid[0] != os.getpid():
+            # pools of the parent process
+            _pools.clear()
+        while _pools:
+            _pools.popitem()[1].shutdown()
+
+
+atexit.register(shutdown_scratch_pools)
@@ -0,0 +1,20 @@
+"""Asynchronous subprocess pool for shell commands
+
+ShellPool runs commands as asyncio subprocesses in an event loop thread of its
+own, at most max_concurrency at a time, hence hundreds of short commands do not
+occupy a thread (or an executor slot) each. The output is read from pipes, can be
+streamed to a callback and can be capped, no temporary files are used.
+
+The pool can be used from any thread (submit, run) as well as from coroutines
+running in other event loops (run_async). Requires Python 3.5+, ImportError is
+raised by older versions.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import sys
+
+if sys.version_info < (3, 5):
+    raise ImportError('wowp.shellpool requires Python 3.5+')
+
+from ._shellpool import ShellPool, get_shell_pool, shutdown_shell_pools
+
+__all__ = ["ShellPool", "get_shell_pool", "shutdown_shell_pools"]
@@ -0,0 +1,183 @@
+"""Parameter sweeps: run a workflow for many input sets in one process
+
+Used by ``wowp --sweep``. Concurrent runs use their own workflow instances
+and schedulers, FuturesScheduler's share the (warm) executors. Alternatively,
+concurrent runs are tagged invocations (see wowp.tags) of a single workflow
+instance run by a single scheduler.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import ast
+import csv
+import io
+import itertools
+import json
+import threading
+
+__all__ = ["read_input_sets", "run_sweep", "write_result"]
+
+
+def _literal(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def read_input_sets(path):
+    """Iterate over input sets in a JSON lines or CSV file
+
+    JSON lines files contain one object (port names and values) per line.
+    CSV files have a header with port names, values are evaluated as Python
+    literals if possible (strings otherwise). CSV is used for .csv files.
+
+    Args:
+        path (str): file path
+
+    Yields:
+        dict: input port names and values
+    """
+    with io.open(path, 'r', newline='' if path.lower().endswith('.csv') else None) as f:
+        if path.lower().endswith('.csv'):
+            for row in csv.DictReader(f):
+                yield {name: _literal(value) for name, value in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_result(f, index, inputs, outputs, error):
+    """Write a sweep result as a JSON line and flush the file
+
+    Values that cannot be serialized are written using repr.
+    """
+    record = {'index': index, 'inputs': inputs}
+    if error is None:
+        record['outputs'] = outputs
+    else:
+        record['error'] = repr(error)
+    f.write(json.dumps(record, default=repr) + '\n')
+    f.flush()
+
+
+def run_sweep(make_workflow, make_scheduler, input_sets, callback, concurrency=1,
+              defaults=None, tagged=False):
+    """Run the workflow for each input set
+
+    Args:
+        make_workflow (callable): returns a new workflow instance
+        make_scheduler (callable): returns a new scheduler
+        input_sets (iterable): dicts of input port values, consumed lazily
+        callback (callable): callback(index, inputs, outputs, error) called as soon
+            as a run completes, outputs are lists of values of output ports;
+            calls are serialized
+        concurrency (Optional[int]): maximum number of concurrent runs [1]
+        defaults (Optional[dict]): input values common to all sets
+        tagged (Optional[bool]): run batches of up to concurrency input sets as tagged
+            invocations of one workflow instance by one scheduler (see run_tagged);
+            sets of a failed batch are rerun one by one [False]
+
+    Returns:
+        int: number of failed runs
+    """
+    input_sets = enumerate(input_sets)
+    if tagged:
+        return _run_tagged_sweep(make_workflow, make_scheduler, input_sets, callback,
+                                 concurrency, defaults)
+    input_lock = threading.Lock()
+    callback_lock = threading.Lock()
+    failed = [0]
+
+    def next_set():
+        with input_lock:
+            return next(input_sets, None)
+
+    def work():
+        workflow = make_workflow()
+        scheduler = make_scheduler()
+        try:
+            item = next_set()
+            while item is not None:
+                index, inputs = item
+                kwargs = dict(defaults or {})
+                kwargs.update(inputs)
+                try:
+                    scheduler.run_workflow(workflow, **kwargs)
+                    outputs = {port.name: list(port.pop_all()) for port in workflow.outports}
+                    error = None
+                except Exception as e:
+                    outputs, error = None, e
+                    # tokens of the failed run must not leak into the next one
+                    workflow = make_workflow()
+                    if hasattr(scheduler, 'reset'):
+                        scheduler.reset()
+                with callback_lock:
+                    if error is not None:
+                        failed[0] += 1
+                    callback(index, inputs, outputs, error)
+                item = next_set()
+        finally:
+            if hasattr(scheduler, 'shutdown'):
+                scheduler.shutdown()
+
+    def guarded_work():
+        try:
+            work()
+        except Exception as e:
+            # e.g. workflow or scheduler creation or the callback failed
+            errors.append(e)
+
+    errors = []
+    threads = [threading.Thread(target=guarded_work) for _ in range(max(concurrency, 1))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return failed[0]
+
+
+def _run_tagged_sweep(make_workflow, make_scheduler, input_sets, callback, concurrency,
+                      defaults):
+    workflow = make_workflow()
+    scheduler = make_scheduler()
+    failed = 0
+
+    def run(batch):
+        kwargs = []
+        for index, inputs in batch:
+            kwargs.append(dict(defaults or {}))
+            kwargs[-1].update(inputs)
+        results = scheduler.run_tagged(workflow, kwargs)
+        return [{name: list(values) for name, values in result.items()} for result in results]
+
+    try:
+        while True:
+            batch = list(itertools.islice(input_sets, max(concurrency, 1)))
+            if not batch:
+                return failed
+            try:
+                results = [(outputs, None) for outputs in run(batch)]
+            except Exception as e:
+                if hasattr(scheduler, 'reset'):
+                    scheduler.reset()
+                if len(batch) == 1:
+                    results = [(None, e)]
+                else:
+                    # find the failing sets
+                    results = []
+                    for item in batch:
+                        try:
+                            results.append((run([item])[0], None))
+                        except Exception as error:
+                            if hasattr(scheduler, 'reset'):
+                                scheduler.reset()
+                            results.append((None, error))
+            for (index, inputs), (outputs, error) in zip(batch, results):
+                if error is not None:
+                    failed += 1
+                callback(index, inputs, outputs, error)
+    finally:
+        if hasattr(scheduler, 'shutdown'):
+            scheduler.shutdown()
@@ -0,0 +1,90 @@
+"""Invocation tags ("colored" tokens)
+
+Tokens of independent workflow invocations carry different tags, hence one
+workflow instance can process several input sets at the same time. Port buffers
+and the state of stateful actors (see TaggedAttribute) are kept per tag.
+Schedulers record the current tag with every queued token and restore it when
+the token is processed, see _ActorRunner.run_tagged.
+
+Untagged runs use the None tag.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import itertools
+import threading
+
+__all__ = ["current_tag", "new_tag", "tagged", "TaggedAttribute"]
+
+
+class _Context(threading.local):
+    # the current tag of the thread
+    tag = None
+
+
+_context = _Context()
+_tags = itertools.count(1)
+
+
+def current_tag():
+    """Tag of the tokens processed by this thread, None if untagged
+    """
+    return _context.tag
+
+
+def set_tag(tag):
+    """Set the current tag of this thread (used by the schedulers)
+    """
+    _context.tag = tag
+
+
+def new_tag():
+    """Get a new, process-wide unique tag
+    """
+    return next(_tags)
+
+
+class tagged(object):
+    """Context manager setting the current tag
+
+    Example:
+        with tagged(new_tag()):
+            scheduler.put_value(port, value)
+    """
+
+    def __init__(self, tag):
+        self.tag = tag
+
+    def __enter__(self):
+        self._previous = current_tag()
+        set_tag(self.tag)
+        return self.tag
+
+    def __exit__(self, *exc_info):
+        set_tag(self._previous)
+
+
+class TaggedAttribute(object):
+    """Actor attribute with a separate value for each tag
+
+    Used for the state of actors that are fired several times per invocation,
+    e.g. LoopWhile, so that concurrent invocations do not interfere.
+
+    Args:
+        name (str): attribute name
+        default: value for tags that did not set the attribute
+    """
+
+    def __init__(self, name, default=None):
+        self.name = name
+        self.default = default
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        try:
+            return obj.__dict__['_tagged_state'][_context.tag][self.name]
+        except KeyError:
+            return self.default
+
+    def __set__(self, obj, value):
+        states = obj.__dict__.setdefault('_tagged_state', {})
+        states.setdefault(current_tag(), {})[self.name] = value
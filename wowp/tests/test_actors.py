@@ -1,9 +1,10 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import random
+import threading
 
 from wowp.actors import FuncActor, Switch, ShellRunner, DictionaryMerge, LoopWhile
-from wowp.schedulers import NaiveScheduler
+from wowp.schedulers import NaiveScheduler, LinearizedScheduler, FuturesScheduler
 from wowp.components import Actor
 import nose
 from nose.plugins.skip import SkipTest
@@ -122,6 +123,93 @@ def test_LoopWhileActor():
     assert (result == 10)
 
 
+# threads running loop_inc
+loop_threads = []
+
+
+def loop_inc(x, step=1):
+    loop_threads.append(threading.current_thread())
+    return x + step
+
+
+def loop_small(x):
+    return x < 10
+
+
+def _loop(inline, scheduler=None, condition_actor=False):
+    """LoopWhile with a (loop_inc, loop_inc) body, returns (exit value, number of runs)
+    """
+    if condition_actor:
+        lw = LoopWhile('a_loop', inline=inline)
+        ca = FuncActor(loop_small, outports=('out', ))
+        ca.inports['x'] += lw.outports['condition_in']
+        lw.inports['condition_out'] += ca.outports['out']
+    else:
+        lw = LoopWhile('a_loop', loop_small, inline=inline)
+    fa1 = FuncActor(loop_inc, inports=('x', ), outports=('x', ))
+    fa2 = FuncActor(loop_inc, kwargs={'step': 2}, inports=('x', ), outports=('x', ))
+    fa1.inports['x'] += lw.outports['loop']
+    fa2.inports['x'] += fa1.outports['x']
+    lw.inports['loop'] += fa2.outports['x']
+    runs = []
+    run = lw.run
+
+    def counted_run(*args, **kwargs):
+        runs.append(1)
+        return run(*args, **kwargs)
+
+    lw.run = counted_run
+    scheduler = scheduler or LinearizedScheduler()
+    scheduler.put_value(lw.inports['init'], 0)
+    scheduler.execute()
+    return lw.outports['exit'].pop(), len(runs)
+
+
+def test_LoopWhile_inline():
+    for condition_actor in (False, True):
+        # the whole loop in a single run
+        assert _loop(None, condition_actor=condition_actor) == (12, 1)
+        assert _loop(False, condition_actor=condition_actor)[0] == 12
+        assert _loop(False, condition_actor=condition_actor)[1] > 1
+        # one executor job
+        del loop_threads[:]
+        assert _loop(None, FuturesScheduler('threading', min_engines=4),
+                     condition_actor) == (12, 1)
+        assert len(set(loop_threads)) == 1
+        assert loop_threads[0] is not threading.current_thread()
+    # the executor job requires the actor's resources
+    lw = LoopWhile('a_loop', loop_small)
+    lw.resources = {'cores': 1000}
+    fa = FuncActor(loop_inc, inports=('x', ), outports=('x', ))
+    fa.inports['x'] += lw.outports['loop']
+    lw.inports['loop'] += fa.outports['x']
+    scheduler = FuturesScheduler('threading', min_engines=2)
+    scheduler.put_value(lw.inports['init'], 0)
+    nose.tools.assert_raises(ValueError, scheduler.execute)
+    # other links cannot run inline
+    lw = LoopWhile('a_loop', loop_small, inline=True)
+    sw = Switch('switch', loop_small)
+    sw.inports['inp'] += lw.outports['loop']
+    lw.inports['loop'] += sw.outports['true']
+    lw.inports['init'].put(0)
+    nose.tools.assert_raises(ValueError, NaiveScheduler().run_actor, lw)
+    # the body actor gets tokens from outside of the loop too
+    for inline in (True, None):
+        lw = LoopWhile('a_loop', loop_small, inline=inline)
+        fa = FuncActor(loop_inc, inports=('x', ), outports=('x', ))
+        outside = FuncActor(loop_inc, inports=('x', ), outports=('x', ))
+        fa.inports['x'] += lw.outports['loop']
+        fa.inports['x'] += outside.outports['x']
+        lw.inports['loop'] += fa.outports['x']
+        lw.inports['init'].put(0)
+        if inline:
+            nose.tools.assert_raises(ValueError, NaiveScheduler().run_actor, lw)
+        else:
+            assert lw._inline_loop() is None
+            NaiveScheduler().run_actor(lw)
+            assert lw.outports['exit'].pop() == 10
+
+
 def test_SwitchActor():
 
     for val in (True, False):
@@ -187,5 +275,48 @@ def test_DictionaryMerge():
     assert (out["b"] == "bb")
 
 
+def test_FuncActor_vectorized():
+    try:
+        import numpy as np
+    except ImportError:
+        raise SkipTest
+
+    calls = []
+
+    def scale(x, y, factor=1):
+        calls.append(len(x))
+        return x * factor, x + y
+
+    fa = FuncActor(scale, kwargs={'factor': 2}, outports=('a', 'b'), vectorized=True)
+    scheduler = LinearizedScheduler()
+    for i in range(10):
+        scheduler.put_value(fa.inports.x, i)
+        scheduler.put_value(fa.inports.y, 0.5)
+    scheduler.execute()
+    # one call for all queued tokens, results split back in order
+    assert calls == [10]
+    assert list(fa.outports.a.pop_all()) == [2 * i for i in range(10)]
+    assert list(fa.outports.b.pop_all()) == [i + 0.5 for i in range(10)]
+
+    # row-wise vectors, limited batches
+    norm = FuncActor(np.linalg.norm, kwargs={'axis': 1}, inports='v', vectorized=True,
+                     batch_size=3)
+    sink = FuncActor(lambda x: x, inports='x')
+    norm.outports.out.connect(sink.inports.x)
+    scheduler = FuturesScheduler('threading')
+    for i in range(5):
+        scheduler.put_value(norm.inports.v, [3 * i, 4 * i])
+    scheduler.execute()
+    assert list(sink.outports.out.pop_all()) == [5.0 * i for i in range(5)]
+
+    fa = FuncActor(np.sum, inports='x', vectorized=True)
+    fa.inports.x.put(1)
+    fa.inports.x.put(2)
+    nose.tools.assert_raises(ValueError, NaiveScheduler().run_actor, fa)
+    # batches of vectorized actors only
+    nose.tools.assert_raises(ValueError, FuncActor, np.sum, batch_size=3)
+    nose.tools.assert_raises(ValueError, FuncActor, np.sum, batch_latency=0.1)
+
+
 if __name__ == '__main__':
     nose.run(argv=[__file__, '-vv'])
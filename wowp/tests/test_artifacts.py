@@ -0,0 +1,168 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import io
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from wowp.actors.omfit import FileCommand
+from wowp.artifacts import FileArtifact, publish
+from nose.plugins.skip import SkipTest
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+    ProcessPoolExecutor(1, initializer=None)
+except TypeError:
+    ProcessPoolExecutor = None
+
+
+def _init_node(node, scratch, shared_roots=''):
+    os.environ['WOWP_NODE'] = node
+    os.environ['WOWP_SCRATCH'] = scratch
+    os.environ['WOWP_SHARED_ROOTS'] = shared_roots
+
+
+def produce(text, directory=False, compress=False):
+    path = tempfile.mkdtemp(dir=os.environ['WOWP_SCRATCH'])
+    for name in ('a.txt', 'b.txt'):
+        with io.open(os.path.join(path, name), 'w') as f:
+            f.write(text + name)
+    if not directory:
+        path = os.path.join(path, 'a.txt')
+    return publish(path, compress=compress)
+
+
+def consume(artifact):
+    path = os.fspath(artifact)
+    with io.open(path) as f:
+        return path, f.read()
+
+
+def consume_members(artifact, names):
+    members = [artifact.member_artifact(name) for name in names]
+    return [os.fspath(member) for member in members]
+
+
+# artifacts kept by the node
+kept = []
+
+
+def keep(artifact):
+    kept.append(artifact)
+    return os.fspath(artifact)
+
+
+def release_kept():
+    del kept[:]
+
+
+def consume_while_stalled(artifact):
+    """Consume the artifact while another transfer from an unresponsive server is pending
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    stalled = FileArtifact('node_x', '/stalled', server.getsockname(), 'stalled')
+    thread = threading.Thread(target=lambda: os.path.exists(stalled))
+    thread.daemon = True
+    thread.start()
+    # the server stops responding (i.e. fails) after 5 s
+    timer = threading.Timer(5, server.close)
+    timer.start()
+    try:
+        start = time.time()
+        text = consume(artifact)[1]
+        return text, time.time() - start
+    finally:
+        timer.join()
+        thread.join()
+
+
+def setup_module():
+    if ProcessPoolExecutor is None or not hasattr(os, 'fspath') or os.name != 'posix':
+        raise SkipTest('requires Python 3.7+ and a POSIX shell')
+    global scratch_a, scratch_b, node_a, node_b
+    scratch_a, scratch_b = tempfile.mkdtemp(), tempfile.mkdtemp()
+    node_a = ProcessPoolExecutor(1, initializer=_init_node, initargs=('node_a', scratch_a))
+    node_b = ProcessPoolExecutor(1, initializer=_init_node, initargs=('node_b', scratch_b))
+
+
+def teardown_module():
+    node_a.shutdown()
+    node_b.shutdown()
+    shutil.rmtree(scratch_a)
+    shutil.rmtree(scratch_b)
+
+
+def test_transfer_file():
+    for compress in (False, True):
+        artifact = node_a.submit(produce, 'data', compress=compress).result()
+        assert isinstance(artifact, FileArtifact)
+        assert artifact.node == 'node_a'
+        path, text = node_b.submit(consume, artifact).result()
+        assert text == 'dataa.txt'
+        assert path.startswith(scratch_b)
+        # the copy was dropped with the consumed artifact
+        assert not node_b.submit(os.path.exists, path).result()
+        # resolved in place on the same node
+        assert node_a.submit(consume, artifact).result()[0] == artifact.path
+
+
+def test_transfer_directory():
+    artifact = node_a.submit(produce, 'dir', directory=True, compress=True).result()
+    path, text = node_b.submit(consume, artifact.member_artifact('b.txt')).result()
+    assert text == 'dirb.txt'
+    # all members were transferred at once
+    path_a, path_b = node_b.submit(consume_members, artifact, ('a.txt', 'b.txt')).result()
+    assert os.path.dirname(path_a) == os.path.dirname(path_b)
+    # the copy is kept while an artifact references it
+    path = node_b.submit(keep, artifact).result()
+    assert node_b.submit(os.path.exists, os.path.join(path, 'a.txt')).result()
+    node_b.submit(release_kept).result()
+    assert not node_b.submit(os.path.exists, path).result()
+
+
+def test_concurrent_transfers():
+    artifact = node_a.submit(produce, 'data').result()
+    # the unresponsive server does not block the transfer
+    text, duration = node_b.submit(consume_while_stalled, artifact).result()
+    assert text == 'dataa.txt'
+    assert duration < 4
+
+
+def test_shared_roots():
+    shared = ProcessPoolExecutor(1, initializer=_init_node,
+                                 initargs=('node_c', scratch_b, scratch_a))
+    try:
+        artifact = node_a.submit(produce, 'shared').result()
+        assert shared.submit(consume, artifact).result() == (artifact.path, 'shareda.txt')
+    finally:
+        shared.shutdown()
+
+
+def test_FileCommand_artifacts():
+    input_file = os.path.join(scratch_a, 'input.txt')
+    with io.open(input_file, 'w') as f:
+        f.write('input')
+    first = FileCommand('first', 'cat in.txt > out.txt; echo " first" >> out.txt',
+                        input_files=(('in.txt', 'inp'), ),
+                        output_files=(('out.txt', 'out'), ),
+                        workdir=scratch_a, artifacts=True, pack_outputs=True, compress=True)
+    second = FileCommand('second', 'cat in.txt > out.txt; echo " second" >> out.txt',
+                         input_files=(('in.txt', 'inp'), ),
+                         output_files=(('out.txt', 'out'), ),
+                         workdir=scratch_b, artifacts=True)
+
+    first.inports['inp'].put(input_file)
+    args, kwargs = first.get_run_args()
+    artifact = node_a.submit(FileCommand.run, *args, **kwargs).result()['out']
+    assert isinstance(artifact, FileArtifact)
+
+    second.inports['inp'].put(artifact)
+    args, kwargs = second.get_run_args()
+    output = node_b.submit(FileCommand.run, *args, **kwargs).result()['out']
+    assert output.node == 'node_b'
+    path, text = node_b.submit(consume, output).result()
+    assert path.startswith(scratch_b)
+    assert text == 'input first\n second\n'
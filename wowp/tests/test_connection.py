@@ -38,5 +38,41 @@ def test_frozen_port():
     assert_raises(IndexError, actor.inports.in_port.put, value)
 
 
+def _chain(length):
+    actors = [Actor(name='actor {}'.format(i)) for i in range(length)]
+    for actor in actors:
+        actor.inports.append('inp')
+        actor.outports.append('out')
+    for prev, actor in zip(actors[:-1], actors[1:]):
+        actor.inports['inp'] += prev.outports['out']
+    return actors
+
+
+def test_long_chain_workflow():
+    # deeper than the default recursion limit
+    actors = _chain(5000)
+    wf = actors[len(actors) // 2].get_workflow()
+    assert list(wf.inports) == [actors[0].inports['inp']]
+    assert list(wf.outports) == [actors[-1].outports['out']]
+
+
+def test_graph_cache():
+    actors = _chain(3)
+    graph = actors[0].graph
+    assert graph is actors[0].graph
+    assert graph.number_of_nodes() == 9
+
+    other = Actor(name='other')
+    other.inports.append('inp')
+    other.inports['inp'] += actors[-1].outports['out']
+    assert actors[0].graph is not graph
+    assert actors[0].graph.number_of_nodes() == 11
+
+    graph = actors[0].graph
+    other.inports['inp'] -= actors[-1].outports['out']
+    assert actors[0].graph is not graph
+    assert actors[0].graph.number_of_nodes() == 9
+
+
 if __name__ == '__main__':
     nose.run(argv=[__file__, '-vv'])
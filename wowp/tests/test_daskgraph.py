@@ -0,0 +1,107 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+from wowp.actors import FuncActor, LoopWhile
+from wowp.actors.mapreduce import Map, Concat
+from wowp.schedulers import LinearizedScheduler
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises
+
+try:
+    import dask
+    from wowp.tools.daskgraph import to_dask_graph, run_dask, DaskGraphActor
+except ImportError:
+    dask = None
+
+
+def setup_module():
+    if dask is None:
+        raise SkipTest('dask not available')
+
+
+def add(a, b):
+    return a + b
+
+
+def square(x):
+    return x * x
+
+
+def inc(x):
+    return x + 1
+
+
+def total(x):
+    return sum(x)
+
+
+class Square(FuncActor):
+    def __init__(self):
+        super(Square, self).__init__(square, outports=('x', ))
+
+
+def _workflow():
+    # (x + y) ** 2 and sum of squares of items
+    adder = FuncActor(add, outports=('x', ))
+    square_actor = FuncActor(square, outports=('square', ))
+    square_actor.inports['x'] += adder.outports['x']
+    mapper = Map(Square)
+    summer = FuncActor(total, outports=('total', ))
+    summer.inports['x'] += mapper.outports['x']
+    concat = Concat(2)
+    concat.connect_input(square_actor.outports['square'])
+    concat.connect_input(summer.outports['total'])
+    return concat.get_workflow()
+
+
+def test_run_dask_matches_wowp():
+    inputs = {'a': 1, 'b': 2, 'x': [1, 2, 3]}
+    expected = _workflow()(scheduler=LinearizedScheduler(), **inputs)
+    result = run_dask(_workflow(), **inputs)
+    assert result == {'out': [(9, 14)]}
+    assert {name: list(values) for name, values in expected.items()} == result
+
+
+def test_map_tasks():
+    graph, outputs = to_dask_graph(_workflow(), {'a': 1, 'b': 2, 'x': [1, 2, 3]})
+    # one task per mapped item
+    assert len([key for key in graph if key.startswith('wowp-map-') and
+                key.rsplit('-', 1)[1] in ('0', '1', '2')]) == 3
+
+
+def test_cyclic_workflow():
+    fa = FuncActor(square, outports=('x', ))
+    lw = LoopWhile('loop', lambda x: x < 100)
+    fa.inports['x'] += lw.outports['loop']
+    lw.inports['loop'] += fa.outports['x']
+    assert_raises(ValueError, to_dask_graph, lw.get_workflow(), {'init': 2})
+
+
+def test_hybrid_loop():
+    # the loop stays with wowp, the loop body is a dask graph
+    first = FuncActor(inc, outports=('x', ))
+    second = FuncActor(square, outports=('x', ))
+    second.inports['x'] += first.outports['x']
+    body = DaskGraphActor(first.get_workflow())
+    lw = LoopWhile('loop', lambda x: x < 100)
+    body.inports['x'] += lw.outports['loop']
+    lw.inports['loop'] += body.outports['x']
+    scheduler = LinearizedScheduler()
+    scheduler.put_value(lw.inports['init'], 1)
+    scheduler.execute()
+    # (1 + 1) ** 2 = 4, (4 + 1) ** 2 = 25, (25 + 1) ** 2 = 676
+    assert lw.outports['exit'].pop() == 676
+
+
+def test_local_cluster():
+    try:
+        from distributed import LocalCluster, Client
+    except ImportError:
+        raise SkipTest('distributed not available')
+    cluster = LocalCluster(n_workers=2, threads_per_worker=1, processes=False,
+                           dashboard_address=None)
+    client = Client(cluster)
+    try:
+        result = run_dask(_workflow(), client=client, a=1, b=2, x=[1, 2, 3])
+        assert result == {'out': [(9, 14)]}
+    finally:
+        client.close()
+        cluster.close()
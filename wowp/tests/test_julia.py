@@ -0,0 +1,90 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+from wowp.actors.julia import JuliaMethod, get_julia, warm_up_julia
+from wowp.schedulers import NaiveScheduler, FuturesScheduler
+from wowp.components import TokenBatch
+
+# code evaluated by the stub runtimes of this process
+evaluated = []
+
+
+class StubJulia(object):
+    """Stands for julia.Julia, knows a few Base and Stats methods
+    """
+
+    def __init__(self):
+        evaluated.append(('start', os.getpid()))
+
+    def eval(self, code):
+        evaluated.append((code, os.getpid()))
+        if code == 'abs':
+            return abs
+        elif code == 'Stats.mean':
+            return lambda values: sum(values) / len(values)
+        elif code == 'broadcast':
+            return lambda f, *arrays: [f(*values) for values in zip(*arrays)]
+        elif code == 'Stats.minmax':
+            return lambda *values: (min(values), max(values))
+        elif code == 'Stats.minmax_batch':
+            return lambda *arrays: [(min(values), max(values)) for values in zip(*arrays)]
+        elif code == 'Stats.evaluated':
+            return lambda x: [c for c, pid in evaluated if pid == os.getpid()]
+
+
+def test_runtime_and_methods_cached():
+    del evaluated[:]
+    jm = JuliaMethod('mean', 'Stats', inports='values', julia_factory=StubJulia)
+    assert jm([1, 2, 3]) == 2
+    for _ in range(3):
+        jm.inports['values'].put([1, 3])
+        NaiveScheduler().run_actor(jm)
+        assert jm.outports['result'].pop() == 2
+    assert JuliaMethod('abs', julia_factory=StubJulia)(-1) == 1
+    assert [code for code, pid in evaluated] == ['start', 'using Stats', 'Stats.mean', 'abs']
+    assert get_julia(StubJulia) is get_julia(StubJulia)
+
+
+def test_warm_up_workers():
+    scheduler = FuturesScheduler('multiprocessing', min_engines=2, shared_executor=False,
+                                 executor_kwargs={
+                                     'initializer': warm_up_julia,
+                                     'initargs': ([('Stats', 'evaluated')],
+                                                  ['precompile(abs, (Float64,))'],
+                                                  StubJulia)})
+    actors = [JuliaMethod('evaluated', 'Stats', inports='x', julia_factory=StubJulia)
+              for _ in range(4)]
+    try:
+        for actor in actors:
+            scheduler.put_value(actor.inports['x'], None)
+        scheduler.execute()
+    finally:
+        scheduler.executor.shutdown()
+    # everything was done by the initializer, in each worker once
+    expected = ['start', 'using Stats', 'Stats.evaluated', 'precompile(abs, (Float64,))']
+    for actor in actors:
+        assert actor.outports['result'].pop() == expected
+
+
+def test_batch():
+    actor = JuliaMethod('abs', inports='x', julia_factory=StubJulia, batch_size=3,
+                        batch_latency=60)
+    scheduler = NaiveScheduler()
+    for x in range(-4, 1):
+        scheduler.put_value(actor.inports['x'], x)
+    scheduler.execute()
+    assert list(actor.outports['result'].pop_all()) == [4, 3, 2, 1, 0]
+    actor.inports['x'].put(-1)
+    actor.inports['x'].put(-2)
+    args, kwargs = actor.get_run_args()
+    assert actor.run(*args, **kwargs) == {'result': TokenBatch([1, 2])}
+
+
+def test_batch_several_outputs():
+    for batch_method in (None, 'minmax_batch'):
+        actor = JuliaMethod('minmax', 'Stats', inports=('a', 'b'), outports=('low', 'high'),
+                            julia_factory=StubJulia, batch_size=10, batch_method=batch_method)
+        for a, b in ((1, 2), (4, 3)):
+            actor.inports['a'].put(a)
+            actor.inports['b'].put(b)
+        args, kwargs = actor.get_run_args()
+        assert actor.run(*args, **kwargs) == {'low': [1, 3], 'high': [2, 4]}
@@ -79,6 +79,73 @@ def test_map_multiport():
     assert_sequence_equal(res['a'], inputs['b'])
 
 
+def test_parallel_maps_overlap():
+    import time
+    from wowp.actors import DictionaryMerge
+    from wowp.schedulers import FuturesScheduler
+
+    intervals = {}
+
+    def annotated_sleep(inp):
+        start = time.time()
+        time.sleep(0.2)
+        intervals.setdefault(inp[0], []).append((start, time.time()))
+        return inp
+
+    def items(inp):
+        return [(key, i) for key in ('a', 'b') for i in range(2)]
+
+    map_a = Map(FuncActor, args=(annotated_sleep, ))
+    map_b = Map(FuncActor, args=(annotated_sleep, ))
+    select_a = FuncActor(lambda x: [item for item in x if item[0] == 'a'], inports=('inp', ))
+    select_b = FuncActor(lambda x: [item for item in x if item[0] == 'b'], inports=('inp', ))
+    merge = DictionaryMerge(inport_names=('a', 'b'))
+    source = FuncActor(items)
+    select_a.inports['inp'] += source.outports['out']
+    select_b.inports['inp'] += source.outports['out']
+    map_a.inports['inp'] += select_a.outports['out']
+    map_b.inports['inp'] += select_b.outports['out']
+    merge.inports['a'] += map_a.outports['out']
+    merge.inports['b'] += map_b.outports['out']
+
+    wf = source.get_workflow()
+    res = wf(scheduler=FuturesScheduler('threading', min_engines=4), inp=None)
+    assert res['out'].pop() == {'a': [('a', 0), ('a', 1)], 'b': [('b', 0), ('b', 1)]}
+    # all mapped actors run at the same time
+    starts = [start for values in intervals.values() for start, end in values]
+    ends = [end for values in intervals.values() for start, end in values]
+    assert max(starts) < min(ends)
+
+
+def test_expanded_map_order():
+    import time
+    from wowp.schedulers import FuturesScheduler
+
+    def slow_zero(inp):
+        if inp == 0:
+            time.sleep(0.3)
+        return inp
+
+    map_act = Map(FuncActor, args=(slow_zero, ))
+    scheduler = FuturesScheduler('threading', min_engines=4)
+    for inp in ([0, 0], [1, 1], [2]):
+        scheduler.put_value(map_act.inports['inp'], inp)
+    scheduler.execute()
+    # the later inputs finished first
+    assert list(map_act.outports['out'].pop_all()) == [[0, 0], [1, 1], [2]]
+
+
+def test_expanded_map_empty_input():
+    from wowp.schedulers import FuturesScheduler
+
+    map_act = Map(FuncActor, args=(lambda inp: inp, ))
+    scheduler = FuturesScheduler('threading', min_engines=4)
+    for inp in ([], [1, 1], [2], []):
+        scheduler.put_value(map_act.inports['inp'], inp)
+    scheduler.execute()
+    assert list(map_act.outports['out'].pop_all()) == [[], [1, 1], [2], []]
+
+
 if __name__ == '__main__':
     import nose
     nose.run(argv=[__file__, '-vv'])
@@ -1,8 +1,15 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
-from nose.tools import istest, nottest
+import os
+import threading
+import time
+from nose.tools import istest, nottest, assert_raises
+from wowp.actors.matlab_actors import (MatlabMethod, EnginePool, get_engine_pool,
+                                       warm_up_engine_pool)
+from wowp.actors import FuncActor
+from wowp.schedulers import NaiveScheduler, LinearizedScheduler, FuturesScheduler
 
 try:
-    from wowp.actors.matlab import MatlabMethod
+    import matlab.engine
 
     matlab_test = istest
 except Exception:
@@ -13,3 +20,185 @@ except Exception:
 def test_MatlabMethod_call():
     mm = MatlabMethod('ceil')
     assert mm(3.1) == 4.0
+
+
+# engines started in this process
+started = []
+# (time, number of values) of plus_one_batch calls
+batch_calls = []
+
+
+class FakeEngine(object):
+    """Stands for matlab.engine.MatlabEngine
+    """
+
+    def __init__(self, delay=0):
+        time.sleep(delay)
+        self.alive = True
+        self.closed = False
+        self.created = time.time()
+        started.append(os.getpid())
+
+    def eval(self, code, nargout=1):
+        if not self.alive:
+            raise RuntimeError('engine terminated')
+
+    def quit(self):
+        self.closed = True
+
+    def ceil(self, x):
+        return float(-int(-x // 1))
+
+    def plus_one_batch(self, values):
+        batch_calls.append((time.time(), len(values)))
+        return [value + 1 for value in values]
+
+    def divmod_batch(self, values, divisors, nargout=1):
+        return [value // d for value, d in zip(values, divisors)], \
+            [value % d for value, d in zip(values, divisors)]
+
+    def engines_started(self, created_before):
+        return started.count(os.getpid()), self.created < created_before
+
+
+def test_bounded():
+    pool = EnginePool(FakeEngine, max_size=2)
+    count = len(started)
+    used = []
+
+    def work():
+        with pool.engine() as engine:
+            used.append(engine)
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(used) == 8
+    assert len(started) - count == 2
+    assert pool.size == 2
+    engines = [pool.acquire(), pool.acquire()]
+    assert_raises(RuntimeError, pool.acquire, timeout=0.05)
+    for engine in engines:
+        pool.release(engine)
+
+
+def test_warm_up_and_affinity():
+    pool = EnginePool(FakeEngine, engine_kwargs={'delay': 0.05}, min_size=3)
+    t = time.time()
+    pool.warm_up()
+    # started in parallel
+    assert time.time() - t < 0.14
+    assert pool.size == 3
+    first = pool.acquire()
+    pool.release(first)
+    # the same thread gets the same engine
+    for _ in range(3):
+        engine = pool.acquire()
+        assert engine is first
+        pool.release(engine)
+    assert pool.size == 3
+
+
+def test_liveness_and_recycling():
+    pool = EnginePool(FakeEngine, max_calls=3)
+    engine = pool.acquire()
+    engine.alive = False
+    pool.release(engine)
+    # the dead engine is replaced
+    replacement = pool.acquire()
+    assert replacement is not engine and engine.closed
+    pool.release(replacement)
+    for _ in range(2):
+        assert pool.acquire() is replacement
+        pool.release(replacement)
+    # used 3 times
+    assert replacement.closed
+    assert pool.acquire() is not replacement
+    assert pool.size == 1
+
+
+def test_MatlabMethod_fake_engine():
+    mm = MatlabMethod('ceil', inports='x', engine_pool={'factory': FakeEngine})
+    assert mm(3.1) == 4.0
+    mm.inports['x'].put(2.5)
+    NaiveScheduler().run_actor(mm)
+    assert mm.outports['result'].pop() == 3.0
+    assert get_engine_pool(factory=FakeEngine).size == 1
+
+
+def test_prewarmed_workers():
+    config = {'factory': FakeEngine, 'max_size': 1, 'min_size': 1}
+    scheduler = FuturesScheduler('multiprocessing', min_engines=2, shared_executor=False,
+                                 executor_kwargs={'initializer': warm_up_engine_pool,
+                                                  'initargs': (config, )})
+    actors = [MatlabMethod('engines_started', inports='x', engine_pool=config)
+              for _ in range(4)]
+    try:
+        for actor in actors:
+            scheduler.put_value(actor.inports['x'], time.time())
+        scheduler.execute()
+    finally:
+        scheduler.executor.shutdown()
+    # each worker started one engine at the scheduler start
+    results = [actor.outports['result'].pop() for actor in actors]
+    assert results == [(1, True)] * 4
+
+
+def _batch_actor(**kwargs):
+    return MatlabMethod('plus_one', inports='x', engine_pool={'factory': FakeEngine},
+                        batch_method='plus_one_batch', pack='cell', **kwargs)
+
+
+def test_batch_FuturesScheduler():
+    del batch_calls[:]
+    actor = _batch_actor(batch_size=16)
+    scheduler = FuturesScheduler('threading')
+    for x in range(40):
+        scheduler.put_value(actor.inports['x'], x)
+    scheduler.execute()
+    # queued tokens were processed in batches, the order is kept
+    assert [size for t, size in batch_calls] == [16, 16, 8]
+    assert list(actor.outports['result'].pop_all()) == list(range(1, 41))
+
+
+def test_batch_LinearizedScheduler():
+    del batch_calls[:]
+    actor = _batch_actor(batch_size=4, batch_latency=60)
+    scheduler = LinearizedScheduler()
+    for x in range(10):
+        scheduler.put_value(actor.inports['x'], x)
+    scheduler.execute()
+    # the incomplete batch is flushed at the end
+    assert [size for t, size in batch_calls] == [4, 4, 2]
+    assert list(actor.outports['result'].pop_all()) == list(range(1, 11))
+
+
+def test_batch_latency():
+    del batch_calls[:]
+    actor = _batch_actor(batch_size=100, batch_latency=0.1)
+    slow = FuncActor(time.sleep, inports='t')
+    scheduler = FuturesScheduler('threading', min_engines=2)
+    t = time.time()
+    scheduler.put_value(slow.inports['t'], 1)
+    for x in range(3):
+        scheduler.put_value(actor.inports['x'], x)
+    scheduler.execute()
+    # the batch did not wait for the slow actor
+    assert [size for _, size in batch_calls] == [3]
+    assert 0.1 <= batch_calls[0][0] - t < 0.8
+
+
+def test_batch_several_outputs():
+    actor = MatlabMethod('divmod', inports=('x', 'd'), outports=('q', 'r'),
+                         engine_pool={'factory': FakeEngine}, batch_method='divmod_batch',
+                         pack='cell', batch_size=8, batch_latency=60)
+    scheduler = NaiveScheduler()
+    for x in range(5):
+        scheduler.put_value(actor.inports['x'], x + 10)
+        scheduler.put_value(actor.inports['d'], 3)
+    scheduler.execute()
+    assert list(actor.outports['q'].pop_all()) == [3, 3, 4, 4, 4]
+    assert list(actor.outports['r'].pop_all()) == [1, 2, 0, 1, 2]
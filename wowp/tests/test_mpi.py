@@ -0,0 +1,64 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+from nose.plugins.skip import SkipTest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def _mpiexec(n, *args):
+    mpiexec = which('mpiexec')
+    try:
+        import mpi4py
+    except ImportError:
+        mpi4py = None
+    if mpiexec is None or mpi4py is None:
+        raise SkipTest('mpiexec or mpi4py not available')
+    cmd = [mpiexec, '-n', str(n)]
+    if 'open-mpi' in subprocess.check_output([mpiexec, '--version']).decode().lower():
+        cmd.append('--oversubscribe')
+    env = dict(os.environ, OMPI_ALLOW_RUN_AS_ROOT='1', OMPI_ALLOW_RUN_AS_ROOT_CONFIRM='1',
+               PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+    return subprocess.check_output(cmd + [sys.executable] + list(args), env=env,
+                                   cwd=os.path.join(ROOT, 'examples'),
+                                   stderr=subprocess.STDOUT, timeout=300).decode()
+
+
+def test_MPIScheduler_examples():
+    output = _mpiexec(4, 'wowp_mpi_scheduler_wf.py')
+    assert 'MPIScheduler OK' in output
+
+
+WORKFLOW = """
+from wowp.actors import FuncActor
+
+
+def double(x):
+    return 2 * x
+
+first = FuncActor(double)
+second = FuncActor(double)
+second.inports['x'] += first.outports['out']
+
+WORKFLOW = first.get_workflow()
+"""
+
+
+def test_MPIScheduler_script():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'workflow.py')
+        with open(path, 'w') as f:
+            f.write(WORKFLOW)
+        output = _mpiexec(3, os.path.join(ROOT, 'scripts', 'wowp'), '-s', 'MPIScheduler()',
+                          '-a', 'x', '3', path)
+    finally:
+        shutil.rmtree(tmpdir)
+    assert "'out': deque([12])" in output
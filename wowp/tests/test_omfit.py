@@ -0,0 +1,88 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import errno
+import io
+import os
+import shutil
+import tempfile
+import time
+from wowp.actors import omfit
+from wowp.actors.omfit import FileCommand, _shell_run, _stage_files
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises
+
+
+def setup_module():
+    if os.name != 'posix':
+        raise SkipTest('requires a POSIX shell')
+    global workdir
+    workdir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(workdir)
+
+
+def _write(name, text):
+    path = os.path.join(workdir, name)
+    with io.open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def test_timeout():
+    marker = os.path.join(workdir, 'marker')
+    t = time.time()
+    # the background process must be stopped too
+    assert_raises(Exception, _shell_run, '(sleep 1; touch {}) & sleep 30'.format(marker),
+                  workdir, timeout=0.2, print_output=False)
+    assert time.time() - t < 1
+    time.sleep(1.5)
+    assert not os.path.exists(marker)
+
+
+def test_kill_after_kill_timeout():
+    t = time.time()
+    assert_raises(Exception, _shell_run, 'trap "" TERM; sleep 30', workdir, timeout=0.2,
+                  print_output=False, kill_timeout=0.2)
+    assert time.time() - t < 2
+
+
+def test_stage_files():
+    sources = [_write('in_{}.txt'.format(i), 'input {}'.format(i)) for i in range(40)]
+    target_dir = tempfile.mkdtemp(dir=workdir)
+    pairs = [(source, os.path.join(target_dir, os.path.basename(source))) for source in sources]
+    assert set(_stage_files(pairs)) == {'link'}
+    for source, target in pairs:
+        assert os.path.samefile(source, target)
+
+
+def test_stage_files_copy():
+    def no_link(source, target):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+    def no_reflink(source, target):
+        raise OSError(errno.EOPNOTSUPP, 'Operation not supported')
+
+    source = _write('copied.txt', 'copied')
+    target = os.path.join(tempfile.mkdtemp(dir=workdir), 'copied.txt')
+    link, reflink = os.link, omfit._reflink
+    os.link, omfit._reflink = no_link, no_reflink
+    try:
+        assert _stage_files([(source, target)]) == ['copy']
+    finally:
+        os.link, omfit._reflink = link, reflink
+    assert not os.path.samefile(source, target)
+    with io.open(target) as f:
+        assert f.read() == 'copied'
+
+
+def test_FileCommand():
+    input_file = _write('file_command_in.txt', 'my input')
+    command = FileCommand('cmd', 'cat input.txt > output.txt; echo done',
+                          input_files=(('input.txt', 'inp'), ),
+                          output_files=(('output.txt', 'out'), ),
+                          workdir=workdir, shell_res=True, timeout=10)
+    res = command(inp=input_file)
+    with io.open(res['out']) as f:
+        assert f.read() == 'my input'
+    assert res['shell_res']['stdout'] == 'done\n'
@@ -0,0 +1,116 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+from wowp.actors import FuncActor, LoopWhile
+from wowp.components import TokenBatch
+from wowp.refs import FileStore, FileRef, keep_tokens, resolve
+from wowp.schedulers import FuturesScheduler
+from nose.plugins.skip import SkipTest
+
+
+def produce(n):
+    return b'x' * n
+
+
+def length(data):
+    return len(data)
+
+
+def double(x):
+    return x * 2
+
+
+def short(x):
+    return len(x) < 10
+
+
+def _large_token_workflow():
+    producer = FuncActor(produce, outports=('data', ))
+    consumer = FuncActor(length, outports=('n', ))
+    consumer.inports['data'] += producer.outports['data']
+    return producer, consumer
+
+
+def test_FileStore():
+    store = FileStore(inline_size=100)
+    try:
+        assert store.put(1) == 1
+        result = keep_tokens(store, FuncActor.run, (10 ** 4, ),
+                             {'runfunc': produce, 'func_args': (), 'func_kwargs': {},
+                              'outports': ('data', )})
+        ref = result['data']
+        assert isinstance(ref, FileRef)
+        assert ref.resolve() == b'x' * 10 ** 4
+        ref.claim()
+        path = ref.path
+        del ref, result
+        assert not os.path.exists(path)
+    finally:
+        store.cleanup()
+    assert not os.path.exists(store.directory)
+
+
+def test_multiprocessing_remote_tokens():
+    producer, consumer = _large_token_workflow()
+    scheduler = FuturesScheduler('multiprocessing', min_engines=2, remote_tokens=True)
+    scheduler.put_value(producer.inports['n'], 10 ** 6)
+    scheduler.execute()
+
+    assert consumer.outports['n'].pop() == 10 ** 6
+    # all tokens were released
+    assert not os.listdir(scheduler.executor.object_store.directory)
+
+
+def test_remote_tokens_system_actors_and_outputs():
+    fa = FuncActor(double, outports=('x', ))
+    lw = LoopWhile("a_loop", short)
+    fa.inports['x'] += lw.outports['loop']
+    lw.inports['loop'] += fa.outports['x']
+    producer = FuncActor(produce, outports=('data', ))
+    lw.inports['init'] += producer.outports['data']
+
+    scheduler = FuturesScheduler('multiprocessing', min_engines=2, remote_tokens=True)
+    scheduler.executor.object_store.inline_size = 0
+    try:
+        scheduler.put_value(producer.inports['n'], 1)
+        scheduler.execute()
+    finally:
+        scheduler.executor.object_store.inline_size = 1024
+
+    assert lw.outports['exit'].pop() == b'x' * 16
+
+
+def test_distributed_remote_tokens():
+    try:
+        from distributed import LocalCluster
+    except ImportError:
+        raise SkipTest('distributed not available')
+    cluster = LocalCluster(n_workers=2, threads_per_worker=1, processes=False,
+                           dashboard_address=None)
+    try:
+        producer, consumer = _large_token_workflow()
+        scheduler = FuturesScheduler('distributed', shared_executor=False, remote_tokens=True,
+                                     executor_kwargs={'uris': cluster.scheduler_address})
+        assert scheduler.remote_tokens
+        scheduler.put_value(producer.inports['n'], 10 ** 6)
+        scheduler.execute()
+        assert consumer.outports['n'].pop() == 10 ** 6
+        for cli in scheduler.executor._clients:
+            cli.close()
+    finally:
+        cluster.close()
+
+
+def produce_batch(sizes):
+    return {'data': TokenBatch(b'x' * size for size in sizes)}
+
+
+def test_keep_tokens_batch():
+    store = FileStore(inline_size=100)
+    try:
+        result = keep_tokens(store, produce_batch, ((1, 10 ** 4, 2), ), {})
+        # tokens of the batch are stored separately
+        assert isinstance(result['data'], TokenBatch)
+        assert [isinstance(token, FileRef) for token in result['data']] == [False, True, False]
+        assert [len(resolve(token)) for token in result['data']] == [1, 10 ** 4, 2]
+    finally:
+        store.cleanup()
@@ -0,0 +1,96 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import threading
+import time
+from wowp.actors import FuncActor
+from wowp.resources import ResourcePool, host_capacity
+from wowp.schedulers import FuturesScheduler, get_executor, executor_resource_pool
+from nose.tools import assert_raises
+
+
+def test_ResourcePool():
+    pool = ResourcePool({'cores': 2, 'licence': 1})
+    assert pool.acquire({'cores': 1, 'licence': 1})
+    assert not pool.acquire({'licence': 1})
+    # unlisted resources are not limited
+    assert pool.acquire({'cores': 1, 'gpu': 8})
+    assert not pool.fits({'cores': 1})
+    pool.release({'cores': 1, 'licence': 1})
+    assert pool.fits({'cores': 1, 'licence': 1})
+    assert_raises(ValueError, pool.check, {'cores': 3})
+    # the sum of two workers
+    pool = ResourcePool({'memory': 8}, worker_capacity={'memory': 4})
+    assert_raises(ValueError, pool.check, {'memory': 6})
+    pool.check({'memory': 4})
+
+
+def test_executor_capacity():
+    executor = get_executor('threading', min_engines=3)
+    assert executor.capacity['cores'] == 3
+    assert host_capacity()['cores'] >= 1
+
+
+def test_shared_executor_capacity():
+    schedulers = [FuturesScheduler('threading', min_engines=3, resources={'licence': 1})
+                  for _ in range(2)]
+    pool = executor_resource_pool(schedulers[0].executor)
+    assert pool.capacity['cores'] == 3
+    # the executor's capacity is not multiplied by the schedulers
+    assert schedulers[0].resource_pool.acquire({'cores': 2, 'licence': 1})
+    assert not schedulers[1].resource_pool.fits({'cores': 2})
+    assert schedulers[1].resource_pool.acquire({'cores': 1, 'licence': 1})
+    assert pool.free['cores'] == 0
+    schedulers[0].resource_pool.release({'cores': 2, 'licence': 1})
+    schedulers[1].resource_pool.release({'cores': 1, 'licence': 1})
+    assert pool.free['cores'] == 3
+
+
+def _licensed_workflow(n):
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+
+    def work(x):
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return x
+
+    actors = []
+    for i in range(n):
+        actor = FuncActor(work, inports=('x', ), outports=('x', ))
+        actor.resources = {'cores': 1, 'licence': 1}
+        actors.append(actor)
+    return actors, max_running
+
+
+def test_licence_serializes_jobs():
+    actors, max_running = _licensed_workflow(4)
+    scheduler = FuturesScheduler('threading', min_engines=4, resources={'licence': 1})
+    for i, actor in enumerate(actors):
+        scheduler.put_value(actor.inports['x'], i)
+    scheduler.execute()
+
+    assert [actor.outports['x'].pop() for actor in actors] == list(range(4))
+    assert max_running[0] == 1
+    assert scheduler.resource_pool.free['licence'] == 1
+
+
+def test_licences_run_in_parallel():
+    actors, max_running = _licensed_workflow(4)
+    scheduler = FuturesScheduler('threading', min_engines=4, resources={'licence': 2})
+    for i, actor in enumerate(actors):
+        scheduler.put_value(actor.inports['x'], i)
+    scheduler.execute()
+
+    assert max_running[0] == 2
+
+
+def test_impossible_requirements():
+    actor = FuncActor(lambda x: x, inports=('x', ), outports=('x', ))
+    actor.resources = {'cores': 1000}
+    scheduler = FuturesScheduler('threading', min_engines=2)
+    scheduler.put_value(actor.inports['x'], 1)
+    assert_raises(ValueError, scheduler.execute)
@@ -1,7 +1,14 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 from wowp.actors import FuncActor, Switch, LoopWhile
-from wowp.schedulers import LinearizedScheduler, ThreadedScheduler
+from wowp.components import Actor, BatchMixin, TokenBatch
+from wowp.schedulers import (NaiveScheduler, LinearizedScheduler, ThreadedScheduler,
+                             FuturesScheduler, get_executor, shutdown_executors,
+                             RoundRobinPolicy, LeastLoadedPolicy, AffinityPolicy,
+                             register_executor)
 import nose
+import subprocess
+import sys
+import time
 
 
 def test_LinearizedScheduler_loop1000():
@@ -12,19 +19,21 @@ def test_LinearizedScheduler_loop1000():
     def func(x):
         return x + 1
 
-    scheduler = LinearizedScheduler()
+    # iteration by iteration through the scheduler and inline
+    for inline in (False, None):
+        scheduler = LinearizedScheduler()
 
-    fa = FuncActor(func, outports=('x', ))
-    lw = LoopWhile("a_loop", condition)
+        fa = FuncActor(func, outports=('x', ))
+        lw = LoopWhile("a_loop", condition, inline=inline)
 
-    fa.inports['x'] += lw.outports['loop']
-    lw.inports['loop'] += fa.outports['x']
+        fa.inports['x'] += lw.outports['loop']
+        lw.inports['loop'] += fa.outports['x']
 
-    scheduler.put_value(lw.inports['init'], 0)
-    scheduler.execute()
+        scheduler.put_value(lw.inports['init'], 0)
+        scheduler.execute()
 
-    result = lw.outports['exit'].pop()
-    assert (result == 1000)
+        result = lw.outports['exit'].pop()
+        assert (result == 1000)
 
 
 def _run_tree_512_test(scheduler):
@@ -138,5 +147,183 @@ def _run_linearity_test(scheduler):
     assert new_sequence == original_sequence
 
 
+def test_ThreadedScheduler_reuses_threads():
+    import threading
+    threads = set()
+
+    def func(x):
+        threads.add(threading.current_thread())
+        return x
+
+    def run(scheduler):
+        actors = [FuncActor(func, outports=('x', )) for _ in range(20)]
+        for actor in actors:
+            scheduler.put_value(actor.inports['x'], 0)
+        scheduler.execute()
+        assert all(actor.outports['x'].pop() == 0 for actor in actors)
+
+    scheduler = ThreadedScheduler(max_threads=4)
+    run(scheduler)
+    for _ in range(3):
+        run(scheduler.copy())
+    # the calling thread + pool threads shared by all the runs
+    assert len(threads) <= 4
+
+
+def test_ThreadedScheduler_raises_actor_errors():
+    from nose.tools import assert_raises
+
+    def func(x):
+        raise ZeroDivisionError()
+
+    scheduler = ThreadedScheduler(max_threads=4)
+    for _ in range(8):
+        actor = FuncActor(func, outports=('x', ))
+        scheduler.put_value(actor.inports['x'], 0)
+    assert_raises(ZeroDivisionError, scheduler.execute)
+
+
+def test_shared_executors():
+    first = FuturesScheduler('threading', min_engines=2)
+    second = FuturesScheduler('threading', min_engines=2)
+    assert first.executor is second.executor
+    assert first.copy().executor is first.executor
+    assert get_executor('threading', min_engines=3) is not first.executor
+    # shutting down a scheduler keeps the shared executor
+    first.shutdown()
+    assert second.executor.submit(sum, (1, 2)).result() == 3
+
+    shutdown_executors('threading')
+    assert FuturesScheduler('threading', min_engines=2).executor is not first.executor
+    shutdown_executors('threading')
+
+
+def test_client_policies():
+    # (outstanding tasks, engines) of 2 clusters
+    loads = [(2, 1), (4, 4)]
+    round_robin = RoundRobinPolicy()
+    assert [round_robin.select(loads, []) for i in range(3)] == [0, 1, 0]
+    assert LeastLoadedPolicy().select(loads, []) == 1
+    assert LeastLoadedPolicy(weighted=False).select(loads, []) == 0
+    # inputs are on the first cluster
+    assert AffinityPolicy().select(loads, [0, 0, 1]) == 0
+    assert AffinityPolicy().select(loads, []) == 1
+
+
+def test_distributed_outstanding():
+    try:
+        from distributed import LocalCluster
+    except ImportError:
+        raise nose.SkipTest('distributed not available')
+    from wowp.schedulers import DistributedExecutor
+    clusters = [LocalCluster(n_workers=1, threads_per_worker=1, processes=False,
+                             dashboard_address=None) for i in range(2)]
+    try:
+        executor = DistributedExecutor([cluster.scheduler_address for cluster in clusters],
+                                       policy='least_loaded')
+        jobs = [executor.submit(time.sleep, 0.5) for i in range(4)]
+        # unfinished jobs of each cluster
+        assert executor._outstanding == [2, 2]
+        for job in jobs:
+            job.result()
+        time.sleep(0.1)
+        assert executor._outstanding == [0, 0]
+        for cli in executor._clients:
+            cli.close()
+    finally:
+        for cluster in clusters:
+            cluster.close()
+
+
+def test_lazy_backends():
+    code = ('import sys, wowp, wowp.schedulers; '
+            'print([m for m in ("distributed", "ipyparallel", "mpi4py", "networkx") '
+            'if m in sys.modules])')
+    assert subprocess.check_output([sys.executable, '-c', code]).strip() == b'[]'
+
+
+def test_register_executor():
+    register_executor('my_threading', lambda min_engines, timeout, display_outputs:
+                      get_executor('threading', min_engines=min_engines))
+    scheduler = FuturesScheduler('my_threading', min_engines=2)
+    assert scheduler.executor is get_executor('threading', min_engines=2)
+
+
+# times of BatchSum runs
+batch_runs = []
+
+
+class BatchSum(BatchMixin, Actor):
+    """Adds a + b for batches of tokens, reports the batch sizes
+    """
+
+    def __init__(self, batch_size, batch_latency=None):
+        super(BatchSum, self).__init__()
+        self.inports.append('a')
+        self.inports.append('b')
+        self.outports.append('sum')
+        self.outports.append('size')
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+
+    @staticmethod
+    def run(a, b):
+        batch_runs.append(time.time())
+        return {'sum': TokenBatch(x + y for x, y in zip(a, b)),
+                'size': TokenBatch([len(a)] * len(a))}
+
+
+def test_batch_firing():
+    for scheduler in (NaiveScheduler(), LinearizedScheduler(), ThreadedScheduler(max_threads=4),
+                      FuturesScheduler('threading', min_engines=2)):
+        actor = BatchSum(batch_size=4)
+        for i in range(10):
+            scheduler.put_value(actor.inports['a'], i)
+            scheduler.put_value(actor.inports['b'], 10 * i)
+        scheduler.execute()
+        assert list(actor.outports['sum'].pop_all()) == [11 * i for i in range(10)]
+        # the incomplete batch runs when no other tokens can arrive
+        assert list(actor.outports['size'].pop_all()) == [4] * 8 + [2] * 2
+
+    # all queued tokens
+    actor = BatchSum(batch_size=None)
+    scheduler = LinearizedScheduler()
+    for i in range(50):
+        scheduler.put_value(actor.inports['a'], i)
+        scheduler.put_value(actor.inports['b'], 0)
+    scheduler.execute()
+    assert set(actor.outports['size'].pop_all()) == {50}
+
+
+def test_put_values():
+    for scheduler in (NaiveScheduler(), LinearizedScheduler(), ThreadedScheduler(max_threads=4),
+                      FuturesScheduler('threading', min_engines=2)):
+        actor = BatchSum(batch_size=4)
+        double = FuncActor(lambda x: 2 * x, inports=('x', ), outports=('y', ))
+        double.inports['x'] += actor.outports['sum']
+        scheduler.put_values(actor.inports['a'], range(10))
+        scheduler.put_values(actor.inports['b'], [10 * i for i in range(10)])
+        scheduler.execute()
+        assert list(double.outports['y'].pop_all()) == [22 * i for i in range(10)]
+        assert list(actor.outports['size'].pop_all()) == [4] * 8 + [2] * 2
+
+
+def test_batch_latency_ThreadedScheduler():
+    del batch_runs[:]
+    actor = BatchSum(batch_size=100, batch_latency=0.1)
+    slow = FuncActor(time.sleep, inports='t')
+    scheduler = ThreadedScheduler(max_threads=2)
+    t = time.time()
+    scheduler.put_value(slow.inports['t'], 1)
+    for i in range(3):
+        scheduler.put_value(actor.inports['a'], i)
+        scheduler.put_value(actor.inports['b'], i)
+    scheduler.execute()
+    # the batch did not wait for the slow actor
+    assert len(batch_runs) == 1
+    assert 0.1 <= batch_runs[0] - t < 0.8
+    assert list(actor.outports['size'].pop_all()) == [3] * 3
+
+
 if __name__ == '__main__':
     nose.run(argv=[__file__, '-vv'])
@@ -0,0 +1,157 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import gc
+import io
+import os
+import select
+import shutil
+import signal
+import tempfile
+from wowp.actors.omfit import FileCommand
+from wowp.scratch import ScratchPool, get_scratch_pool, TMPFS
+from wowp.schedulers import FuturesScheduler
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises
+
+
+def setup_module():
+    if os.name != 'posix':
+        raise SkipTest('requires a POSIX shell')
+    global workdir
+    workdir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(workdir)
+
+
+def _write(path, size=100):
+    with io.open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def test_reuse():
+    pool = ScratchPool(roots=[workdir])
+    try:
+        path = pool.acquire()
+        _write(os.path.join(path, 'file'))
+        os.mkdir(os.path.join(path, 'subdir'))
+        pool.release(path)
+        pool.wait()
+        assert pool.usage()[workdir] == {'dirs': 1, 'idle': 1, 'held': 0}
+        # the same directory, cleaned
+        assert pool.acquire() == path
+        assert os.listdir(path) == []
+        pool.release(path)
+    finally:
+        pool.shutdown()
+    assert not os.path.exists(path)
+
+
+def test_max_dirs_and_fallback():
+    first, second = tempfile.mkdtemp(dir=workdir), tempfile.mkdtemp(dir=workdir)
+    pool = ScratchPool(roots=[first, second], max_dirs=1, max_idle=0)
+    try:
+        a = pool.acquire()
+        b = pool.acquire()
+        assert os.path.dirname(a) == first
+        assert os.path.dirname(b) == second
+        assert_raises(IOError, pool.acquire)
+        # acquire waits for the released directory to be cleaned
+        pool.release(a)
+        c = pool.acquire()
+        assert os.path.dirname(c) == first
+        assert not os.path.exists(a)
+        pool.release(b)
+        pool.release(c)
+    finally:
+        pool.shutdown()
+
+
+def test_quota():
+    pool = ScratchPool(roots=[workdir], quota=1000)
+    try:
+        path = pool.acquire()
+        _write(os.path.join(path, 'output'), 2000)
+        pool.hold(path)
+        pool.release(path)
+        assert pool.usage()[workdir]['held'] == 2000
+        assert_raises(IOError, pool.acquire)
+        pool.release(path)
+        pool.wait()
+        assert pool.acquire() == path
+        pool.release(path)
+    finally:
+        pool.shutdown()
+
+
+def test_tmpfs():
+    pool = ScratchPool(roots=['tmpfs', workdir])
+    try:
+        path = pool.acquire()
+        expected = TMPFS if os.path.isdir(TMPFS) else workdir
+        assert os.path.dirname(path) == expected
+        pool.release(path)
+    finally:
+        pool.shutdown()
+
+
+def test_fork():
+    if not hasattr(os, 'fork'):
+        raise SkipTest('requires os.fork')
+    scratch = {'roots': [tempfile.mkdtemp(dir=workdir)]}
+    pool = get_scratch_pool(**scratch)
+    path = pool.acquire()
+    pool.release(path)
+    pool.wait()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # forked worker
+        try:
+            child_pool = get_scratch_pool(**scratch)
+            child_path = child_pool.acquire()
+            child_pool.release(child_path)
+            child_pool.wait()
+            os.write(write_fd, child_path.encode('utf-8'))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    # without pools of its own, the child waits for its cleanups forever
+    if not select.select([read_fd], [], [], 30)[0]:
+        os.kill(pid, signal.SIGKILL)
+    with os.fdopen(read_fd, 'rb') as f:
+        child_path = f.read().decode('utf-8')
+    os.waitpid(pid, 0)
+    # the child does not reuse the idle directory of the parent
+    assert child_path
+    assert child_path != path
+    assert pool.acquire() == path
+    pool.release(path)
+
+
+def test_FileCommand_scratch_gc():
+    input_file = os.path.join(workdir, 'input.txt')
+    _write(input_file)
+    scratch = {'roots': [tempfile.mkdtemp(dir=workdir)]}
+    first = FileCommand('first', 'cp in.txt out.txt',
+                        input_files=(('in.txt', 'inp'), ),
+                        output_files=(('out.txt', 'out'), ),
+                        artifacts=True, scratch=scratch)
+    second = FileCommand('second', 'cat in.txt in.txt > out.txt',
+                         input_files=(('in.txt', 'inp'), ),
+                         output_files=(('out.txt', 'out'), ),
+                         artifacts=True, scratch=scratch)
+    second.inports['inp'] += first.outports['out']
+
+    scheduler = FuturesScheduler('threading')
+    scheduler.put_value(first.inports['inp'], input_file)
+    scheduler.execute()
+    output = second.outports['out'].pop()
+    gc.collect()
+    pool = get_scratch_pool(**scratch)
+    pool.wait()
+    usage = pool.usage()[scratch['roots'][0]]
+    # the directory of the consumed token was recycled, the output is kept
+    assert usage['idle'] == 1
+    assert usage['dirs'] == 2
+    assert os.path.getsize(output) == 200
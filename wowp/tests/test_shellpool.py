@@ -0,0 +1,102 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import sys
+import time
+from wowp.actors import ShellRunner
+from wowp.schedulers import NaiveScheduler, FuturesScheduler
+from nose.plugins.skip import SkipTest
+
+try:
+    import asyncio
+    from wowp.shellpool import ShellPool
+except ImportError:
+    asyncio = None
+
+SLEEP = (sys.executable, '-c', 'import time; time.sleep(0.2)')
+
+
+def setup_module():
+    if asyncio is None:
+        raise SkipTest('asyncio subprocesses not available')
+
+
+def test_run():
+    pool = ShellPool(max_concurrency=2)
+    try:
+        res = pool.run((sys.executable, '-c', 'print("out"); import sys; sys.exit(3)'))
+        assert res == {'ret': 3, 'stdout': 'out\n', 'stderr': ''}
+        res = pool.run(('echo', 'test'), shell=True, binary=True)
+        assert res['stdout'] == b'test\n'
+    finally:
+        pool.shutdown()
+
+
+def test_concurrency_limit():
+    pool = ShellPool(max_concurrency=2)
+    try:
+        t = time.time()
+        futures = [pool.submit(SLEEP) for _ in range(4)]
+        assert all(future.result()['ret'] == 0 for future in futures)
+        # two rounds of two commands
+        assert 0.4 <= time.time() - t < 1.5
+    finally:
+        pool.shutdown()
+
+
+def test_shutdown_cancels():
+    pool = ShellPool(max_concurrency=1)
+    long_sleep = (sys.executable, '-c', 'import time; time.sleep(10)')
+    futures = [pool.submit(long_sleep) for _ in range(2)]
+    # the first command is running
+    time.sleep(0.5)
+    t = time.time()
+    pool.shutdown()
+    assert time.time() - t < 5
+    assert all(future.cancelled() for future in futures)
+    # the pool can be used again
+    assert pool.run(('echo', 'test'), shell=True)['stdout'] == 'test\n'
+    pool.shutdown()
+
+
+def test_max_output_and_streaming():
+    chunks = []
+    pool = ShellPool(max_output=1000)
+    command = (sys.executable, '-c', 'import sys; sys.stdout.write("x" * 10 ** 6)')
+    try:
+        res = pool.run(command, binary=True,
+                       on_output=lambda name, data: chunks.append((name, len(data))))
+    finally:
+        pool.shutdown()
+    assert res['stdout'] == b'x' * 1000
+    # everything was read and streamed
+    assert sum(size for name, size in chunks if name == 'stdout') == 10 ** 6
+
+
+def test_run_async():
+    pool = ShellPool()
+    loop = asyncio.new_event_loop()
+    try:
+        res = loop.run_until_complete(pool.run_async(('echo', 'test')))
+    finally:
+        loop.close()
+        pool.shutdown()
+    assert res['stdout'] == 'test\n'
+
+
+def test_ShellRunner_pool():
+    runner = ShellRunner('echo', pool=2)
+    runner.inports['inp'].put('test')
+    NaiveScheduler().run_actor(runner)
+    assert runner.outports['ret'].pop() == 0
+    assert runner.outports['stdout'].pop() == 'test\n'
+
+
+def test_ShellRunner_pool_FuturesScheduler():
+    # the commands do not occupy the (single) executor slot
+    runners = [ShellRunner(SLEEP, format_inp='trigger', pool=8) for _ in range(8)]
+    scheduler = FuturesScheduler('threading', min_engines=1)
+    t = time.time()
+    for runner in runners:
+        scheduler.put_value(runner.inports['inp'], None)
+    scheduler.execute()
+    assert time.time() - t < 1.2
+    assert all(runner.outports['ret'].pop() == 0 for runner in runners)
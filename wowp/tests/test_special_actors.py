@@ -1,8 +1,15 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
-from wowp.actors.special import Splitter, Chain
-from wowp.schedulers import NaiveScheduler
+import os
+import tempfile
+import time
+from wowp.actors.special import (Splitter, Merger, OrderedMerger, Chain, LineReader,
+                                 ChunkedLineReader, FileSharder, iter_line_batches, shard_file)
+from wowp.schedulers import (NaiveScheduler, LinearizedScheduler, FuturesScheduler,
+                             ThreadedScheduler)
 from wowp.actors import FuncActor
+from wowp.components import Actor
 from wowp.util import ConstructorWrapper
+from nose.tools import assert_raises
 
 
 def test_splitter():
@@ -24,6 +31,93 @@ def test_splitter():
     assert [1, 3, 5, 7, 9] == x2_all
 
 
+def _paced(x):
+    time.sleep(0.005)
+    return x
+
+
+def _slow(x):
+    time.sleep(0.05)
+    return x
+
+
+def test_load_aware_splitter():
+    for policy in ('shortest_queue', 'least_loaded'):
+        for scheduler in (FuturesScheduler('threading', min_engines=3),
+                          ThreadedScheduler(max_threads=3)):
+            source = FuncActor(_paced, inports='x')
+            splitter = Splitter(multiplicity=2, inport_name='x', policy=policy)
+            slow = FuncActor(_slow, inports='x')
+            fast = FuncActor(double_me, inports='x')
+            source.outports['out'].connect(splitter.inports['x'])
+            splitter.outports['x_1'].connect(slow.inports['x'])
+            splitter.outports['x_2'].connect(fast.inports['x'])
+            for i in range(20):
+                scheduler.put_value(source.inports['x'], i)
+            scheduler.execute()
+            slow_out = list(slow.outports['out'].pop_all())
+            fast_out = list(fast.outports['out'].pop_all())
+            assert sorted(slow_out + [x // 2 for x in fast_out]) == list(range(20))
+            # the slow branch got fewer tokens
+            assert len(slow_out) < 8
+
+
+def test_hash_splitter():
+    splitter = Splitter(multiplicity=3, inport_name='x', policy='hash', key=lambda x: x[0])
+    scheduler = NaiveScheduler()
+    for i in range(30):
+        scheduler.put_value(splitter.inports.x, (i % 4, i))
+    scheduler.execute()
+    for name in ('x_1', 'x_2', 'x_3'):
+        keys = set(key for key, i in splitter.outports[name].pop_all())
+        assert keys == set(key for key in range(4) if key % 3 == int(name[-1]) - 1)
+    assert_raises(ValueError, Splitter, policy='random')
+
+
+def _jitter(x):
+    time.sleep(x[1])
+    return x
+
+
+def _fan_out_in(merger, scheduler, delays):
+    splitter = Splitter(multiplicity=3, inport_name='x')
+    for i in range(1, 4):
+        branch = FuncActor(_jitter, inports='x')
+        splitter.outports['x_%d' % i].connect(branch.inports['x'])
+        branch.outports['out'].connect(merger.inports['x_%d' % i])
+    for i, delay in enumerate(delays):
+        scheduler.put_value(splitter.inports['x'], (i, delay))
+    scheduler.execute()
+    return [i for i, delay in merger.outports['x'].pop_all()]
+
+
+def test_mergers():
+    # the first token is the slowest one
+    delays = [0.1] + [0.001] * 11
+    merger = Merger(outport_name='x', multiplicity=3)
+    assert len(merger.inports) == 3
+    merged = _fan_out_in(merger, FuturesScheduler('threading', min_engines=3), delays)
+    assert sorted(merged) == list(range(12)) and merged[0] != 0
+    for scheduler in (LinearizedScheduler(), FuturesScheduler('threading', min_engines=3),
+                      ThreadedScheduler(max_threads=3)):
+        merger = OrderedMerger(outport_name='x', multiplicity=3)
+        assert _fan_out_in(merger, scheduler, delays) == list(range(12))
+
+
+def test_ordered_merger_gaps():
+    merger = OrderedMerger(multiplicity=2, start=1, max_pending=2)
+    scheduler = NaiveScheduler()
+    for key, port in ((2, 'out_1'), (4, 'out_2'), (1, 'out_2'), (6, 'out_1'), (7, 'out_1'),
+                      (8, 'out_2'), (10, 'out_1')):
+        scheduler.put_value(merger.inports[port], (key, None))
+    # 3 and 5 are skipped to keep at most 2 tokens waiting, 10 waits for 9
+    assert [key for key, value in merger.outports['out'].pop_all()] == [1, 2, 4, 6, 7, 8]
+    scheduler.put_value(merger.inports['out_1'], (5, None))
+    scheduler.execute()
+    # the late token is forwarded immediately, the rest when no other tokens can arrive
+    assert [key for key, value in merger.outports['out'].pop_all()] == [5, 10]
+
+
 def double_me(x):
     return x * 2
 
@@ -38,3 +132,146 @@ def test_chain():
     assert res["out"].pop() == 8
     res = wf(inp="a")
     assert res["out"].pop() == "aaaa"
+
+
+def _text_file(lines, newline='\n'):
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(newline.join(lines).encode('utf-8'))
+    return path
+
+
+def test_line_reader():
+    path = _text_file(['a', ' b ', 'c'])
+    try:
+        reader = LineReader()
+        scheduler = LinearizedScheduler()
+        scheduler.put_value(reader.inports['path'], path)
+        scheduler.execute()
+        assert list(reader.outports['line'].pop_all()) == ['a', 'b', 'c']
+    finally:
+        os.remove(path)
+
+
+def test_iter_line_batches():
+    lines = ['line {}:{}'.format(i, 'x' * (i % 13)) for i in range(1000)]
+    for newline in ('\n', '\r\n'):
+        path = _text_file(lines, newline)
+        try:
+            for use_mmap in (True, False):
+                batches = list(iter_line_batches(path, 300, block_size=100, use_mmap=use_mmap,
+                                                 encoding='utf-8'))
+                assert [len(batch) for batch in batches] == [300, 300, 300, 100]
+                assert sum(batches, []) == lines
+            raw = list(iter_line_batches(path, 2000, strip=False))
+            assert raw == [lines]
+            # arbitrary ranges read each line once
+            size = os.path.getsize(path)
+            bounds = [0, 1, 17, 18, 500, size - 3, size]
+            read = []
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                for batch in iter_line_batches(path, 7, start, end, block_size=64):
+                    read.extend(batch)
+            assert read == lines
+        finally:
+            os.remove(path)
+
+
+def test_sharded_readers():
+    lines = [str(i) * (i % 50) for i in range(2000)]
+    path = _text_file(lines)
+    try:
+        shards = shard_file(path, 4)
+        assert len(shards) == 4
+        assert shards[0][1] == 0 and shards[-1][2] == os.path.getsize(path)
+        # ranges bounded by max_size (up to the end of the last line)
+        shards = shard_file(path, 4, max_size=1000)
+        assert len(shards) > 4
+        assert all(end - start <= 1000 + 200 for _, start, end in shards)
+
+        sharder = FileSharder(shards=4, max_size=10000)
+        splitter = Splitter(multiplicity=2, inport_name='shard')
+        readers = [ChunkedLineReader(batch_size=100) for _ in range(2)]
+        sharder.outports['shard'].connect(splitter.inports['shard'])
+        for reader, name in zip(readers, ('shard_1', 'shard_2')):
+            splitter.outports[name].connect(reader.inports['path'])
+        scheduler = FuturesScheduler('multiprocessing', min_engines=2)
+        scheduler.put_value(sharder.inports['path'], path)
+        scheduler.execute()
+        batches = [list(reader.outports['lines'].pop_all()) for reader in readers]
+        assert sorted(sum(sum(batches, []), [])) == sorted(lines)
+        assert all(len(batch) <= 100 for batch in sum(batches, []))
+    finally:
+        os.remove(path)
+
+
+def test_chunked_bytes():
+    lines = ['{:05d}'.format(i) for i in range(100)]
+    path = _text_file(lines)
+    try:
+        reader = ChunkedLineReader(output='bytes', block_size=50)
+        reader.inports['path'].put(path)
+        NaiveScheduler().run_actor(reader)
+        blocks = list(reader.outports['lines'].pop_all())
+        assert len(blocks) > 1
+        assert all(block.endswith(b'\n') for block in blocks[:-1])
+        assert b''.join(blocks).decode('ascii').split('\n') == lines
+    finally:
+        os.remove(path)
+
+
+# links built in this process
+built = []
+
+
+class Negate(Actor):
+    """A link which is not a FuncActor
+    """
+
+    def __init__(self):
+        super(Negate, self).__init__()
+        self.inports.append('x')
+        self.outports.append('y')
+        built.append(os.getpid())
+
+    @staticmethod
+    def run(x):
+        return {'y': -x}
+
+
+def counted_double():
+    built.append(os.getpid())
+    return FuncActor(double_me)
+
+
+def test_chain_reuse():
+    for links, expected in (([counted_double, counted_double], 12),
+                            ([counted_double, Negate], -6)):
+        del built[:]
+        chain = Chain("chain", links)
+        scheduler = LinearizedScheduler()
+        for _ in range(5):
+            scheduler.put_value(chain.inports['inp'], 3)
+        scheduler.execute()
+        assert list(chain.outports['out'].pop_all()) == [expected] * 5
+        # built once
+        assert len(built) == 2
+
+    # batches, in worker processes
+    chain = Chain("chain", [counted_double, Negate, counted_double], batch_size=4)
+    scheduler = FuturesScheduler('multiprocessing', min_engines=2)
+    for i in range(10):
+        scheduler.put_value(chain.inports['inp'], i)
+    scheduler.execute()
+    assert list(chain.outports['out'].pop_all()) == [-4 * i for i in range(10)]
+
+
+def test_chain_links_bounded():
+    from wowp.actors.special import _chain_links, _CHAIN_LINKS_SIZE
+    chains = [Chain("chain", [counted_double]) for _ in range(_CHAIN_LINKS_SIZE + 5)]
+    for chain in chains:
+        chain.inports['inp'].put(1)
+        args, kwargs = chain.get_run_args()
+        assert chain.run(*args, **kwargs) == {'out': 2}
+    # the links of the least recently used chains were dropped
+    assert list(_chain_links.links) == [chain.chain_id for chain in chains[5:]]
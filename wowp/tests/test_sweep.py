@@ -0,0 +1,108 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from wowp.actors import FuncActor
+from wowp.schedulers import FuturesScheduler, LinearizedScheduler
+from wowp.sweep import read_input_sets, run_sweep
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def setup_module():
+    global tmpdir
+    tmpdir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(tmpdir)
+
+
+def _write(name, text):
+    path = os.path.join(tmpdir, name)
+    with io.open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def add(x, y):
+    return x + y
+
+
+def _make_workflow():
+    return FuncActor(add).get_workflow()
+
+
+def test_read_input_sets():
+    csv_path = _write('inputs.csv', u'x,y\n1,2.5\n"[1, 2]",abc\n')
+    assert list(read_input_sets(csv_path)) == [{'x': 1, 'y': 2.5}, {'x': [1, 2], 'y': 'abc'}]
+    json_path = _write('inputs.jsonl', u'{"x": 1}\n\n{"x": [2]}\n')
+    assert list(read_input_sets(json_path)) == [{'x': 1}, {'x': [2]}]
+
+
+def test_run_sweep():
+    results = {}
+
+    def callback(index, inputs, outputs, error):
+        results[index] = (outputs, error)
+
+    failed = run_sweep(_make_workflow, LinearizedScheduler,
+                       ({'x': i} if i != 3 else {'x': 'a'} for i in range(10)),
+                       callback, concurrency=3, defaults={'y': 1})
+    assert failed == 1
+    assert sorted(results) == list(range(10))
+    assert all(results[i] == ({'out': [i + 1]}, None) for i in range(10) if i != 3)
+    assert isinstance(results[3][1], TypeError)
+
+
+def test_run_sweep_concurrency():
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def slow_add(x, y):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return x + y
+
+    def make_workflow():
+        return FuncActor(slow_add).get_workflow()
+
+    def make_scheduler():
+        return FuturesScheduler('threading', min_engines=4)
+
+    run_sweep(make_workflow, make_scheduler, ({'x': i, 'y': i} for i in range(8)),
+              lambda *result: None, concurrency=4)
+    assert running[1] > 1
+
+
+def test_cli_sweep():
+    workflow = _write('workflow.py', u'from wowp.actors import FuncActor\n\n\n'
+                                     u'def add(x, y):\n    return x + y\n\n'
+                                     u'WORKFLOW = FuncActor(add).get_workflow()\n')
+    inputs = _write('sweep.jsonl', u'{"x": 1}\n{"x": 2}\n')
+    output = os.path.join(tmpdir, 'results.jsonl')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+    for mode in ('--no-tagged', '--tagged'):
+        subprocess.check_call([sys.executable, os.path.join(ROOT, 'scripts', 'wowp'),
+                               '--sweep', inputs, '-a', 'y', '10', '-j', '2', mode,
+                               '-o', output, workflow], env=env)
+        with io.open(output) as f:
+            results = sorted((json.loads(line) for line in f), key=lambda r: r['index'])
+        assert [r['outputs'] for r in results] == [{'out': [11]}, {'out': [12]}]
+    # concurrent MPISchedulers would share the worker ranks
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'scripts', 'wowp'),
+                             '--sweep', inputs, '-s', 'MPIScheduler()', '-j', '2', workflow],
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = proc.communicate()[1]
+    assert proc.returncode != 0
+    assert b'--tagged' in stderr
@@ -0,0 +1,126 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import threading
+import time
+from wowp.actors import FuncActor, Switch, LoopWhile
+from wowp.components import iter_components
+from wowp.schedulers import LinearizedScheduler, ThreadedScheduler, FuturesScheduler
+from wowp.sweep import run_sweep
+from wowp.tags import tagged, new_tag, current_tag
+from nose.tools import assert_raises
+
+_lock = threading.Lock()
+_running = [0, 0]
+
+
+def inc(x):
+    return x + 1
+
+
+def slow_inc(x):
+    with _lock:
+        _running[0] += 1
+        _running[1] = max(_running)
+    time.sleep(0.01)
+    with _lock:
+        _running[0] -= 1
+    return x + 1
+
+
+def small(x):
+    return x < 5
+
+
+def check_positive(x):
+    if x < 0:
+        raise ValueError('negative input')
+    return x
+
+
+def _loop_workflow(func=inc):
+    fa = FuncActor(func, outports=('x', ))
+    lw = LoopWhile('loop', small)
+    fa.inports['x'] += lw.outports['loop']
+    lw.inports['loop'] += fa.outports['x']
+    return lw.get_workflow()
+
+
+def _switch_workflow():
+    # loop with a condition actor inside a switch
+    switch = Switch('switch', small)
+    lw = LoopWhile('loop')
+    cond = FuncActor(small, outports=('out', ))
+    body = FuncActor(inc, outports=('x', ))
+    lw.inports['init'] += switch.outports['true']
+    cond.inports['x'] += lw.outports['condition_in']
+    lw.inports['condition_out'] += cond.outports['out']
+    body.inports['x'] += lw.outports['loop']
+    lw.inports['loop'] += body.outports['x']
+    return switch.get_workflow()
+
+
+def _assert_no_tokens(workflow):
+    for component in iter_components(workflow):
+        assert not set(component.__dict__.get('_tagged_state', {})) - {None}
+        for ports in (component.inports, component.outports):
+            for port in ports:
+                assert all(not buffer for buffer in port.buffers())
+
+
+def test_tagged():
+    assert current_tag() is None
+    tag = new_tag()
+    with tagged(tag):
+        assert current_tag() == tag
+    assert current_tag() is None
+
+
+def test_run_tagged():
+    for scheduler in (LinearizedScheduler(), ThreadedScheduler(max_threads=3),
+                      FuturesScheduler('threading', min_engines=3)):
+        workflow = _loop_workflow()
+        results = scheduler.run_tagged(workflow, [{'init': i} for i in (0, 3, 10, 1)])
+        assert [list(result['exit']) for result in results] == [[5], [5], [10], [5]]
+        _assert_no_tokens(workflow)
+
+        workflow = _switch_workflow()
+        results = scheduler.run_tagged(workflow, [{'inp': i} for i in (1, 7, 2)])
+        assert [list(result['exit']) for result in results] == [[5], [], [5]]
+        assert [list(result['false']) for result in results] == [[], [7], []]
+        _assert_no_tokens(workflow)
+
+
+def test_run_tagged_concurrency():
+    _running[1] = 0
+    workflow = _loop_workflow(slow_inc)
+    scheduler = FuturesScheduler('threading', min_engines=4)
+    results = scheduler.run_tagged(workflow, [{'init': 0}] * 4)
+    assert [list(result['exit']) for result in results] == [[5]] * 4
+    # loop bodies of different invocations run at the same time
+    assert _running[1] > 1
+
+
+def test_run_tagged_failure():
+    workflow = FuncActor(check_positive).get_workflow()
+    scheduler = FuturesScheduler('threading', min_engines=2)
+    assert_raises(ValueError, scheduler.run_tagged, workflow, [{'x': 1}, {'x': -1}])
+    _assert_no_tokens(workflow)
+    results = scheduler.run_tagged(workflow, [{'x': 1}, {'x': 2}])
+    assert [list(result['out']) for result in results] == [[1], [2]]
+
+
+def test_tagged_sweep():
+    results = {}
+
+    def callback(index, inputs, outputs, error):
+        results[index] = (outputs, error)
+
+    def make_scheduler():
+        return FuturesScheduler('threading', min_engines=3)
+
+    failed = run_sweep(lambda: FuncActor(check_positive).get_workflow(), make_scheduler,
+                       ({'x': i if i != 4 else -1} for i in range(7)), callback,
+                       concurrency=3, tagged=True)
+    assert failed == 1
+    assert sorted(results) == list(range(7))
+    assert all(results[i] == ({'out': [i]}, None) for i in range(7) if i != 4)
+    assert isinstance(results[4][1], ValueError)
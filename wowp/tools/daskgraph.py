@@ -0,0 +1,200 @@
+"""Compile acyclic workflows to dask task graphs
+
+The whole graph is given to the dask scheduler, which can see all the
+dependencies and optimise the placement of the tasks. Supported actors are
+FuncActor, Map of FuncActor's and Concat. Cyclic parts, e.g. LoopWhile, can
+stay with wowp schedulers, which run the compiled parts as DaskGraphActor's.
+
+Requires dask (and distributed for running on a cluster).
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import deque
+from functools import partial
+from operator import getitem
+
+from ..components import Actor, Composite, iter_components
+from ..actors import FuncActor
+from ..actors.mapreduce import Map, Concat
+
+__all__ = ["to_dask_graph", "run_dask", "DaskGraphActor"]
+
+
+def _constant(value):
+    return value
+
+
+def _map_items(run, items):
+    """Map run over items in a single task (used when the items are not known
+    when the graph is built)
+    """
+    results = [run(*item) for item in zip(*items)]
+    return {name: [result[name] for result in results] for name in results[0]} if results else {}
+
+
+def _concat(*values):
+    return {'out': tuple(values)}
+
+
+def _funcactor_run(actor):
+    """FuncActor.run with the actor's parameters, the tokens are the arguments
+    """
+    return partial(actor.run,
+                   runfunc=actor.func,
+                   func_args=actor._func_args,
+                   func_kwargs=actor._func_kwargs,
+                   outports=tuple(port.name for port in actor.outports))
+
+
+def _port_key(port):
+    return 'wowp-{}-{}-{}'.format(port.owner.name, port.name, id(port))
+
+
+def _sorted_actors(workflow):
+    """Actors in a topological order, raise ValueError for cycles
+    """
+    actors = [component for component in iter_components(workflow)
+              if not isinstance(component, Composite)]
+    dependencies = {}
+    for actor in actors:
+        dependencies[id(actor)] = {id(other.owner) for port in actor.inports
+                                   for other in port.connections}
+    dependents = {id(actor): [] for actor in actors}
+    for actor in actors:
+        for dependency in dependencies[id(actor)]:
+            dependents[dependency].append(actor)
+    waiting = {id(actor): len(dependencies[id(actor)]) for actor in actors}
+    ready = deque(actor for actor in actors if not waiting[id(actor)])
+    result = []
+    while ready:
+        actor = ready.popleft()
+        result.append(actor)
+        for other in dependents[id(actor)]:
+            waiting[id(other)] -= 1
+            if not waiting[id(other)]:
+                ready.append(other)
+    if len(result) != len(actors):
+        raise ValueError('Cyclic workflows cannot be compiled to dask graphs')
+    return result
+
+
+def to_dask_graph(workflow, inputs):
+    """Translate the workflow into a dask graph
+
+    Args:
+        workflow (Composite): acyclic workflow of FuncActor, Map (of FuncActor) and Concat
+        inputs (dict): values of the workflow input ports
+
+    Returns:
+        tuple: (graph, dict of output port names and keys)
+    """
+    graph = {}
+    input_names = set(port.name for port in workflow.inports)
+    for name in inputs:
+        if name not in input_names:
+            raise ValueError('{} is not an inport name'.format(name))
+
+    def input_key(port):
+        connections = port.connections
+        if len(connections) > 1:
+            raise ValueError('Port {} has multiple connections'.format(port.name))
+        if connections:
+            return _port_key(connections[0])
+        if port.name not in inputs:
+            raise ValueError('Missing input {}'.format(port.name))
+        key = _port_key(port)
+        graph[key] = (partial(_constant, inputs[port.name]), )
+        return key
+
+    for actor in _sorted_actors(workflow):
+        actor_key = 'wowp-{}-{}'.format(actor.name, id(actor))
+        in_keys = [input_key(port) for port in actor.inports]
+        if isinstance(actor, Map):
+            mapped = actor.actor_class(*actor.actor_args, **actor.actor_kwargs)
+            if not isinstance(mapped, FuncActor):
+                raise ValueError('Only Map of FuncActor can be compiled')
+            run = _funcactor_run(mapped)
+            known = [graph[key] for key in in_keys]
+            if all(len(task) == 1 and isinstance(task[0], partial) and task[0].func is _constant
+                   for task in known):
+                # the items are known, each one gets its task
+                items = [task[0].args[0] for task in known]
+                item_keys = []
+                for i, item in enumerate(zip(*items)):
+                    item_key = '{}-{}'.format(actor_key, i)
+                    graph[item_key] = (partial(run, *item), )
+                    item_keys.append(item_key)
+                for port in actor.outports:
+                    graph[_port_key(port)] = (list, [(getitem, item_key, port.name)
+                                                     for item_key in item_keys])
+                continue
+            graph[actor_key] = (partial(_map_items, run), (list, in_keys))
+        elif isinstance(actor, Concat):
+            graph[actor_key] = (_concat, ) + tuple(in_keys)
+        elif isinstance(actor, FuncActor):
+            graph[actor_key] = (_funcactor_run(actor), ) + tuple(in_keys)
+        else:
+            raise ValueError('Actor {} ({}) cannot be compiled to dask'.format(
+                actor.name, actor.__class__.__name__))
+        for port in actor.outports:
+            graph[_port_key(port)] = (getitem, actor_key, port.name)
+
+    outputs = {port.name: _port_key(port) for port in workflow.outports}
+    return graph, outputs
+
+
+def run_dask(workflow, client=None, **inputs):
+    """Run the workflow as a single dask graph
+
+    Args:
+        workflow (Composite): acyclic workflow
+        client (Optional[distributed.Client]): dask client, the dask default
+            scheduler is used if None
+        inputs: values of the workflow input ports
+
+    Returns:
+        dict: output port names and lists of values (like Workflow.__call__)
+    """
+    graph, outputs = to_dask_graph(workflow, inputs)
+    names = list(outputs)
+    keys = [outputs[name] for name in names]
+    if client is None:
+        import dask
+        values = dask.get(graph, keys)
+    else:
+        values = client.get(graph, keys)
+    return {name: [value] for name, value in zip(names, values)}
+
+
+class DaskGraphActor(Actor):
+    """Runs a compiled acyclic workflow as a single dask graph
+
+    Used for the acyclic parts of workflows run by wowp schedulers. The graph
+    is submitted from the scheduler's process, hence this is a system actor.
+
+    Args:
+        workflow (Composite): acyclic workflow
+        client (Optional[distributed.Client]): dask client, the dask default
+            scheduler is used if None
+        name (Optional[str]): actor name
+    """
+
+    _system_actor = True
+
+    def __init__(self, workflow, client=None, name='dask_graph'):
+        super(DaskGraphActor, self).__init__(name=name)
+        self.workflow = workflow
+        self.client = client
+        for port in workflow.inports:
+            self.inports.append(port.name)
+        for port in workflow.outports:
+            self.outports.append(port.name)
+        # fail early for workflows that cannot be compiled
+        _sorted_actors(workflow)
+
+    def get_run_args(self):
+        kwargs = {port.name: port.pop() for port in self.inports}
+        return (), kwargs
+
+    def run(self, *args, **kwargs):
+        result = run_dask(self.workflow, client=self.client, **kwargs)
+        return {name: values[0] for name, values in result.items()}
@@ -16,51 +16,32 @@ def build_graph(actor):
     Empty output ports are red.
     """
     import graphviz
-    actors = []
-    edges = []
-    ports = []
+    from ..components import iter_components, graph_node_name
     graph = graphviz.Digraph()
-
-    def _get_name(obj):
-        return str(hash(obj))
-
-    def _add_node(actor):
-        attrs = {"fontsize": "12"}
-        graph.node(_get_name(actor), label=actor.name, shape="box", **attrs)
-        actors.append(actor)
-
-    def _walk_node(actor):
-        name = _get_name(actor)
-        if not actor in actors:
-            _add_node(actor)
-        for port in actor.outports:
-            if port not in ports:
-                attrs = {}
-                if not port.connections:
-                    attrs["style"] = "filled"
-                    attrs["color"] = "#ff0000"
-                graph.node(_get_name(port), label=port.name, **attrs)
-                graph.edge(name, _get_name(port))
-                ports.append(port)
-            for other in port.connections:
-                if (port, other) not in edges:
-                    edges.append((port, other))
-                    _walk_node(other.owner)
-                    graph.edge(_get_name(port), _get_name(other))
-        for port in actor.inports:
-            if port not in ports:
-                attrs = {}
-                if not port.connections:
-                    attrs["style"] = "filled"
-                    attrs["color"] = "#ffff00"
-                graph.node(_get_name(port), label=port.name, **attrs)
-                graph.edge(_get_name(port), name, )
-                ports.append(port)
+    port_ids = set()
+
+    def _add_port_node(port, terminal_color):
+        if id(port) in port_ids:
+            return
+        port_ids.add(id(port))
+        attrs = {}
+        if not port.connections:
+            attrs["style"] = "filled"
+            attrs["color"] = terminal_color
+        graph.node(graph_node_name(port), label=port.name, **attrs)
+
+    for component in iter_components(actor):
+        name = graph_node_name(component)
+        graph.node(name, label=component.name, shape="box", fontsize="12")
+        for port in component.outports:
+            _add_port_node(port, "#ff0000")
+            graph.edge(name, graph_node_name(port))
             for other in port.connections:
-                if (other, port) not in edges:
-                    _walk_node(other.owner)
+                graph.edge(graph_node_name(port), graph_node_name(other))
+        for port in component.inports:
+            _add_port_node(port, "#ffff00")
+            graph.edge(graph_node_name(port), name)
 
-    _walk_node(actor)
     return graph
 
 